@@ -0,0 +1,69 @@
+import sys
+import json
+import time
+import numpy as np
+import search
+
+"""
+Batch query mode: runs every query of a query log (see search.read_query_log) and writes one JSONL record per query
+    {"query", "results": [{"url", "file", "score"}], "postings_bytes", "cached", "latency_ms"}
+in the order of the log, then prints p50/p95/p99 latency and queries per second.
+Comparing the JSONL of two index builds shows ranking and latency regressions.
+
+BATCH_WORKERS is the number of processes running queries. DEFAULT: 1 (serial)
+"""
+BATCH_WORKERS = 1
+
+# runs one query and returns its record
+def run_query(query):
+    stats = {}
+    start_time = time.perf_counter()
+    results = search.search(query, stats)
+    latency_ms = (time.perf_counter() - start_time) * 1000
+    return {
+        "query": query,
+        "results": [{"url": url, "file": webpage, "score": score} for (url, webpage), score in zip(results, stats["scores"])],
+        "postings_bytes": stats["postings_bytes"],
+        "cached": stats["cached"],
+        "latency_ms": latency_ms,
+    }
+
+# returns the aggregate latency percentiles and throughput of a batch
+def summarize(records, elapsed):
+    latencies = [record["latency_ms"] for record in records]
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (0.0, 0.0, 0.0)
+    return {
+        "queries": len(records),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "qps": len(records) / elapsed if elapsed else 0.0,
+        "postings_bytes": sum(record["postings_bytes"] for record in records),
+    }
+
+def run_batch(query_log, output_file, workers=BATCH_WORKERS):
+    queries = list(search.read_query_log(query_log))
+    start_time = time.perf_counter()
+    with open(output_file, "w", encoding="utf-8") as file:
+        records = []
+        if workers > 1:
+            # forked workers inherit the index search opened on import (see search.process_context)
+            with search.process_context().Pool(workers) as pool:
+                for record in pool.imap(run_query, queries):
+                    file.write(json.dumps(record) + "\n")
+                    records.append(record)
+        else:
+            for query in queries:
+                record = run_query(query)
+                file.write(json.dumps(record) + "\n")
+                records.append(record)
+    summary = summarize(records, time.perf_counter() - start_time)
+    print(f"{summary['queries']} queries in {output_file}: p50 {summary['p50_ms']:.2f} ms, p95 {summary['p95_ms']:.2f} ms, "
+          f"p99 {summary['p99_ms']:.2f} ms, {summary['qps']:.1f} queries/s, {summary['postings_bytes']} postings bytes read")
+    return summary
+
+if __name__ == '__main__':
+    # python3 batch.py [query log, DEFAULT: query_log.txt] [output, DEFAULT: batch_results.jsonl] [workers]
+    run_batch(sys.argv[1] if len(sys.argv) > 1 else "query_log.txt",
+              sys.argv[2] if len(sys.argv) > 2 else "batch_results.jsonl",
+              int(sys.argv[3]) if len(sys.argv) > 3 else BATCH_WORKERS)
@@ -0,0 +1,94 @@
+import os
+import sys
+import json
+import time
+import shutil
+import subprocess
+from corpus_generator import generate_corpus, SEED
+
+"""
+End-to-end benchmark: for each size in CORPUS_SIZES, generates a synthetic corpus (see corpus_generator.py)
+and times create_inverted_indexes, merge_partial_indexes and search.search over the corpus's queries,
+along with the per-stage metrics of each (see metrics.py).
+Every size runs in its own process and folder, since the indexer keeps its state in module globals.
+Results are saved as JSON to compare runs and plot how each stage scales with corpus size.
+Run: python3 bench_engine.py [output, DEFAULT: bench_results/engine_<time>.json] [sizes, e.g. 1000,4000]
+"""
+CORPUS_SIZES = [1000, 4000, 16000]
+WORK_FOLDER = "bench_corpus"
+
+SOURCE_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+# runs inside folder (the child process): index, merge and search, returns the timings
+def run_stages(folder):
+    os.chdir(folder)
+    sys.path.insert(0, SOURCE_FOLDER)
+    import indexer
+    import merger
+    import metrics
+
+    start_time = time.perf_counter()
+    indexer.create_inverted_indexes("DEV")
+    index_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    merger.merge_partial_indexes()
+    merge_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    import search
+    import batch
+    load_seconds = time.perf_counter() - start_time
+    # repeated queries of the log would be answered by the result cache, time every query on the index
+    search.result_cache.max_entries = 0
+    search_summary = batch.run_batch("queries.txt", "query_results.jsonl")
+    index_segments, _, total_docs, _ = search.index_state
+
+    return {
+        "documents": total_docs,
+        "index_seconds": index_seconds,
+        "merge_seconds": merge_seconds,
+        "search_load_seconds": load_seconds,
+        "search": search_summary,
+        "index_bytes": os.path.getsize("final_index.bin"),
+        "dictionary_bytes": os.path.getsize("term_dictionary.bin"),
+        "text_bytes": os.path.getsize("texts.bin"),
+        "terms": len(index_segments[0].term_dictionary),
+        "metrics": metrics.report(),
+    }
+
+def run(output_file, sizes=CORPUS_SIZES, seed=SEED):
+    results = {"seed": seed, "started": time.strftime("%Y-%m-%d %H:%M:%S"), "runs": []}
+    for size in sizes:
+        folder = os.path.abspath(os.path.join(WORK_FOLDER, str(size)))
+        shutil.rmtree(folder, ignore_errors=True)
+        os.makedirs(folder)
+        start_time = time.perf_counter()
+        generate_corpus(folder, size, seed)
+        generate_seconds = time.perf_counter() - start_time
+
+        # the stages print progress, the child writes its timings to a file instead of stdout
+        subprocess.run([sys.executable, os.path.abspath(__file__), "stages", folder], check=True, stdout=subprocess.DEVNULL)
+        with open(os.path.join(folder, "stages.json"), "r", encoding="utf-8") as file:
+            run_result = {"pages": size, "generate_seconds": generate_seconds, **json.load(file)}
+        results["runs"].append(run_result)
+        print(f"{size:>6} pages: index {run_result['index_seconds']:7.2f} s  merge {run_result['merge_seconds']:7.2f} s  "
+              f"search p50 {run_result['search']['p50_ms']:6.2f} ms  p99 {run_result['search']['p99_ms']:6.2f} ms  "
+              f"{run_result['search']['qps']:8.1f} qps")
+        shutil.rmtree(folder, ignore_errors=True)
+    shutil.rmtree(WORK_FOLDER, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    with open(output_file, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=1)
+    print(f"Results saved to {output_file}")
+    return results
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == "stages":
+        stages = run_stages(sys.argv[2])
+        with open("stages.json", "w", encoding="utf-8") as file:
+            json.dump(stages, file)
+    else:
+        run(sys.argv[1] if len(sys.argv) > 1 else os.path.join("bench_results", time.strftime("engine_%Y%m%d_%H%M%S.json")),
+            [int(size) for size in sys.argv[2].split(",")] if len(sys.argv) > 2 else CORPUS_SIZES)
@@ -0,0 +1,80 @@
+import sys
+import time
+import json
+import socket
+import asyncio
+import subprocess
+from urllib.parse import quote
+import numpy as np
+from search import read_query_log
+
+"""
+Load generator for server.py: starts the server with each worker count in WORKER_COUNTS, sends REQUESTS
+queries from the query log over CONCURRENCY keep-alive connections and reports throughput and latency.
+The server runs without its result cache, a log of a few dozen queries repeated REQUESTS times would only measure cache hits.
+Run: python3 bench_server.py [threads|processes] [query log, DEFAULT: query_log.txt]
+"""
+PORT = 8090
+WORKER_COUNTS = [1, 2, 4, 8]
+CONCURRENCY = 16
+REQUESTS = 2000
+
+# sends queries one after the other on one connection, appends each round trip time in ms to latencies
+async def client(queries, latencies, errors):
+    reader, writer = await asyncio.open_connection("127.0.0.1", PORT)
+    for query in queries:
+        start_time = time.perf_counter()
+        writer.write(f"GET /search?q={quote(query)} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode("latin-1"))
+        status = int((await reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+        await reader.readexactly(length)
+        latencies.append((time.perf_counter() - start_time) * 1000)
+        if status != 200:
+            errors.append(status)
+    writer.close()
+
+async def load(queries, concurrency, requests):
+    schedule = [queries[i % len(queries)] for i in range(requests)]
+    latencies = []
+    errors = []
+    start_time = time.perf_counter()
+    await asyncio.gather(*(client(schedule[i::concurrency], latencies, errors) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start_time
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {"requests": requests, "errors": len(errors), "qps": requests / elapsed, "p50_ms": p50, "p95_ms": p95, "p99_ms": p99}
+
+def wait_for_port(process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline and process.poll() is None:
+        try:
+            socket.create_connection(("127.0.0.1", PORT), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+def run(mode="threads", query_log="query_log.txt"):
+    queries = list(read_query_log(query_log))
+    results = []
+    for workers in WORKER_COUNTS:
+        server = subprocess.Popen([sys.executable, "server.py", str(PORT), str(workers), mode, "quiet", "nocache"], stdout=subprocess.DEVNULL)
+        try:
+            wait_for_port(server)
+            asyncio.run(load(queries, CONCURRENCY, len(queries))) # warm up the postings cache
+            result = {"workers": workers, "mode": mode, **asyncio.run(load(queries, CONCURRENCY, REQUESTS))}
+        finally:
+            server.terminate()
+            server.wait()
+        results.append(result)
+        print(f"{workers:>2} {mode}: {result['qps']:8.1f} qps  p50 {result['p50_ms']:6.2f} ms  p95 {result['p95_ms']:6.2f} ms  p99 {result['p99_ms']:6.2f} ms  errors {result['errors']}")
+    return results
+
+if __name__ == '__main__':
+    print(json.dumps(run(*sys.argv[1:3]), indent=1))
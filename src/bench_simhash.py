@@ -0,0 +1,70 @@
+import random
+import time
+from simhash_index import SimhashIndex
+
+"""
+Benchmark of near-duplicate detection: linear scan over every Simhash (the old is_unique_page)
+against SimhashIndex. Both must make the same accept/reject decision for every page.
+Run: python3 bench_simhash.py
+"""
+HAMMING_DISTANCE = 4
+PAGE_COUNTS = [1000, 2500, 5000, 10000]
+NEAR_DUPLICATE_RATE = 0.1 # fraction of pages that are a few bit flips away from an earlier page
+
+# random 64-bit fingerprints, some of them copies of an earlier one with 0-6 bits flipped
+def generate_hashes(count, seed=121):
+    rng = random.Random(seed)
+    hashes = []
+    for _ in range(count):
+        if hashes and rng.random() < NEAR_DUPLICATE_RATE:
+            current_hash = rng.choice(hashes)
+            for bit in rng.sample(range(64), rng.randint(0, 6)):
+                current_hash ^= 1 << bit
+        else:
+            current_hash = rng.getrandbits(64)
+        hashes.append(current_hash)
+    return hashes
+
+def linear_scan(hashes):
+    simhash_set = set()
+    decisions = []
+    for current_hash in hashes:
+        unique = True
+        for old_hash in simhash_set:
+            if bin(current_hash ^ old_hash).count('1') <= HAMMING_DISTANCE:
+                unique = False
+                break
+        if unique:
+            simhash_set.add(current_hash)
+        decisions.append(unique)
+    return decisions
+
+def banded_index(hashes):
+    simhash_index = SimhashIndex(HAMMING_DISTANCE)
+    decisions = []
+    for current_hash in hashes:
+        unique = not simhash_index.has_near(current_hash)
+        if unique:
+            simhash_index.add(current_hash)
+        decisions.append(unique)
+    return decisions
+
+def run():
+    for count in PAGE_COUNTS:
+        hashes = generate_hashes(count)
+
+        start_time = time.perf_counter()
+        scan_decisions = linear_scan(hashes)
+        scan_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        index_decisions = banded_index(hashes)
+        index_time = time.perf_counter() - start_time
+
+        assert scan_decisions == index_decisions, "SimhashIndex disagrees with the linear scan"
+        rejected = scan_decisions.count(False)
+        print(f"{count} pages ({rejected} rejected): scan {scan_time * 1000:.1f} ms, "
+              f"index {index_time * 1000:.1f} ms, {scan_time / index_time:.0f}x faster")
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,92 @@
+import glob
+import json
+import re
+import time
+from nltk.stem import PorterStemmer
+from extractor import extract_fields, FIELD_WEIGHTS
+from tokenizer import Tokenizer
+from indexer import count_word_weights, computeWordFrequencies, normalize_frequencies
+
+"""
+Microbenchmark of tokenizing pages: the original tokenize (new PorterStemmer per call, n-gram lists)
+against Tokenizer.iter_tokens streaming into count_word_weights. Both must give the same term frequencies.
+Run: python3 bench_tokenizer.py [folder of json pages, DEFAULT: TEST]
+"""
+ROUNDS = 5
+
+# the tokenize function before Tokenizer, kept for comparison
+def tokenize_baseline(text, weight=1):
+    synonym_map = {
+        "crista": "cristina",
+        "cs": "compsci"
+    }
+    tokens = re.findall(r'[a-zA-Z0-9]+', text.lower())
+    stemmer = PorterStemmer()
+    tokens_stemmed = []
+    unique_tokens = set()
+    for token in tokens:
+        token = synonym_map.get(token, token)
+        if len(token) > 2 and not (token.isdigit() and len(token) > 5):
+            tokens_stemmed.append((stemmer.stem(token), weight))
+            unique_tokens.add(token)
+    if len(tokens) == 0 or len(unique_tokens)/len(tokens) < 0.05:
+        return []
+    bigram_weight = 1.25
+    trigram_weight = 1.5
+    bigrams = [(f"{tokens_stemmed[i][0]}_{tokens_stemmed[i+1][0]}",
+                ((tokens_stemmed[i][1] + tokens_stemmed[i+1][1]) / 2) * bigram_weight)
+                for i in range(len(tokens_stemmed) - 1)]
+    trigrams = [(f"{tokens_stemmed[i][0]}_{tokens_stemmed[i+1][0]}_{tokens_stemmed[i+2][0]}",
+                ((tokens_stemmed[i][1] + tokens_stemmed[i+1][1] + tokens_stemmed[i+2][1]) / 2) * trigram_weight)
+                for i in range(len(tokens_stemmed) - 2)]
+    return tokens_stemmed + bigrams + trigrams
+
+def baseline_frequencies(fields):
+    tokens = []
+    for field, texts in fields.items():
+        for text in texts:
+            tokens += tokenize_baseline(text, weight=FIELD_WEIGHTS[field])
+    return computeWordFrequencies(tokens), len(tokens)
+
+def engine_frequencies(tokenizer, fields):
+    word_weights = {}
+    for field, texts in fields.items():
+        for text in texts:
+            count_word_weights(tokenizer.iter_tokens(text, weight=FIELD_WEIGHTS[field]), word_weights)
+    return normalize_frequencies(word_weights)
+
+def run(folder="TEST"):
+    pages = []
+    for path in glob.glob(f"{folder}/*/*.json"):
+        with open(path, "r", encoding="utf-8") as file:
+            fields = extract_fields(json.load(file)["content"])
+        if fields is not None:
+            pages.append(fields)
+
+    tokenizer = Tokenizer()
+    token_count = 0
+    for fields in pages:
+        frequencies, count = baseline_frequencies(fields)
+        assert frequencies == engine_frequencies(tokenizer, fields), "Tokenizer disagrees with the original tokenize"
+        token_count += count
+
+    start_time = time.perf_counter()
+    for _ in range(ROUNDS):
+        for fields in pages:
+            baseline_frequencies(fields)
+    baseline_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    for _ in range(ROUNDS):
+        for fields in pages:
+            engine_frequencies(tokenizer, fields)
+    engine_time = time.perf_counter() - start_time
+
+    tokens = token_count * ROUNDS
+    print(f"{len(pages)} pages, {token_count} tokens per round")
+    print(f"original tokenize: {tokens / baseline_time:,.0f} tokens/sec")
+    print(f"Tokenizer:         {tokens / engine_time:,.0f} tokens/sec ({baseline_time / engine_time:.1f}x)")
+
+if __name__ == '__main__':
+    import sys
+    run(*sys.argv[1:])
@@ -0,0 +1,44 @@
+import os
+import sys
+import json
+import subprocess
+import pytest
+
+"""
+Fixtures shared by the tests that build a small index, run with: python -m pytest
+"""
+SRC_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+# runs python code in folder in a new process, the indexer keeps document ids and Simhashes in module globals
+def run_in(folder, code):
+    env = dict(os.environ, PYTHONPATH=SRC_FOLDER + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    subprocess.run([sys.executable, "-c", code], cwd=folder, env=env, check=True, stdout=subprocess.DEVNULL)
+
+# writes pages, a list of (url, html), as a .jsonl bundle in folder
+def write_pages(folder, pages, name="pages.jsonl"):
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, name), "w", encoding="utf-8") as file:
+        for url, html in pages:
+            file.write(json.dumps({"url": url, "content": html, "encoding": "utf-8"}) + "\n")
+    return name
+
+# builds the index of corpus (a path relative to folder) in folder, then the shards when shards > 1
+@pytest.fixture(scope="session")
+def build_index():
+    def build(folder, corpus, workers=1, shards=1):
+        code = f"import indexer, merger; indexer.create_inverted_indexes({corpus!r}, {workers}); merger.merge_partial_indexes()"
+        if shards > 1:
+            code += f"; merger.merge_partial_indexes(shards={shards})"
+        run_in(folder, code)
+        return folder
+    return build
+
+# search on the index in a folder: opens it by moving to the folder, search reloads when the files it watches change
+@pytest.fixture
+def open_index(monkeypatch):
+    import search
+    def open_folder(folder):
+        monkeypatch.chdir(folder)
+        search.refresh_segments()
+        return search
+    return open_folder
@@ -0,0 +1,124 @@
+import os
+import zipfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+Corpus readers: the pages of the corpus as entries that can be read in any order and in any process
+    DirectoryCorpus   DEV/<domain>/<page>.json files, the extracted developer.zip
+    ZipCorpus         developer.zip itself, read without extracting it
+    JsonlCorpus       a bundle with one page {"url", "content", "encoding"} per line
+Every reader has entries() (a list of picklable entries in corpus order), name(entry) (the page's file name, kept
+in documents.bin), domain(entry) (the page's domain folder, None if the layout has none), size(entry) (bytes)
+and read(entry) (the page's raw json bytes).
+
+PREFETCH_THREADS is the number of threads reading pages ahead of the parser. DEFAULT: 4
+PREFETCH_PAGES is the number of pages read ahead, it bounds the memory of pages waiting to be parsed. DEFAULT: 64
+"""
+PREFETCH_THREADS = 4
+PREFETCH_PAGES = 64
+
+class DirectoryCorpus:
+    def __init__(self, folder):
+        self.folder = folder
+
+    # entries are file paths
+    def entries(self):
+        # in the folder, there is one folder per domain
+        # each JSON file in folder/{domain} coresponds to one web page
+        webpage_paths = []
+        for domain in os.listdir(self.folder):
+            for webpage in os.listdir(os.path.join(self.folder, domain)):
+                webpage_paths.append(os.path.join(self.folder, domain, webpage))
+        return webpage_paths
+
+    def name(self, entry):
+        return os.path.basename(entry)
+
+    def domain(self, entry):
+        return os.path.basename(os.path.dirname(entry))
+
+    def size(self, entry):
+        return os.path.getsize(entry)
+
+    def read(self, entry):
+        with open(entry, "rb") as file:
+            return file.read()
+
+class ZipCorpus:
+    def __init__(self, path):
+        self.path = path
+        self.archive = zipfile.ZipFile(path) # reads from several threads are serialized on the archive's file
+
+    # entries are member names of the .json pages, in archive order
+    def entries(self):
+        return [info.filename for info in self.archive.infolist() if not info.is_dir() and info.filename.endswith(".json")]
+
+    def name(self, entry):
+        return os.path.basename(entry)
+
+    def domain(self, entry):
+        return os.path.basename(os.path.dirname(entry)) or None
+
+    def size(self, entry):
+        return self.archive.getinfo(entry).file_size
+
+    def read(self, entry):
+        return self.archive.read(entry)
+
+class JsonlCorpus:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.lock = threading.Lock() # prefetch threads share the file position
+
+    # entries are (byte offset, length) of the lines
+    def entries(self):
+        lines = []
+        with self.lock:
+            self.file.seek(0)
+            offset = 0
+            for line in self.file:
+                if line.strip():
+                    lines.append((offset, len(line)))
+                offset += len(line)
+        return lines
+
+    # bundled pages have no file of their own, they are named after the bundle and their offset in it
+    def name(self, entry):
+        return f"{os.path.basename(self.path)}:{entry[0]}"
+
+    def domain(self, entry):
+        return None
+
+    def size(self, entry):
+        return entry[1]
+
+    def read(self, entry):
+        offset, length = entry
+        with self.lock:
+            self.file.seek(offset)
+            return self.file.read(length)
+
+# returns the reader for a corpus path: a folder, a .zip archive or a .jsonl bundle
+def open_corpus(path):
+    if os.path.isdir(path):
+        return DirectoryCorpus(path)
+    if zipfile.is_zipfile(path):
+        return ZipCorpus(path)
+    return JsonlCorpus(path)
+
+# yields function(item) for every item in order, while threads run function on up to depth items ahead
+def prefetch(function, items, threads=PREFETCH_THREADS, depth=PREFETCH_PAGES):
+    if threads < 1:
+        yield from map(function, items)
+        return
+    with ThreadPoolExecutor(threads) as executor:
+        pending = deque()
+        for item in items:
+            if len(pending) >= depth:
+                yield pending.popleft().result()
+            pending.append(executor.submit(function, item))
+        while pending:
+            yield pending.popleft().result()
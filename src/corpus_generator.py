@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import random
+import hashlib
+from collections import deque
+
+"""
+Seeded synthetic corpus in the layout of developer.zip: DEV/<domain>/<sha256 of url>.json with "url", "content" and "encoding"
+Pages are HTML with a title, navigation anchors, headings, bold text, paragraphs and a script block.
+Words follow a Zipfian distribution over VOCABULARY_SIZE words, the most frequent of them are COMMON_WORDS
+so the queries of TEST.txt find pages. A share of pages are near-duplicates of an earlier page with a few words changed.
+The same seed and page count always give the same corpus.
+Run: python3 corpus_generator.py <output folder> <page count> [seed]
+"""
+SEED = 121
+VOCABULARY_SIZE = 50000
+ZIPF_EXPONENT = 1.07
+NEAR_DUPLICATE_RATE = 0.05 # share of pages copied from an earlier page
+NEAR_DUPLICATE_EDITS = 3 # words replaced in a near-duplicate
+NEAR_DUPLICATE_WINDOW = 1000 # near-duplicates copy one of this many latest pages
+QUERY_COUNT = 200 # queries written to queries.txt next to the corpus
+
+COMMON_WORDS = ["ics", "uci", "computer", "science", "research", "student", "faculty", "program", "project", "software",
+                "engineering", "information", "data", "machine", "learning", "course", "graduate", "undergraduate",
+                "honors", "events", "workshop", "alumni", "internship", "vision", "artificial", "intelligence",
+                "business", "management", "hackathon", "acm", "wics", "history", "gene", "dataset", "master", "fall"]
+DOMAINS = ["www_ics_uci_edu", "cs_ics_uci_edu", "informatics_uci_edu", "stat_uci_edu", "wics_ics_uci_edu",
+           "vision_ics_uci_edu", "hombao_ics_uci_edu", "aiclub_ics_uci_edu"]
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "te", "vi", "zo", "bar", "den", "fil", "gor", "hum", "jet", "kin",
+             "lum", "mor", "nex", "pol", "quin", "ros", "sil", "tor", "ven", "wex", "yal", "zen"]
+
+# COMMON_WORDS followed by made-up words, most frequent first
+def make_vocabulary(rng, size):
+    vocabulary = list(COMMON_WORDS)
+    seen = set(vocabulary)
+    while len(vocabulary) < size:
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            vocabulary.append(word)
+    return vocabulary
+
+class PageWriter:
+    def __init__(self, seed, vocabulary_size=VOCABULARY_SIZE):
+        self.rng = random.Random(seed)
+        self.vocabulary = make_vocabulary(self.rng, vocabulary_size)
+        weights = [1 / rank ** ZIPF_EXPONENT for rank in range(1, vocabulary_size + 1)]
+        self.cum_weights = []
+        total = 0
+        for weight in weights:
+            total += weight
+            self.cum_weights.append(total)
+
+    def words(self, count):
+        return " ".join(self.rng.choices(self.vocabulary, cum_weights=self.cum_weights, k=count))
+
+    def paragraph(self):
+        text = self.words(self.rng.randint(30, 120))
+        bold = self.words(self.rng.randint(1, 3))
+        return f"<p>{text} <b>{bold}</b> {self.words(self.rng.randint(5, 40))}</p>"
+
+    def html(self, domain):
+        host = domain.replace("_", ".")
+        anchors = "".join(f'<li><a href="https://{host}/{self.words(1)}.html">{self.words(self.rng.randint(1, 3))}</a></li>'
+                          for _ in range(self.rng.randint(2, 8)))
+        sections = "".join(f"<h2>{self.words(self.rng.randint(2, 5))}</h2>" + "".join(self.paragraph() for _ in range(self.rng.randint(1, 4)))
+                           for _ in range(self.rng.randint(1, 4)))
+        return (f"<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>{self.words(self.rng.randint(2, 6))}</title>"
+                f"<script>var page = {self.rng.randint(0, 10 ** 6)};</script></head>\n"
+                f"<body><nav><ul>{anchors}</ul></nav>\n<h1>{self.words(self.rng.randint(2, 5))}</h1>\n{sections}\n"
+                f"<footer><a href=\"https://{host}/\">{self.words(2)}</a></footer></body></html>")
+
+    # a copy of html with a few words replaced
+    def near_duplicate(self, html):
+        parts = html.split(" ")
+        for _ in range(NEAR_DUPLICATE_EDITS):
+            position = self.rng.randrange(len(parts))
+            if "<" not in parts[position] and ">" not in parts[position]:
+                parts[position] = self.words(1)
+        return " ".join(parts)
+
+# writes page_count pages under folder/DEV and QUERY_COUNT queries to folder/queries.txt, returns the DEV path
+def generate_corpus(folder, page_count, seed=SEED):
+    writer = PageWriter(seed)
+    dev = os.path.join(folder, "DEV")
+    pages = deque(maxlen=NEAR_DUPLICATE_WINDOW)
+    for page_number in range(page_count):
+        domain = writer.rng.choice(DOMAINS)
+        if pages and writer.rng.random() < NEAR_DUPLICATE_RATE:
+            domain, original = writer.rng.choice(pages)
+            html = writer.near_duplicate(original)
+        else:
+            html = writer.html(domain)
+        pages.append((domain, html))
+        url = f"https://{domain.replace('_', '.')}/{writer.words(1)}/page{page_number}.html"
+        os.makedirs(os.path.join(dev, domain), exist_ok=True)
+        with open(os.path.join(dev, domain, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json"), "w", encoding="utf-8") as file:
+            json.dump({"url": url, "content": html, "encoding": "utf-8"}, file)
+
+    # queries of 1 to 3 words drawn like the words of the pages
+    with open(os.path.join(folder, "queries.txt"), "w", encoding="utf-8") as file:
+        for _ in range(QUERY_COUNT):
+            file.write(writer.words(writer.rng.randint(1, 3)) + "\n")
+    return dev
+
+if __name__ == '__main__':
+    generate_corpus(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]) if len(sys.argv) > 3 else SEED)
@@ -0,0 +1,68 @@
+import mmap
+import struct
+import numpy as np
+
+"""
+Document table (documents.bin), maps a document id to its url and json file
+
+    header      : first document id, number of id slots, number of documents, size of the string blob   (DOC_HEADER)
+    offsets     : uint64 per slot boundary, slot i's url is blob[offsets[2i]:offsets[2i + 1]]
+                  and its json file is blob[offsets[2i + 1]:offsets[2i + 2]]
+    blob        : every url and json file name (utf-8), in document id order
+
+Slots run from the first document id to the last one, ids that are not in the table have an empty url.
+A lookup reads two strings straight from the memory map, nothing is loaded at startup.
+"""
+DOC_HEADER = struct.Struct("<IIIQ")
+
+# documents maps document_id -> (url, json file)
+def write_document_store(path, documents):
+    first_document_id = min(documents, default=0)
+    slot_count = max(documents, default=-1) + 1 - first_document_id
+    blob = bytearray()
+    offsets = np.zeros(2 * slot_count + 1, dtype="<u8")
+    for slot in range(slot_count):
+        url, webpage = documents.get(first_document_id + slot, ("", ""))
+        blob += url.encode("utf-8")
+        offsets[2 * slot + 1] = len(blob)
+        blob += webpage.encode("utf-8")
+        offsets[2 * slot + 2] = len(blob)
+    with open(path, "wb") as file:
+        file.write(DOC_HEADER.pack(first_document_id, slot_count, len(documents), len(blob)))
+        file.write(offsets.tobytes())
+        file.write(blob)
+
+# returns the number of documents in a document table without opening the whole file
+def read_total_docs(path):
+    with open(path, "rb") as file:
+        _, _, document_count, _ = DOC_HEADER.unpack(file.read(DOC_HEADER.size))
+    return document_count
+
+# read-only view of a document table through mmap
+class DocumentStore:
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.first_document_id, self.slot_count, self.document_count, _ = DOC_HEADER.unpack_from(self.map, 0)
+        self.offsets = np.frombuffer(self.map, dtype="<u8", count=2 * self.slot_count + 1, offset=DOC_HEADER.size)
+        self.blob_start = DOC_HEADER.size + self.offsets.nbytes
+
+    def __len__(self):
+        return self.document_count
+
+    # returns (url, json file) of a document, or None if the table does not have it
+    def get(self, document_id):
+        slot = document_id - self.first_document_id
+        if not 0 <= slot < self.slot_count:
+            return None
+        url_start, url_end, webpage_end = (self.blob_start + int(offset) for offset in self.offsets[2 * slot:2 * slot + 3])
+        if url_start == url_end:
+            return None
+        return self.map[url_start:url_end].decode("utf-8"), self.map[url_end:webpage_end].decode("utf-8")
+
+    # yields (document_id, url, json file) of every document in id order
+    def items(self):
+        for slot in range(self.slot_count):
+            document = self.get(self.first_document_id + slot)
+            if document is not None:
+                yield self.first_document_id + slot, *document
@@ -0,0 +1,94 @@
+from lxml import etree, html
+
+"""
+FIELD_WEIGHTS are the token weights for each bucket of text on a page (adjusted while tuning, see TEST.txt)
+"""
+FIELD_WEIGHTS = {
+    "anchor": 5, # anchor words describe the page they link to
+    "title": 5,
+    "heading": 3, # h1, h2, h3
+    "bold": 2, # b, strong
+    "body": 1, # all text on the page
+}
+
+FIELD_TAGS = {
+    "a": "anchor",
+    "title": "title",
+    "h1": "heading",
+    "h2": "heading",
+    "h3": "heading",
+    "b": "bold",
+    "strong": "bold",
+}
+
+# text inside these tags is never shown on the page
+SKIPPED_TAGS = {"script", "style"}
+
+# content from the json files is a str, so parse its utf-8 encoding instead of letting lxml guess
+UTF8_PARSER = html.HTMLParser(encoding="utf-8")
+
+# parses content once and collects the text of every field in a single walk over the tree
+# returns {field: [text of each element]}, or None if the HTML is broken or has no text
+def extract_fields(content):
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    if not content.strip():
+        return None
+
+    try:
+        tree = html.fromstring(content, parser=UTF8_PARSER)
+    except Exception as e:
+        print(f"Error parsing HTML: {e}")
+        return None
+
+    fields = {field: [] for field in FIELD_WEIGHTS}
+    body = []
+    open_fields = [] # (field, text parts) of the field elements the walk is currently inside
+    skipping = 0 # depth of script/style elements the walk is inside
+    first_title = None
+
+    for event, element in etree.iterwalk(tree, events=("start", "end", "comment", "pi")):
+        # comments and processing instructions have no text of their own, only the text after them
+        if event in ("comment", "pi"):
+            if not skipping and element.tail:
+                add_text(element.tail, body, open_fields)
+            continue
+        tag = element.tag if isinstance(element.tag, str) else None
+        field = FIELD_TAGS.get(tag)
+        # only anchors with a target url and the first title count
+        if field == "anchor" and element.get("href") is None:
+            field = None
+        elif field == "title":
+            if first_title is None:
+                first_title = element
+            if element is not first_title:
+                field = None
+
+        if event == "start":
+            if tag in SKIPPED_TAGS:
+                skipping += 1
+            if field is not None:
+                open_fields.append((field, []))
+            if tag is not None and not skipping and element.text:
+                add_text(element.text, body, open_fields)
+        else:
+            if field is not None:
+                field, parts = open_fields.pop()
+                fields[field].append("".join(parts).strip())
+            if tag in SKIPPED_TAGS:
+                skipping -= 1
+            # the tail is the text after the element, inside its parent
+            if not skipping and element.tail:
+                add_text(element.tail, body, open_fields)
+
+    body_text = "".join(body)
+    if not body_text.strip():
+        return None
+    fields["body"].append(body_text)
+    return fields
+
+# text belongs to the page body and to every field element it is nested in
+def add_text(text, body, open_fields):
+    body.append(text)
+    for _, parts in open_fields:
+        parts.append(text)
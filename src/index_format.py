@@ -0,0 +1,183 @@
+import struct
+import numpy as np
+
+"""
+Binary postings format for final_index.bin
+
+Every term's postings are written as one record, sorted by document id:
+    header      : df, number of blocks    (TERM_HEADER)
+    directory   : per block, last document id, end of its doc bytes and its highest document weight  (BLOCK_ENTRY)
+    doc ids     : delta encoded varints (delta from the previous posting)
+    tf          : uint16 per posting, tf * TF_SCALE
+    positions   : uint32 per block, end of the block's position bytes, then per block
+                  the varint number of positions of each posting followed by every posting's
+                  word positions as varints, delta encoded within the posting
+
+Blocks hold BLOCK_SIZE postings, so block i's tfs sit at a fixed position and
+its doc ids and positions can be decoded on their own starting from block i-1's last document id.
+The highest document weight of each block bounds the score of any document in it, so top-k search can skip blocks.
+
+No score is stored: search weights documents from the tf, and idf from the df and N of the live segments at query time.
+Document weights are cosine normalized log tf weights: (1 + log tf) / norm, where a document's norm
+is the length of its vector of (1 + log tf) over all of its terms. Norms are written to doc_norms.bin:
+    header      : first document id   (NORM_HEADER)
+    norms       : float32 per document id from the first one on (0 for ids that are not in the index)
+"""
+BLOCK_SIZE = 128 # postings per block
+
+TF_SCALE = 100 # tf is 0-100 (see computeWordFrequencies), stored with 2 decimals
+MIN_TF = 1 / TF_SCALE # keeps tiny frequencies off log(0)
+
+TERM_HEADER = struct.Struct("<II")
+BLOCK_ENTRY = struct.Struct("<IIf")
+BLOCK_ENTRY_DTYPE = np.dtype([("last_document_id", "<u4"), ("doc_bytes_end", "<u4"), ("max_weight", "<f4")])
+NORM_HEADER = struct.Struct("<I")
+
+EMPTY_POSTINGS = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+
+# appends the varint encoding of a non-negative integer to out
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+# decodes every varint in buf at once, returns a numpy array of the values
+def decode_varints(buf):
+    data = np.frombuffer(buf, dtype=np.uint8)
+    if len(data) == 0:
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.empty(len(ends), dtype=np.int64)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    # position of each byte inside its varint gives the shift of its 7 bits
+    shifts = np.arange(len(data), dtype=np.int64) - np.repeat(starts, ends - starts + 1)
+    payload = (data & 0x7F).astype(np.int64) << (7 * shifts)
+    return np.add.reduceat(payload, starts)
+
+# log tf weight of a term in a document, before cosine normalization
+def log_tf_weights(tfs):
+    return 1 + np.log(np.maximum(tfs, MIN_TF))
+
+# postings is a list of (document_id, tf) sorted by document_id
+# weights are the postings' normalized document weights, only their maximum per block is stored
+# positions is the sorted list of word positions of each posting
+# returns the bytes of the term's record
+def encode_postings(postings, weights, positions):
+    df = len(postings)
+    tfs = np.array([round(tf * TF_SCALE) for _, tf in postings], dtype="<u2")
+
+    doc_bytes = bytearray()
+    directory = []
+    previous_id = 0
+    for i, (document_id, _) in enumerate(postings):
+        write_varint(doc_bytes, document_id - previous_id)
+        previous_id = document_id
+        # close the block after every BLOCK_SIZE postings and after the last posting
+        if (i + 1) % BLOCK_SIZE == 0 or i + 1 == df:
+            block_start = i - i % BLOCK_SIZE
+            directory.append((document_id, len(doc_bytes), max(weights[block_start:i + 1])))
+
+    position_bytes = bytearray()
+    position_ends = []
+    for block_start in range(0, df, BLOCK_SIZE):
+        block_positions = positions[block_start:block_start + BLOCK_SIZE]
+        for posting_positions in block_positions:
+            write_varint(position_bytes, len(posting_positions))
+        for posting_positions in block_positions:
+            previous_position = 0
+            for position in posting_positions:
+                write_varint(position_bytes, position - previous_position)
+                previous_position = position
+        position_ends.append(len(position_bytes))
+
+    record = bytearray(TERM_HEADER.pack(df, len(directory)))
+    for entry in directory:
+        record += BLOCK_ENTRY.pack(*entry)
+    record += doc_bytes
+    record += tfs.tobytes()
+    record += np.array(position_ends, dtype="<u4").tobytes()
+    record += position_bytes
+    return bytes(record)
+
+# decodes the record that starts at offset in buf (bytes or mmap)
+# returns (document_ids, tfs) numpy arrays sorted by document_id
+def decode_postings(buf, offset):
+    df, block_count = TERM_HEADER.unpack_from(buf, offset)
+    if df == 0:
+        return EMPTY_POSTINGS
+    position = offset + TERM_HEADER.size
+    _, doc_bytes_len, _ = BLOCK_ENTRY.unpack_from(buf, position + (block_count - 1) * BLOCK_ENTRY.size)
+    position += block_count * BLOCK_ENTRY.size
+
+    document_ids = np.cumsum(decode_varints(buf[position:position + doc_bytes_len]))
+    position += doc_bytes_len
+    tfs = np.frombuffer(buf, dtype="<u2", count=df, offset=position).astype(np.float32) / TF_SCALE
+    return document_ids, tfs
+
+# reads a record's header and block directory without decoding postings
+# returns (df, directory) where directory is a BLOCK_ENTRY_DTYPE array with one entry per block
+def read_directory(buf, offset):
+    df, block_count = TERM_HEADER.unpack_from(buf, offset)
+    directory = np.frombuffer(buf, dtype=BLOCK_ENTRY_DTYPE, count=block_count, offset=offset + TERM_HEADER.size)
+    return df, directory
+
+# decodes only block number block of the record at offset, directory comes from read_directory
+# returns (document_ids, tfs) numpy arrays of the block
+def decode_block(buf, offset, df, directory, block):
+    doc_start = offset + TERM_HEADER.size + len(directory) * BLOCK_ENTRY.size
+    first_byte = int(directory["doc_bytes_end"][block - 1]) if block else 0
+    last_byte = int(directory["doc_bytes_end"][block])
+    base_id = int(directory["last_document_id"][block - 1]) if block else 0
+    document_ids = base_id + np.cumsum(decode_varints(buf[doc_start + first_byte:doc_start + last_byte]))
+
+    count = min(BLOCK_SIZE, df - block * BLOCK_SIZE)
+    tf_start = doc_start + int(directory["doc_bytes_end"][-1]) + 2 * block * BLOCK_SIZE
+    tfs = np.frombuffer(buf, dtype="<u2", count=count, offset=tf_start).astype(np.float32) / TF_SCALE
+    return document_ids, tfs
+
+# decodes the word positions of block number block of the record at offset, directory comes from read_directory
+# returns (starts, positions): posting j's positions are positions[starts[j]:starts[j + 1]] - (positions[starts[j] - 1] if starts[j] else 0)
+def decode_block_positions(buf, offset, df, directory, block):
+    position_ends_start = offset + TERM_HEADER.size + len(directory) * BLOCK_ENTRY.size + int(directory["doc_bytes_end"][-1]) + 2 * df
+    position_ends = np.frombuffer(buf, dtype="<u4", count=len(directory), offset=position_ends_start)
+    position_start = position_ends_start + 4 * len(directory)
+    first_byte = int(position_ends[block - 1]) if block else 0
+    values = decode_varints(buf[position_start + first_byte:position_start + int(position_ends[block])])
+
+    count = min(BLOCK_SIZE, df - block * BLOCK_SIZE)
+    starts = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(values[:count], out=starts[1:])
+    return starts, np.cumsum(values[count:])
+
+# positions of posting j of a block decoded by decode_block_positions
+def posting_positions(starts, positions, j):
+    start, end = starts[j], starts[j + 1]
+    return positions[start:end] - positions[start - 1] if start else positions[start:end]
+
+# decodes the word positions of every posting of the record at offset, returns a list of numpy arrays
+def decode_positions(buf, offset):
+    df, directory = read_directory(buf, offset)
+    positions = []
+    for block in range(len(directory)):
+        starts, block_positions = decode_block_positions(buf, offset, df, directory, block)
+        positions += [posting_positions(starts, block_positions, j) for j in range(len(starts) - 1)]
+    return positions
+
+# norms maps document_id -> norm, see log_tf_weights
+def write_doc_norms(path, norms):
+    first_document_id = min(norms, default=0)
+    array = np.zeros(max(norms, default=-1) + 1 - first_document_id, dtype="<f4")
+    for document_id, norm in norms.items():
+        array[document_id - first_document_id] = norm
+    with open(path, "wb") as file:
+        file.write(NORM_HEADER.pack(first_document_id))
+        file.write(array.tobytes())
+
+# returns (first document id, float32 array of norms)
+def read_doc_norms(path):
+    with open(path, "rb") as file:
+        data = file.read()
+    first_document_id, = NORM_HEADER.unpack_from(data, 0)
+    return first_document_id, np.frombuffer(data, dtype="<f4", offset=NORM_HEADER.size)
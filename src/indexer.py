@@ -1,25 +1,48 @@
 import os
+import sys
 import json 
 import re
-from bs4 import BeautifulSoup
-from nltk.stem import PorterStemmer
+from array import array
+from tokenizer import Tokenizer
 from simhash import Simhash
+from simhash_index import SimhashIndex
 from urllib.parse import urlparse, urlsplit, urlunsplit
 import shutil
-from lxml import html
-
-inverted_index = {} # global variable of inverted index - key: token -> list of postings
+import multiprocessing
+import numpy as np
+from index_format import log_tf_weights, write_doc_norms
+from document_store import write_document_store
+from text_store import TextStoreWriter
+from extractor import extract_fields, FIELD_WEIGHTS
+from corpus import DirectoryCorpus, open_corpus, prefetch
+import metrics
+
+inverted_index = {} # global variable of inverted index - key: token -> TermPostings
+inverted_index_bytes = 0 # bytes held by inverted_index, see TermPostings
 index_counter = 1 # current number of index being built
+partial_prefix = "" # set by parallel workers so the partial indexes of different runs get different names
 
 doc_id_map = {}  # document_name (URL) -> (document_id, link to json file)
 doc_id_counter = 0  # counter to assign IDs
+doc_norms = {} # document_id -> norm of the document's log tf weights
+
+"""
+INDEX_MEMORY_BYTES is the memory budget of the in-memory postings, a partial index is dumped when they reach it.
+With WORKERS > 1 every worker building a partial index gets an equal share. DEFAULT: 512 MB
+"""
+INDEX_MEMORY_BYTES = 512 * 1024 * 1024
 
-simhash_set = set() # unique Simhashes for detecting duplicates/near duplicates
+"""
+WORKERS is the number of processes used by create_inverted_indexes. DEFAULT: 1 (serial)
+BATCH_SIZE is the number of webpages each worker parses per task when WORKERS > 1
+"""
+WORKERS = 1
+BATCH_SIZE = 256
 
 """
-MAX_DOCS MUST CHANGE BASED ON DEV (~10000) OR TEST (2)
+TERM_SAMPLE_INTERVAL is how many terms of a partial index are between two entries of its sample file
 """
-MAX_DOCS = 8000 # number of documents until it is time to dump
+TERM_SAMPLE_INTERVAL = 1024
 
 """
 HAMMING_DISTANCE can be modifed by dev for likeness between pages. DEFAULT: 2
@@ -31,6 +54,16 @@ MAX_FILE_SIZE helps prevent indexing large json files, likely to have little val
 """
 MAX_FILE_SIZE = 1000 * 1024  # 1000KB in bytes
 
+simhash_index = SimhashIndex(HAMMING_DISTANCE) # unique Simhashes for detecting duplicates/near duplicates
+
+"""
+extract_text is the extraction stage: content (HTML) -> {field: [texts]}, or None to skip the page.
+Swap it for another extractor with the same signature to change how pages are read. DEFAULT: extractor.extract_fields
+"""
+extract_text = extract_fields
+
+tokenizer = Tokenizer() # shared by the indexer and search, reuses one stemmer and its stem cache
+
 # # download nltk data for tokenization
 # nltk.download('punkt')
 
@@ -70,266 +103,448 @@ def is_valid(url):
         print ("TypeError for ", parsed)
         raise
 
-# returns True if tokens of said page belong to a unique Simhash
-def is_unique_page(tokens):
-    current_hash = Simhash(tokens).value
-    for old_hash in simhash_set: # Validates current hash against every hash already encountered
-        if bin(current_hash ^ old_hash).count('1') <= HAMMING_DISTANCE:  # Lower hamming_distance = docs must be closer to identical
+# returns True if the {token: summed weight} features of said page belong to a unique Simhash
+def is_unique_page(features):
+    with metrics.timer("indexer.simhash"):
+        current_hash = page_simhash(features)
+    return is_unique_hash(current_hash)
+
+# the simhash package multiplies uint8 bit arrays by the weights, so integer weights above 255 would overflow
+def page_simhash(features):
+    return Simhash({token: float(weight) for token, weight in features.items()}).value
+
+# returns True if current_hash is not within HAMMING_DISTANCE of an encountered Simhash
+# only hashes sharing a block with current_hash are compared (see simhash_index.py)
+def is_unique_hash(current_hash):
+    with metrics.timer("indexer.simhash_check"):
+        if simhash_index.has_near(current_hash):  # Lower hamming_distance = docs must be closer to identical
+            metrics.increment("indexer.duplicates")
             return False
-    simhash_set.add(current_hash)
+        simhash_index.add(current_hash)
     return True
     
 
-# modified tokenize from Part A
+# modified tokenize from Part A, see tokenizer.Tokenizer
+# returns a list of (stemmed token, weight) for unigrams, bigrams and trigrams
 def tokenize(text, weight=1):
-    synonym_map = {
-        "crista": "cristina",
-        "cs": "compsci"
-    }
-
-    # use regular expression to tokenize alphanumeric words in text
-    tokens = re.findall(r'[a-zA-Z0-9]+', text.lower())
-
-    # use Porter stemming for better textual matches
-    stemmer = PorterStemmer()
-    tokens_stemmed = []     # unigrams
-    unique_tokens = set()
-    for token in tokens:
-        # Normalize using synonym map
-        token = synonym_map.get(token, token)
-        # only add tokens that are more than 2 characters
-        # do not include numbers > 5 digits
-        if len(token) > 2 and not (token.isdigit() and len(token) > 5):
-            tokens_stemmed.append((stemmer.stem(token), weight))
-            unique_tokens.add(token)
-    # if there is too much replication, ignore
-    if len(tokens) == 0 or len(unique_tokens)/len(tokens) < 0.05:
-        return []
-
-    # weigh trigram matches higher than bigrams, bigrams than unigrams 
-    bigram_weight = 1.25
-    trigram_weight = 1.5
-
-    # add 2-grams
-    # grabs stemmed word from current and next token, average individual words' weights for bigram's weight
-    bigrams = [(f"{tokens_stemmed[i][0]}_{tokens_stemmed[i+1][0]}", 
-                ((tokens_stemmed[i][1] + tokens_stemmed[i+1][1]) / 2) * bigram_weight)
-                for i in range(len(tokens_stemmed) - 1)]
-
-    # add 3-grams
-    trigrams = [(f"{tokens_stemmed[i][0]}_{tokens_stemmed[i+1][0]}_{tokens_stemmed[i+2][0]}", 
-                ((tokens_stemmed[i][1] + tokens_stemmed[i+1][1] + tokens_stemmed[i+2][1]) / 2) * trigram_weight)
-                for i in range(len(tokens_stemmed) - 2)]
-    
-    return tokens_stemmed + bigrams + trigrams
+    return tokenizer.tokenize(text, weight)
     
 # computeWordFrequencies from Part A
 # Important text: adds default weight 1 and any extra weight for appearing in title (+2), headings(+1), or as bold/strong (+1)
 def computeWordFrequencies(tokens):
-    word_frequencies = {}
+    return normalize_frequencies(count_word_weights(tokens))
 
-    #iterate through every token/weight in tokens list
+# sums the weights of every token, tokens can be any iterable of (token, weight) such as Tokenizer.iter_tokens
+# adds to word_frequencies when given so several texts can be counted without building token lists
+def count_word_weights(tokens, word_frequencies=None):
+    if word_frequencies is None:
+        word_frequencies = {}
+
+    #iterate through every token/weight in tokens
     for token, weight in tokens:
         # word_frequencies.get(token, 0) checks if token exists, using 0 as default frequency if it doesn't exist
         # increment frequency if token exists, otherwise set it to its weight
         word_frequencies[token] = word_frequencies.get(token, 0) + weight
+    return word_frequencies
 
+# scales summed token weights to term frequencies in the range 0-100
+def normalize_frequencies(word_weights):
     # Find the maximum frequency in the word_frequencies
-    max_freq = max(word_frequencies.values(), default=1)
-
-    # normalize and scale to the range 0-100
-    for token in word_frequencies:
-        # Normalize by dividing by max frequency, then scale to 0-100
-        word_frequencies[token] = round((word_frequencies[token] / max_freq) * 100, 3)
-    return word_frequencies
+    max_freq = max(word_weights.values(), default=1)
+
+    # Normalize by dividing by max frequency, then scale to 0-100
+    return {token: round((weight / max_freq) * 100, 3) for token, weight in word_weights.items()}
+
+# postings of one term in typed arrays: int32 document ids, float32 tfs (only TF is stored during indexing)
+# and the int32 word positions of every posting one after another, with how many each posting has
+class TermPostings:
+    __slots__ = ("document_ids", "tfs", "position_counts", "positions")
+
+    def __init__(self):
+        self.document_ids = array("i")
+        self.tfs = array("f")
+        self.position_counts = array("i")
+        self.positions = array("i")
+
+    # [[document_id, tf, [positions]], ...] as written to a partial index
+    def to_lists(self):
+        # float32 tfs are rounded back to the 3 decimals of normalize_frequencies
+        tfs = np.round(np.frombuffer(self.tfs, dtype=np.float32).astype(np.float64), 3).tolist()
+        postings = []
+        start = 0
+        for document_id, tf, count in zip(self.document_ids, tfs, self.position_counts):
+            postings.append([document_id, tf, self.positions[start:start + count].tolist()])
+            start += count
+        return postings
+
+# bytes of an empty TermPostings and its slot in inverted_index, the arrays' items are counted as they are added
+TERM_BYTES = sys.getsizeof(TermPostings()) + 4 * sys.getsizeof(array("i")) + 100
+POSTING_BYTES = 4 + 4 + 4 # document id, tf and position count
+POSITION_BYTES = 4
+
+# bytes a page's postings add to inverted_index, not counting new terms
+def page_bytes(term_freq, term_positions):
+    return POSTING_BYTES * len(term_freq) + POSITION_BYTES * sum(len(positions) for positions in term_positions.values())
 
 # add posting to inverted_index
 # posting contains document name/id token was found in and its tf-idf score
-def posting(document_id, term_freq):
-    global inverted_index
+# term_positions maps each token to the word positions it has in the page body
+def posting(document_id, term_freq, term_positions):
+    with metrics.timer("indexer.posting_insert"):
+        add_postings(document_id, term_freq, term_positions)
+    metrics.increment("indexer.postings", len(term_freq))
+
+def add_postings(document_id, term_freq, term_positions):
+    global inverted_index, inverted_index_bytes
+    added_bytes = page_bytes(term_freq, term_positions)
     # iterate through each token
     for token, frequency in term_freq.items():
-        # if the token is not in inverted_index dict, add token as key and map to empty list
-        # list will later be populated with webpages including token
-        if token not in inverted_index:
-            inverted_index[token] = []
-    
-        
-        # posting : document name/id token was found in and its tf-idf score
-        posting = {
-            "document_id": document_id,
-            "tf": frequency # only store TF during initial indexing phase
-        }
-
-        # print(posting)
-
-        # add posting to inverted_index under the token it was found in
-        inverted_index[token].append(posting)
-            
-
-# dev is the developer folder
-def create_inverted_indexes(dev):
+        term_postings = inverted_index.get(token)
+        if term_postings is None:
+            term_postings = inverted_index[token] = TermPostings()
+            added_bytes += TERM_BYTES + sys.getsizeof(token)
+
+        # phrase queries match on positions instead of n-gram terms
+        positions = term_positions.get(token, ())
+        term_postings.document_ids.append(document_id)
+        term_postings.tfs.append(frequency)
+        term_postings.position_counts.append(len(positions))
+        term_postings.positions.extend(positions)
+    inverted_index_bytes += added_bytes
+
+# reads, filters and tokenizes one json file of the corpus, see parse_page
+def parse_webpage(webpage_path):
+    return parse_page(*read_webpage(DirectoryCorpus(os.path.dirname(webpage_path)), webpage_path))
+
+# reads and decodes one page of a corpus (see corpus.py), safe to run on prefetch threads
+# returns (webpage, content) with content None if the page should be skipped
+def read_webpage(corpus, entry):
+    webpage = corpus.name(entry)
+
+    # Check file size
+    if corpus.size(entry) > MAX_FILE_SIZE:
+        print(f"Skipping {webpage} due to file size > 1000KB")
+        return webpage, None
+
+    # read the json file and load the contents
+    try:
+        with metrics.timer("indexer.file_read"):
+            raw_content = corpus.read(entry)
+        with metrics.timer("indexer.json_decode"):
+            content = json.loads(raw_content.decode("utf-8"))
+    except FileNotFoundError:
+        print(f'Json File not found for {webpage}.')
+        return webpage, None
+    except IOError:
+        print(f'Json File input/output error. {webpage}')
+        return webpage, None
+    return webpage, content
+
+# yields read_webpage(corpus, entry) for every entry, read ahead on prefetch threads
+# prints each domain when its first page reaches the parser, pages of a domain are next to each other in the corpus
+def read_pages(corpus, entries):
+    domain = None
+    for entry, page in zip(entries, prefetch(lambda entry: read_webpage(corpus, entry), entries)):
+        if corpus.domain(entry) != domain:
+            domain = corpus.domain(entry)
+            if domain is not None:
+                print(f'Indexing domain:{domain}')
+        yield page
+
+# filters and tokenizes one decoded page
+# returns (document_name, {token: summed weight}, {token: [word positions]}, {token or n-gram: summed weight}, (title, text))
+# or None if the page should be skipped, the last dict is what the page's Simhash is computed from
+# and the title and text (whitespace collapsed) are what texts.bin keeps for snippets
+def parse_page(webpage, content):
+    if content is None:
+        return None
+
+    # posting - document_name is the url in the json file
+    document_name = page_url(content)
+
+    # skip page if path extension contains invalid url
+    if not is_valid(document_name):
+        #error_log(f"{document_name} contains an invalid extension", "bad_ext_log")
+        return None
+
+    # parse the HTML once and collect title, heading, bold, anchor and body text
+    with metrics.timer("indexer.html_parse"):
+        fields = extract_text(content['content'])
+
+    # deal with broken or missing HTML
+    # skip document if there's no valid parsed HTML or no meaningful text content
+    if fields is None:
+        print(f"Skipping {webpage} due to missing or broken HTML")
+        return None
+
+    # add weights to "important text" (weights are in extractor.FIELD_WEIGHTS)
+    # anchor words get a large weight because they describe the target url
+    # only words are indexed, phrases are matched on word positions at query time
+    word_weights = {}
+    term_positions = {}
+    ngram_weights = {}
+    with metrics.timer("indexer.tokenize"):
+        for field, texts in fields.items():
+            weight = FIELD_WEIGHTS[field]
+            for text in texts:
+                stems = tokenizer.stems(text)
+                count_word_weights(((stem, weight) for stem in stems), word_weights)
+                count_word_weights(tokenizer.ngrams(stems, weight), ngram_weights)
+                # the body holds all of the page's text in order, the other fields repeat parts of it
+                if field == "body":
+                    for position, stem in enumerate(stems):
+                        term_positions.setdefault(stem, []).append(position)
+    metrics.increment("indexer.pages_parsed")
+
+    page_text = (" ".join(" ".join(fields["title"]).split()), " ".join(fields["body"][0].split()))
+    return document_name, word_weights, term_positions, {**word_weights, **ngram_weights}, page_text
+
+# the url a page is indexed under, the url in its json file without the fragment
+def page_url(content):
+    parts = urlsplit(content['url'])
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, parts.query, ''))
+
+# dev is the developer folder, developer.zip or a .jsonl bundle of pages (see corpus.py)
+# workers > 1 spreads parsing and tokenizing over a process pool (see create_inverted_indexes_parallel)
+def create_inverted_indexes(dev, workers=WORKERS):
+    if workers > 1:
+        create_inverted_indexes_parallel(dev, workers)
+        return
 
-    # in dev, there is one folder per domain
-    # corpus is the list of domains in developer folder
-    corpus = os.listdir(dev)
     doc_count = 0
 
     # variables for testing
     detected_dups = 0
-    detected_bad_extensions = 0
 
     # delete partial_indexes folder before running to reset
     # delete_dir("partial_indexes")
 
-    for domain in corpus:
-        print(f'Indexing domain:{domain}')
-        # json_files for each domain are in folder dev/{domain}
-        json_files = '{}/{}'.format(dev, domain)
-
-        # each JSON file coresponds to one web page
-        for webpage in os.listdir(json_files):
-
-            #print(f'Processing webpage:{webpage}')
-            # webpage_path is dev/{domain}/{webpage}
-            webpage_path = os.path.join(json_files, webpage)
-
-            # Check file size
-            if os.path.getsize(webpage_path) > MAX_FILE_SIZE:
-                print(f"Skipping {webpage} due to file size > 1000KB")
-                continue
+    # pages are read and decoded on prefetch threads while the main thread parses
+    corpus = open_corpus(dev)
+    texts = TextStoreWriter("texts.bin")
+    for webpage, content in read_pages(corpus, corpus.entries()):
+        # a url already indexed (pages differing only by #fragment) keeps its first page, its id has postings
+        if content is not None and page_url(content) in doc_id_map:
+            detected_dups += 1
+            continue
+        page = parse_page(webpage, content)
+        if page is None:
+            continue
+        document_name, word_weights, term_positions, simhash_features, page_text = page
+
+        # determine uniqueness of page by comparing current Simhash against existing Simhashes
+        if not is_unique_page(simhash_features):
+            #error_log(f"{document_name} is a duplicate", "dup_log")
+            detected_dups += 1
+            continue
+
+        # if no valid tokens, move on
+        if not word_weights:
+            print(f"Skipping {webpage} due to no valid tokens")
+            continue
+
+        term_freq = normalize_frequencies(word_weights)
+
+        # create posting for webpage and add to inverted_index
+        document_id = get_document_id(document_name, webpage) # do this here to avoid adding dupes to doc_id_map
+        doc_norms[document_id] = document_norm(term_freq)
+        posting(document_id, term_freq, term_positions)
+        texts.add(document_id, *page_text)
+
+        # dump once the postings fill the memory budget
+        doc_count += 1
+        if inverted_index_bytes >= INDEX_MEMORY_BYTES:
+            dump_inverted_index()
         
-            # open the json file and load the contents
-            try:
-                with open(webpage_path, 'r', encoding = 'utf-8') as file:
-                    #print('Loading content of the json file')
-                    content = json.load(file)
-                    file.close()
-            except FileNotFoundError:
-                print(f'Json File not found for {webpage}.')
-            except IOError:
-                print(f'Json File input/output error. {webpage}')
-
-            # posting - document_name is the url in the json file
-            document_name = content['url']
-
-            parts = urlsplit(document_name)
-            document_name = urlunsplit((parts.scheme, parts.netloc, parts.path, parts.query, ''))
-
-            # posting - term frequency score
-            
-            # skip page if path extension contains invalid url
-            if not is_valid(document_name):
-                #error_log(f"{document_name} contains an invalid extension", "bad_ext_log")
-                detected_bad_extensions += 1
-                continue
-
-            try: 
-                # parse through content of json file and tokenize text
-                soup = BeautifulSoup(content['content'], 'lxml')
-
-                # deal with broken or missing HTML
-                # skip document if there's no valid parsed HTML or no meaningful text content
-                if not soup or not soup.get_text(strip=True):
-                    print(f"Skipping {webpage} due to missing or broken HTML")
-                    continue
-            except Exception as e:
-                print(f"Error parsing HTML for {webpage}: {e}")
-                continue
-
-            tokens = []
-
-            # index on anchor words
-
-            # transform content to bytes
-            content_bytes = content["content"]
-
-            if content_bytes.strip():
-                if isinstance(content_bytes, str):
-                    content_bytes = content_bytes.encode("utf-8")
+    # final dump for remaining memory
+    if inverted_index:
+        dump_inverted_index()
 
-                try:
-                    tree = html.fromstring(content_bytes)
-                except Exception as e:
-                    print(f"Error parsing HTML for {webpage} aka {document_name}: {e}")
+    texts.close()
+    dump_doc_id_map()
+
+# Parallel indexing in three phases, producing the same documents.bin and postings as the serial run:
+#   1. workers parse and tokenize batches of pages, spooling each page's term frequencies and positions to disk
+#      and returning only its url, Simhash, norm, postings bytes and whether it had tokens
+#   2. the main process replays duplicate detection and document id assignment in serial order
+#   3. workers read their spools back and each writes the partial index for a run of documents whose postings
+#      fit the worker's share of INDEX_MEMORY_BYTES, while the main process writes texts.bin from the text spools
+def create_inverted_indexes_parallel(dev, workers):
+    entries = open_corpus(dev).entries()
+    batches = [(dev, entries[i:i + BATCH_SIZE]) for i in range(0, len(entries), BATCH_SIZE)]
+
+    os.makedirs("partial_indexes", exist_ok=True)
+    with multiprocessing.Pool(workers) as pool:
+        # phase 1 - parse pages in parallel, imap keeps the results in corpus order
+        scanned = pool.imap(scan_batch, enumerate(batches))
+
+        # phase 2 - same uniqueness and id decisions as create_inverted_indexes, in the same order
+        batch_ids = []
+        for records, worker_metrics in scanned:
+            metrics.merge(worker_metrics)
+            document_ids = []
+            for document_name, webpage, current_hash, norm, postings_bytes, has_tokens in records:
+                # checked in the same order as create_inverted_indexes: url, then Simhash
+                if document_name in doc_id_map or not is_unique_hash(current_hash) or not has_tokens:
+                    document_ids.append(None)
+                else:
+                    document_id = get_document_id(document_name, webpage)
+                    doc_norms[document_id] = norm
+                    document_ids.append((document_id, postings_bytes))
+            batch_ids.append(document_ids)
+
+        # phase 3 - split the accepted documents into runs whose postings fit a worker's share of the budget,
+        # one partial index per run (more if its new terms push a worker over, see build_partial_index)
+        memory_bytes = INDEX_MEMORY_BYTES // workers
+        runs = []
+        current_run = []
+        run_bytes = 0
+        for batch_number, document_ids in enumerate(batch_ids):
+            for position, document in enumerate(document_ids):
+                if document is None:
                     continue
-
-                # retrieve all the anchor words in a list anchor_text
-                for anchor in tree.xpath("//a[@href]"):
-                    anchor_text = anchor.text_content().strip().lower()
-
-                    # turn anchor words into tokens and give a large weight because it contains target url
-                    tokens += tokenize(anchor_text, weight=5)
-
-            # add weights to "important text" (actual weights can be adjusted later)
-            # text in titles - additional weight of 2
-            if soup.title: # soup.title directly accesses HTML document's <title> tag
-                tokens += tokenize(soup.title.get_text(), weight=5) # testing adjustment to 5
-
-            # text in headings - additional weight of 1
-            for tag in ['h1', 'h2', 'h3']:
-                for element in soup.find_all(tag):
-                    tokens += tokenize(element.get_text(), weight=3) # testing adjustment to 3
-
-            # text in bold/strong - additional weight of 1
-            for tag in ['b', 'strong']: 
-                for element in soup.find_all(tag):
-                    tokens += tokenize(element.get_text(), weight=2) # testing adjustment to 2
-
-            # regular text - default weight of 1
-            tokens += tokenize(soup.get_text(), weight=1)
-
-            # determine uniqueness of page by comparing current Simhash against existing Simhashes
-            if not is_unique_page(tokens):
-                #error_log(f"{document_name} is a duplicate", "dup_log")
-                detected_dups += 1
-                continue
-
-            # if no valid tokens, move on
-            if tokens == []:
-                print(f"Skipping {webpage} due to no valid tokens")
+                document_id, postings_bytes = document
+                current_run.append((batch_number, position, document_id))
+                run_bytes += postings_bytes
+                if run_bytes >= memory_bytes:
+                    runs.append(current_run)
+                    current_run = []
+                    run_bytes = 0
+        if current_run:
+            runs.append(current_run)
+
+        partial_indexes = pool.map_async(build_partial_index, [(i + 1, run, memory_bytes) for i, run in enumerate(runs)])
+        write_texts(runs)
+        for worker_metrics in partial_indexes.get():
+            metrics.merge(worker_metrics)
+
+    for batch_number in range(len(batches)):
+        os.remove(spool_path(batch_number))
+        os.remove(text_spool_path(batch_number))
+
+    dump_doc_id_map()
+
+# path of the term frequency spool for a batch of webpages
+def spool_path(batch_number):
+    return f"partial_indexes/spool_{batch_number}.jsonl"
+
+# path of the page text spool for a batch of webpages, one [title, text] line per line of its term frequency spool
+def text_spool_path(batch_number):
+    return f"partial_indexes/text_spool_{batch_number}.jsonl"
+
+# writes texts.bin for the accepted documents of the runs of create_inverted_indexes_parallel, in id order
+def write_texts(runs):
+    spools = {}
+    with TextStoreWriter("texts.bin") as texts:
+        for run in runs:
+            for batch_number, position, document_id in run:
+                if batch_number not in spools:
+                    with open(text_spool_path(batch_number), "r", encoding="utf-8") as spool:
+                        spools = {batch_number: spool.readlines()}
+                texts.add(document_id, *json.loads(spools[batch_number][position]))
+
+# worker for phase 1 of create_inverted_indexes_parallel
+# writes one line of [term frequencies, term positions] per parsed page, and its [title, text] to the text spool
+# and returns (document_name, webpage, simhash, norm, postings bytes, has_tokens) per line
+# along with the worker's metrics
+def scan_batch(batch):
+    batch_number, (dev, entries) = batch
+    corpus = worker_corpus(dev)
+    records = []
+    with open(spool_path(batch_number), "w", encoding="utf-8") as spool, open(text_spool_path(batch_number), "w", encoding="utf-8") as text_spool:
+        for webpage, content in read_pages(corpus, entries):
+            page = parse_page(webpage, content)
+            if page is None:
                 continue
+            document_name, word_weights, term_positions, simhash_features, page_text = page
+            term_freq = normalize_frequencies(word_weights)
+            spool.write(json.dumps([term_freq, term_positions]) + "\n")
+            text_spool.write(json.dumps(page_text) + "\n")
+            with metrics.timer("indexer.simhash"):
+                current_hash = page_simhash(simhash_features)
+            records.append((document_name, webpage, current_hash, document_norm(term_freq),
+                            page_bytes(term_freq, term_positions), bool(word_weights)))
+    return records, metrics.snapshot()
+
+# the corpus reader of a worker process, opened once per process
+# a forked worker must not share the parent's archive or bundle file, since reads move its file position
+worker_corpora = {}
+def worker_corpus(dev):
+    key = (os.getpid(), dev)
+    if key not in worker_corpora:
+        worker_corpora[key] = open_corpus(dev)
+    return worker_corpora[key]
+
+# worker for phase 3 of create_inverted_indexes_parallel
+# run is a list of (batch_number, line in the batch's spool, document_id) for accepted documents
+# its partial indexes are partial_index_<run number>_<n>, returns the worker's metrics
+def build_partial_index(task):
+    global inverted_index, inverted_index_bytes, index_counter, partial_prefix
+    run_number, run, memory_bytes = task
+    inverted_index = {}
+    inverted_index_bytes = 0
+    index_counter = 1
+    partial_prefix = f"{run_number}_"
+
+    spools = {}
+    for batch_number, position, document_id in run:
+        if batch_number not in spools:
+            with open(spool_path(batch_number), "r", encoding="utf-8") as spool:
+                spools = {batch_number: spool.readlines()} # runs move through batches in order
+        posting(document_id, *json.loads(spools[batch_number][position]))
+        if inverted_index_bytes >= memory_bytes:
+            dump_inverted_index()
 
-            term_freq = computeWordFrequencies(tokens)
-
-            # create posting for webpage and add to inverted_index
-            document_id = get_document_id(document_name, webpage) # do this here to avoid adding dupes to doc_id_map
-            posting(document_id, term_freq)
-
-            # DUMP EVERY MAX_DOCS DOCS
-            doc_count += 1
-            if doc_count % MAX_DOCS == 0:
-                dump_inverted_index()
-        
-    # final dump for remaining memory
     if inverted_index:
         dump_inverted_index()
+    return metrics.snapshot()
 
-    # dump mapping
-    with open("doc_id_mapping.json", "w", encoding="utf-8") as file:
-        json.dump(doc_id_map, file, indent=1)
-
-
-# save index to json file
+# save index to a sorted run of terms
 def dump_inverted_index():
-    global inverted_index, index_counter
+    with metrics.timer("indexer.dump"):
+        write_inverted_index()
+    metrics.increment("indexer.dumps")
+    metrics.observe("indexer.dump_bytes", inverted_index_bytes)
+
+def write_inverted_index():
+    global inverted_index, inverted_index_bytes, index_counter
 
     # make a folder called "indexes" if it doesn't exist
     index_folder = "partial_indexes"
     os.makedirs(index_folder, exist_ok=True)
 
     # name file based on which index it is current on
-    output_file = f"partial_indexes/partial_index_{index_counter}.json"
-    with open(output_file, "w", encoding="utf-8") as file:
-        # sort alphabetically
-        json.dump(dict(sorted(inverted_index.items())), file, indent=1)
+    # one JSON line per term, sorted alphabetically, so the merger can stream it: [term, [[document_id, tf, [positions]], ...]]
+    # every TERM_SAMPLE_INTERVAL-th term and its byte offset go to a sample file the merger uses to split the term space
+    output_file = f"partial_indexes/partial_index_{partial_prefix}{index_counter}.jsonl"
+    term_samples = []
+    with open(output_file, "wb") as file:
+        for i, token in enumerate(sorted(inverted_index)):
+            if i % TERM_SAMPLE_INTERVAL == 0:
+                term_samples.append([token, file.tell()])
+            file.write(json.dumps([token, inverted_index[token].to_lists()]).encode("utf-8") + b"\n")
+
+    with open(f"partial_indexes/partial_index_{partial_prefix}{index_counter}.samples.json", "w", encoding="utf-8") as file:
+        json.dump(term_samples, file)
 
     # clear memory and increment counter
     inverted_index = {}
+    inverted_index_bytes = 0
     index_counter += 1
 
 
 
+# dump mapping (as a document table, see document_store.py) and document norms
+def dump_doc_id_map():
+    metrics.increment("indexer.documents", len(doc_id_map))
+    write_document_store("documents.bin", {document_id: (document_name, webpage) for document_name, (document_id, webpage) in doc_id_map.items()})
+    write_doc_norms("doc_norms.bin", doc_norms)
+
+# length of a document's vector of log tf weights, used for cosine normalization (see index_format.py)
+# it only depends on the document's own term frequencies, so it is known before the merger runs
+def document_norm(term_freq):
+    return float(np.linalg.norm(log_tf_weights(np.fromiter(term_freq.values(), dtype=np.float64))))
+
 def get_document_id(document_name, webpage):
     global doc_id_counter, doc_id_map
     if document_name not in doc_id_map:
@@ -344,5 +559,7 @@ def error_log(msg, path):
 
 if __name__ == '__main__':
 
-    # # the DEV folder - extract developer.zip inside the src folder
-    create_inverted_indexes('DEV')
+    # the DEV folder (developer.zip extracted inside the src folder), or developer.zip or a .jsonl bundle as is
+    # python3 indexer.py [corpus, DEFAULT: DEV]
+    create_inverted_indexes(sys.argv[1] if len(sys.argv) > 1 else 'DEV')
+    metrics.write_report("indexer_metrics.json")
@@ -1,149 +1,249 @@
 import json
 import os
+import sys
 import heapq
-import math
-
-# Sorts small chunks of a large file and writes them back to disk in JSON Lines format
-def chunk_sort_and_save(file_path, chunk_size=10000):
-    temp_files = []
-    with open(file_path, "r", encoding="utf-8") as f:
-        # print(file_path)
-        index_data = json.load(f)
-        terms = list(index_data.items())
-        
-        for i in range(0, len(terms), chunk_size):
-            chunk = sorted(terms[i:i + chunk_size])  # Sort only a small chunk
-            temp_file = f"{file_path}_chunk_{i}.json"
-            with open(temp_file, "w", encoding="utf-8") as out_f:
-                for term, postings in chunk:
-                    json.dump({term: postings}, out_f)
-                    out_f.write("\n")  # Each term is now on a separate line
-            temp_files.append(temp_file)
-    return temp_files  # Return paths to sorted chunks
-
-# Yields terms and postings from a JSON Lines file without loading full file into memory.
-def stream_json_terms(file_path):
-
-    with open(file_path, "r", encoding="utf-8") as f:
+import bisect
+import struct
+import shutil
+import time
+import uuid
+import multiprocessing
+from itertools import groupby
+import numpy as np
+from index_format import encode_postings, log_tf_weights, read_doc_norms, write_doc_norms, TF_SCALE
+from term_dictionary import write_term_dictionary
+from document_store import DocumentStore, read_total_docs, write_document_store
+from wildcard import build_kgram_index
+import segments
+import metrics
+
+"""
+MERGE_WORKERS is the number of processes merging ranges of the term space. DEFAULT: 1 (serial)
+SHARD_COUNT > 1 writes the index as that many shards of consecutive document ids under SHARDS_FOLDER
+instead of one index in src/, searched by shards.py. DEFAULT: 1 (no shards)
+KGRAM_INDEX builds the k-gram index of the term dictionary for wildcards without a prefix (see wildcard.py). DEFAULT: False
+"""
+MERGE_WORKERS = 1
+SHARD_COUNT = 1
+SHARDS_FOLDER = "shards"
+KGRAM_INDEX = False
+
+GENERATION_FILE = "index_generation.json" # id of the last full build, search caches results per generation
+TERM_STATS = struct.Struct("<I") # global df of a term, see merge_shards
+
+# Yields (term, postings) from a partial index one line at a time, in the sorted order the indexer wrote them
+# only terms in [start_term, end_term) are yielded, None leaves that side open
+def stream_partial_index(file_path, start_term=None, end_term=None):
+    with open(file_path, "rb") as f:
+        if start_term is not None:
+            # jump to the last sampled term before start_term instead of reading from the top
+            samples = load_term_samples(file_path)
+            position = bisect.bisect_left([term for term, _ in samples], start_term) - 1
+            if position >= 0:
+                f.seek(samples[position][1])
         for line in f:  # Read one line (one term) at a time
-            term_data = json.loads(line.strip())  # Convert JSON string to dictionary
-            term, postings = next(iter(term_data.items()))  # Extract term and postings
-            yield (term, postings)
+            term, postings = json.loads(line)
+            if start_term is not None and term < start_term:
+                continue
+            if end_term is not None and term >= end_term:
+                break
+            yield term, postings
+
+# returns the [term, byte offset] samples the indexer wrote next to a partial index, [] if there are none
+def load_term_samples(file_path):
+    samples_path = file_path[:-len(".jsonl")] + ".samples.json"
+    if not os.path.exists(samples_path):
+        return []
+    with open(samples_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+# splits the term space into up to range_count ranges holding about the same number of terms
+# using the sampled terms of every partial index, returns [(start_term, end_term), ...]
+def split_term_space(partial_files, range_count):
+    sampled_terms = sorted(term for file in partial_files for term, _ in load_term_samples(file))
+    boundaries = []
+    for i in range(1, range_count):
+        boundary = sampled_terms[i * len(sampled_terms) // range_count] if sampled_terms else None
+        if boundary is not None and (not boundaries or boundary > boundaries[-1]):
+            boundaries.append(boundary)
+    starts = [None] + boundaries
+    ends = boundaries + [None]
+    return list(zip(starts, ends))
+
+# computes TF-IDF for a term's postings and writes them to the binary index
+# the term's byte position is stored in term_offsets
+# postings is the complete list of [document_id, tf, [word positions]] for the term
+# doc_norms is (first document id, norms) from index_format.read_doc_norms
+def write_term(file, term, postings, term_offsets, doc_norms):
+    with metrics.timer("merger.write_term"):
+        encode_term(file, term, postings, term_offsets, doc_norms)
+    metrics.increment("merger.terms")
+    metrics.increment("merger.postings", len(postings))
+
+# only tf is stored, search computes idf from the df and N of the live segments (see index_format.py)
+def encode_term(file, term, postings, term_offsets, doc_norms):
+    # Store byte position before writing the term
+    term_offsets[term] = file.tell()
+
+    # postings are stored by document id so ids can be delta encoded
+    postings = sorted(postings, key=lambda x: x[0])
+
+    # cosine normalized document weights, search bounds each block's scores by their maximum
+    # computed from the stored tf exactly the way search decodes it, so the bounds hold exactly
+    first_document_id, norms = doc_norms
+    document_ids = np.array([document_id for document_id, _, _ in postings], dtype=np.int64)
+    # a document id twice would overcount df and score its document twice (the indexer gives every url one id)
+    if np.any(np.diff(document_ids) == 0):
+        raise ValueError(f"Duplicate document id in the postings of {term}")
+    tfs = np.array([round(tf * TF_SCALE) for _, tf, _ in postings], dtype="<u2").astype(np.float32) / TF_SCALE
+    weights = log_tf_weights(tfs) / norms[document_ids - first_document_id]
+    file.write(encode_postings([(document_id, tf) for document_id, tf, _ in postings], weights, [positions for _, _, positions in postings]))
+
+# merges the terms in [start_term, end_term) of every partial index into the index file output_file
+# returns the byte offset of each term in output_file and the metrics of the merge
+def merge_term_range(task):
+    with metrics.timer("merger.merge_range"):
+        term_offsets = merge_terms(*task)
+    return term_offsets, metrics.snapshot()
+
+def merge_terms(partial_files, start_term, end_term, output_file):
+    term_offsets = {}
+    doc_norms = read_doc_norms("doc_norms.bin")
+
+    # Open every partial index as a stream of sorted terms
+    term_streams = [stream_partial_index(file, start_term, end_term) for file in partial_files]
 
-def merge_partial_indexes():
-
-    # load doc_id_map from the JSON file
-    with open("doc_id_mapping.json", "r", encoding="utf-8") as file:
-        doc_id_map=json.load(file)
-
-    # Track global var for IDF (N and df_t)
-    total_docs = len(doc_id_map) # total number of documents (N)
-    doc_freqs = {} # number of documents containing each term (df_t), calulated as length of postings list for a term
-    bookkeeper = {"total_docs": total_docs}
+    # Open final index for writing
+    with open(output_file, "wb") as file:
+        # k-way merge of the partial indexes, only one term's postings are in memory at a time
+        merged_terms = heapq.merge(*term_streams, key=lambda x: x[0])
+        for term, entries in groupby(merged_terms, key=lambda x: x[0]):
+            postings = []
+            for _, partial_postings in entries:
+                postings.extend(partial_postings)  # Merge postings
+            write_term(file, term, postings, term_offsets, doc_norms)
+    return term_offsets
+
+# shards > 1 writes shards (see merge_shards), otherwise one index in src/ (see merge_index)
+def merge_partial_indexes(workers=MERGE_WORKERS, shards=SHARD_COUNT):
+
+    # Track global var for IDF (N), df_t is known once all of a term's postings are merged
+    total_docs = read_total_docs("documents.bin") # total number of documents (N), from the document table header
 
-    bookkeeper_file = "bookkeeping.json"
     index_folder = "partial_indexes"
-    output_file = "final_index.json"  # Keep this name so it is compatible with generate_report
-    partial_files = [os.path.join(index_folder, f) for f in os.listdir(index_folder) if f.startswith("partial_index_") and f.endswith(".json")]
-
-    for file in partial_files:
-        with open(file, "r", encoding="utf-8") as f:
-            index_data = json.load(f)
-            for token, postings in index_data.items():
-                if token not in doc_freqs:
-                    doc_freqs[token] = 0
-                doc_freqs[token] += len(postings) # count documents containing the term
-    
-    # Sort each partial index in chunks and save to disk
-    sorted_chunk_files = []
-    for file in partial_files:
-        sorted_chunk_files.extend(chunk_sort_and_save(file))
-    
-    # Open sorted chunks as iterators for merging
-    term_streams = [stream_json_terms(file) for file in sorted_chunk_files]
-    
-    # Open final index for writing
-    with open(output_file, "w", encoding="utf-8") as file:
-        file.write("{\n")  # JSON start
-        first_entry = True
-
-        current_term = None
-        current_postings = []
-
-        for term, postings in heapq.merge(*term_streams, key=lambda x: x[0]):
-            if term == current_term:
-                current_postings.extend(postings)  # Merge postings
-            else:
-                # Write the previous term to disk before moving to the next
-                if current_term is not None:
-                    if not first_entry:
-                        file.write(",\n")
-                    first_entry = False
-
-                    # Store byte position before writing the term
-                    bookkeeper[current_term] = file.tell()
-
-                    # calculate IDF for term
-                    df_t = doc_freqs.get(current_term, 0) # number of docs containing current term
-                    idf = math.log((total_docs + 1) / (df_t + 1))  # Smoothed IDF
-
-                    # updating postings with TF-IDF scores
-                    for posting in current_postings:
-                        tf = posting["tf"]
-                        tf_idf = (1 + math.log(tf)) * idf
-                        posting["tf-idf score"] = round(tf_idf, 3)
-                        # print(f"Term: {current_term}, tf: {tf}, idf: {idf}, tf-idf: {tf_idf}")
-                        # print(f"Term: {current_term}, total_docs: {total_docs}, df_t: {df_t}")
-
-                    # sort postings by TF-IDF score
-                    current_postings.sort(key=lambda x: x.get("tf-idf score", 0), reverse=True)  
-
-                    # Write term correctly without extra quotes
-                    file.write(f'"{current_term}": ')  
-                    json.dump(current_postings, file)  
-
-                # Start new term
-                current_term = term
-                current_postings = postings
-
-        # Write last term
-        if current_term is not None:
-            if not first_entry:
-                file.write(",\n")
-            bookkeeper[current_term] = file.tell()
-
-            # calculate IDF for the last term
-            df_t = doc_freqs.get(current_term, 0)
-            idf = math.log((total_docs + 1) / (df_t + 1))  # Smoothed IDF
-
-            # updating postings with TF-IDF scores
-            for posting in current_postings:
-                tf = posting["tf"]
-                tf_idf = tf * idf
-                posting["tf-idf score"] = round(tf_idf, 2)
-                # print(f"Term: {current_term}, tf: {tf}, idf: {idf}, tf-idf: {tf_idf}")
-                # print(f"Term: {current_term}, total_docs: {total_docs}, df_t: {df_t}")
-
-            # sort postings by TF-IDF score
-            current_postings.sort(key=lambda x: x.get("tf-idf score", 0), reverse=True)
-
-            file.write(f'"{current_term}": ')
-            json.dump(current_postings, file)
-
-        file.write("\n}")  # JSON end
+    partial_files = sorted(os.path.join(index_folder, f) for f in os.listdir(index_folder) if f.startswith("partial_index_") and f.endswith(".jsonl"))
+
+    if shards > 1:
+        merge_shards(partial_files, total_docs, shards)
+    else:
+        merge_index(partial_files, total_docs, workers)
+
+    # the new full index contains every page, drop incremental segments and tombstones (see segments.py)
+    segments.reset()
+
+    # a new generation id tells search that results cached on the old index are stale
+    with open(GENERATION_FILE, "w", encoding="utf-8") as file:
+        json.dump({"generation": uuid.uuid4().hex, "created": time.strftime("%Y-%m-%d %H:%M:%S"), "total_docs": total_docs}, file)
+
+# workers > 1 merges ranges of the term space in separate processes, each into its own index segment,
+# then concatenates the segments in term order and shifts their term offsets into one term dictionary
+def merge_index(partial_files, total_docs, workers):
+    term_offsets = {}
+    dictionary_file = "term_dictionary.bin"
+    output_file = "final_index.bin"
+
+    term_ranges = split_term_space(partial_files, workers) if workers > 1 else [(None, None)]
+    if len(term_ranges) == 1:
+        term_offsets, range_metrics = merge_term_range((partial_files, None, None, output_file))
+        metrics.merge(range_metrics)
+    else:
+        segment_files = [f"{output_file}.part{i}" for i in range(len(term_ranges))]
+        tasks = [(partial_files, start_term, end_term, segment_file)
+                 for (start_term, end_term), segment_file in zip(term_ranges, segment_files)]
+        with multiprocessing.Pool(workers) as pool:
+            segment_results = pool.map(merge_term_range, tasks)
+
+        # stitch the segments together, a term's offset moves by the size of the segments before it
+        with metrics.timer("merger.stitch"), open(output_file, "wb") as file:
+            for segment_file, (offsets, range_metrics) in zip(segment_files, segment_results):
+                metrics.merge(range_metrics)
+                base = file.tell()
+                for term, offset in offsets.items():
+                    term_offsets[term] = base + offset
+                with open(segment_file, "rb") as segment:
+                    shutil.copyfileobj(segment, file)
+                os.remove(segment_file)
 
     print(f"Merged index saved to {output_file}")
 
-    # Save the secondary index (bookkeeping file)
-    with open(bookkeeper_file, "w", encoding="utf-8") as bookkeeper_file:
-        json.dump(bookkeeper, bookkeeper_file, indent=4)
-    print(f"Bookkeeping file saved to {bookkeeper_file}")
-
-    # Delete chunk files
-    for chunk_file in sorted_chunk_files:
-        os.remove(chunk_file)
+    # Save the secondary index, terms were merged in sorted order so the offsets already are
+    with metrics.timer("merger.write_dictionary"):
+        write_term_dictionary(dictionary_file, term_offsets.items(), total_docs)
+    print(f"Term dictionary saved to {dictionary_file}")
+    if KGRAM_INDEX:
+        with metrics.timer("merger.kgram_index"):
+            build_kgram_index(".")
+
+# folder of shard i, a self-contained index segment (see segments.IndexSegment)
+def shard_folder(i):
+    return os.path.join(SHARDS_FOLDER, f"shard_{i}")
+
+# splits the documents into shard_count runs of consecutive ids and writes each run as a shard folder with its own
+# final_index.bin, term_dictionary.bin, documents.bin and doc_norms.bin, in one pass over the partial indexes.
+# Shards only know their own document frequencies, so the global df of every term goes to TERM_STATS in SHARDS_FOLDER,
+# with a term dictionary (holding the global N) that maps each term to the byte offset of its df (see shards.py)
+def merge_shards(partial_files, total_docs, shard_count):
+    shutil.rmtree(SHARDS_FOLDER, ignore_errors=True)
+    documents = DocumentStore("documents.bin")
+    doc_norms = read_doc_norms("doc_norms.bin")
+    first_document_id = documents.first_document_id
+    # first document id of every shard after the first
+    bounds = [first_document_id + documents.slot_count * i // shard_count for i in range(1, shard_count)]
+    ranges = list(zip([first_document_id] + bounds, bounds + [first_document_id + documents.slot_count]))
+
+    shard_docs = []
+    for i, (start, end) in enumerate(ranges):
+        os.makedirs(shard_folder(i))
+        shard_documents = {document_id: (url, webpage) for document_id, url, webpage in documents.items() if start <= document_id < end}
+        write_document_store(os.path.join(shard_folder(i), "documents.bin"), shard_documents)
+        write_doc_norms(os.path.join(shard_folder(i), "doc_norms.bin"),
+                        {document_id: float(doc_norms[1][document_id - doc_norms[0]]) for document_id in shard_documents})
+        shard_docs.append(len(shard_documents))
+
+    shard_offsets = [{} for _ in ranges]
+    shard_files = [open(os.path.join(shard_folder(i), "final_index.bin"), "wb") for i in range(shard_count)]
+    stats_offsets = {}
+    term_dfs = []
+    try:
+        term_streams = [stream_partial_index(file) for file in partial_files]
+        for term, entries in groupby(heapq.merge(*term_streams, key=lambda x: x[0]), key=lambda x: x[0]):
+            postings = sorted((posting for _, partial_postings in entries for posting in partial_postings), key=lambda x: x[0])
+            stats_offsets[term] = TERM_STATS.size * len(term_dfs)
+            term_dfs.append(len(postings))
+
+            # the postings of each shard are a run of the sorted postings
+            splits = [0] + [bisect.bisect_left(postings, [bound]) for bound in bounds] + [len(postings)]
+            for i in range(shard_count):
+                if splits[i] < splits[i + 1]:
+                    write_term(shard_files[i], term, postings[splits[i]:splits[i + 1]], shard_offsets[i], doc_norms)
+    finally:
+        for file in shard_files:
+            file.close()
+
+    with metrics.timer("merger.write_dictionary"):
+        for i in range(shard_count):
+            write_term_dictionary(os.path.join(shard_folder(i), "term_dictionary.bin"), shard_offsets[i].items(), shard_docs[i])
+        with open(os.path.join(SHARDS_FOLDER, "term_stats.bin"), "wb") as file:
+            file.write(np.array(term_dfs, dtype=TERM_STATS.format).tobytes())
+        write_term_dictionary(os.path.join(SHARDS_FOLDER, "term_stats_dictionary.bin"), stats_offsets.items(), total_docs)
+    if KGRAM_INDEX:
+        with metrics.timer("merger.kgram_index"):
+            for i in range(shard_count):
+                build_kgram_index(shard_folder(i))
+    print(f"Index saved as {shard_count} shards in {SHARDS_FOLDER}")
 
 if __name__ == '__main__':
 
-    # # the DEV folder - extract developer.zip inside the src folder
-    merge_partial_indexes()
+    # python3 merger.py [shards, DEFAULT: SHARD_COUNT]
+    merge_partial_indexes(shards=int(sys.argv[1]) if len(sys.argv) > 1 else SHARD_COUNT)
+    metrics.write_report("merger_metrics.json")
@@ -0,0 +1,158 @@
+import json
+import time
+import cProfile
+import pstats
+import io
+import bisect
+import threading
+from contextlib import contextmanager
+
+"""
+Process-wide metrics: counters, histograms and stage timers, exported as a JSON report or Prometheus text
+
+    increment("indexer.pages_parsed")        counter
+    observe("search.results", 10)            histogram of any value
+    with timer("indexer.html_parse"): ...    histogram of the stage's seconds, and a cProfile of it when profiled
+
+Stage names are "<module>.<stage>". Processes keep their own metrics, worker processes send theirs back
+with snapshot() and the parent adds them with merge().
+
+ENABLED turns every timer and counter into a no-op when False. DEFAULT: True
+PROFILE_STAGES are the stages run under cProfile, set it with enable_profiling. DEFAULT: none
+BUCKETS are the upper bounds of histogram buckets, 1 us to about 1 minute for timers
+"""
+ENABLED = True
+PROFILE_STAGES = set()
+BUCKETS = [1e-6 * 4 ** i for i in range(14)]
+
+counters = {} # name -> count
+histograms = {} # name -> Histogram
+profiles = {} # stage -> cProfile.Profile
+lock = threading.Lock()
+profiling = threading.local() # stops nested stages from starting a second profiler
+
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.buckets = [0] * (len(BUCKETS) + 1) # the last bucket is everything above BUCKETS[-1]
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.buckets[bisect.bisect_left(BUCKETS, value)] += 1
+
+    def to_dict(self):
+        return {"count": self.count, "sum": self.total, "min": self.min, "max": self.max,
+                "mean": self.total / self.count if self.count else 0.0, "buckets": list(self.buckets)}
+
+    def add(self, other):
+        self.count += other["count"]
+        self.total += other["sum"]
+        self.min = min(self.min, other["min"])
+        self.max = max(self.max, other["max"])
+        self.buckets = [a + b for a, b in zip(self.buckets, other["buckets"])]
+
+def increment(name, amount=1):
+    if not ENABLED:
+        return
+    with lock:
+        counters[name] = counters.get(name, 0) + amount
+
+def observe(name, value):
+    if not ENABLED:
+        return
+    with lock:
+        if name not in histograms:
+            histograms[name] = Histogram()
+        histograms[name].observe(value)
+
+# times the block into the histogram name, and profiles it when name is in PROFILE_STAGES
+@contextmanager
+def timer(name):
+    if not ENABLED:
+        yield
+        return
+    profile = None
+    if name in PROFILE_STAGES and not getattr(profiling, "active", False):
+        with lock:
+            if name not in profiles:
+                profiles[name] = cProfile.Profile()
+            profile = profiles[name]
+        profiling.active = True
+        profile.enable()
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start_time
+        if profile is not None:
+            profile.disable()
+            profiling.active = False
+        observe(name, elapsed)
+
+def enable_profiling(*stages):
+    PROFILE_STAGES.update(stages)
+
+# top functions of a profiled stage by cumulative time, as text
+def profile_report(stage, limit=25):
+    output = io.StringIO()
+    pstats.Stats(profiles[stage], stream=output).sort_stats("cumulative").print_stats(limit)
+    return output.getvalue()
+
+# saves every profiled stage as <prefix><stage>.prof, readable with pstats or snakeviz
+def dump_profiles(prefix="profile_"):
+    for stage, profile in profiles.items():
+        profile.dump_stats(f"{prefix}{stage}.prof")
+
+def report():
+    with lock:
+        return {"counters": dict(counters), "histograms": {name: histogram.to_dict() for name, histogram in histograms.items()}}
+
+# returns the metrics of this process and clears them, for a worker to send back to its parent
+def snapshot():
+    current = report()
+    reset()
+    return current
+
+# adds a snapshot (or report) from another process
+def merge(other):
+    with lock:
+        for name, count in other["counters"].items():
+            counters[name] = counters.get(name, 0) + count
+        for name, histogram in other["histograms"].items():
+            histograms.setdefault(name, Histogram()).add(histogram)
+
+def reset():
+    with lock:
+        counters.clear()
+        histograms.clear()
+
+def write_report(path):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(report(), file, indent=1)
+
+# metric name in Prometheus form, "indexer.html_parse" -> "indexer_html_parse"
+def prometheus_name(name):
+    return "".join(character if character.isalnum() else "_" for character in name)
+
+# Prometheus text exposition of every counter and histogram, timers are in seconds
+def prometheus_text():
+    current = report()
+    lines = []
+    for name, count in sorted(current["counters"].items()):
+        metric = prometheus_name(name) + "_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {count}"]
+    for name, histogram in sorted(current["histograms"].items()):
+        metric = prometheus_name(name)
+        lines.append(f"# TYPE {metric} histogram")
+        cumulative = 0
+        for bound, count in zip(BUCKETS + [float("inf")], histogram["buckets"]):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{le="{"+Inf" if bound == float("inf") else f"{bound:g}"}"}} {cumulative}')
+        lines += [f"{metric}_sum {histogram['sum']}", f"{metric}_count {histogram['count']}"]
+    return "\n".join(lines) + "\n"
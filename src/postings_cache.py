@@ -0,0 +1,102 @@
+import threading
+from collections import OrderedDict
+
+"""
+Postings cache shared by every query in the process, bounded by the bytes of the cached arrays
+
+Eviction is a segmented LRU: new entries go to the probation segment and move to the protected
+segment on their second hit. A scan over many terms that are used once only cycles through
+probation, so it cannot push out the hot terms in protected.
+"""
+PROTECTED_SHARE = 0.8 # share of the byte budget for entries hit at least twice
+ENTRY_OVERHEAD = 100 # bytes per entry for the key, tuple and dict slot
+
+class PostingsCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.protected_max_bytes = int(max_bytes * PROTECTED_SHARE)
+        self.probation = OrderedDict() # key -> (value, size), least recently used first
+        self.protected = OrderedDict()
+        self.probation_bytes = 0
+        self.protected_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    # returns the cached value for key, or None
+    def get(self, key):
+        with self.lock:
+            if key in self.protected:
+                self.protected.move_to_end(key)
+                self.hits += 1
+                return self.protected[key][0]
+            if key in self.probation:
+                # second hit, promote to protected
+                value, size = self.probation.pop(key)
+                self.probation_bytes -= size
+                self.protected[key] = (value, size)
+                self.protected_bytes += size
+                self.hits += 1
+                self.demote_protected()
+                return value
+            self.misses += 1
+            return None
+
+    # value is a tuple of numpy arrays, its size is the bytes of the arrays
+    def put(self, key, value):
+        size = sum(array.nbytes for array in value) + ENTRY_OVERHEAD
+        with self.lock:
+            if key in self.protected or key in self.probation or size > self.max_bytes:
+                return
+            self.probation[key] = (value, size)
+            self.probation_bytes += size
+            self.evict()
+
+    # returns the cached value for key, calling load() and caching its result on a miss
+    def get_or_load(self, key, load):
+        value = self.get(key)
+        if value is None:
+            value = load()
+            self.put(key, value)
+        return value
+
+    # moves least recently used protected entries back to probation while protected is over its share
+    def demote_protected(self):
+        while self.protected_bytes > self.protected_max_bytes:
+            key, (value, size) = self.protected.popitem(last=False)
+            self.protected_bytes -= size
+            self.probation[key] = (value, size)
+            self.probation_bytes += size
+        self.evict()
+
+    # drops least recently used probation entries (then protected ones) until the cache fits its budget
+    def evict(self):
+        while self.probation_bytes + self.protected_bytes > self.max_bytes:
+            if self.probation:
+                _, (_, size) = self.probation.popitem(last=False)
+                self.probation_bytes -= size
+            else:
+                _, (_, size) = self.protected.popitem(last=False)
+                self.protected_bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.probation.clear()
+            self.protected.clear()
+            self.probation_bytes = 0
+            self.protected_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.probation) + len(self.protected),
+                "bytes": self.probation_bytes + self.protected_bytes,
+                "max_bytes": self.max_bytes,
+            }
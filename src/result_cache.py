@@ -0,0 +1,65 @@
+import time
+import threading
+from collections import OrderedDict
+
+"""
+Query result cache shared by every query in the process, keyed by the normalized query (see search.normalize_query)
+
+Entries are tagged with the index generation they were computed on. A lookup under another generation
+(a rebuild by merger.py or a change to the incremental segments) is a miss, so stale results are never returned.
+Entries also expire ttl seconds after they are stored, and the least recently used entry is evicted when
+the cache holds max_entries.
+"""
+
+class ResultCache:
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict() # key -> (generation, expiry time, value), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.lock = threading.Lock()
+
+    # returns the cached value for key under generation, or None
+    def get(self, key, generation):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry_generation, expiry, value = entry
+                if entry_generation == generation and time.monotonic() < expiry:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, generation, value):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (generation, time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+            }
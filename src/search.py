@@ -1,133 +1,278 @@
+import os
+import re
 import json
 import time
-from indexer import tokenize, computeWordFrequencies
-from sklearn.metrics.pairwise import cosine_similarity
+import threading
+import multiprocessing
+from indexer import tokenizer, computeWordFrequencies
+from tokenizer import BIGRAM_WEIGHT, TRIGRAM_WEIGHT
 import math
 import numpy as np
-
-# postings_cache = {}
-
-# Load doc to id mapping
-with open("doc_id_mapping.json", 'r', encoding='utf-8') as file:
-    doc_id_map = json.load(file)
-    doc_id_map = {v[0]: (k, v[1]) for k, v in doc_id_map.items()}
-
-# Load bookkeeping file to map terms to byte positions in the index file
-with open("bookkeeping.json", 'r', encoding='utf-8') as book_file:
-    bookkeeping = json.load(book_file)
-
-def get_postings(term):
-    if term not in bookkeeping:
-        return []
-    
-    # Get byte offset
-    position = bookkeeping[term]
-
-    # Open the index file and seek to the term's position
-    with open("final_index.json", "r", encoding="utf-8") as index_file:
-        # Move file pointer to term's location
-        index_file.seek(position)
-        # Read the term's data
-        line = index_file.readline().strip().rstrip(',')
-        data = json.loads("{" + line + "}") 
-
-        return data[term]
+import segments
+from top_k import PostingsList, UnionPostingsList, QueryTerm, PhraseTerm, top_k, intersect
+import wildcard
+from snippets import snippet_builder
+from postings_cache import PostingsCache
+from result_cache import ResultCache
+from merger import GENERATION_FILE
+import metrics
+
+RESULT_COUNT = 10 # number of documents returned per query
+
+# "quoted words" must appear as a phrase, "quoted words"~N allows N other words between each pair
+PHRASE_PATTERN = re.compile(r'"([^"]*)"(?:~(\d+))?')
+
+"""
+POSTINGS_CACHE_BYTES is the memory budget of decoded postings blocks kept across queries. DEFAULT: 256 MB
+WARM_QUERY_LOG is a query log (see read_query_log and query_log.txt) run once at startup to fill the cache. DEFAULT: None
+RESULT_CACHE_ENTRIES is the number of query results kept across queries, 0 turns the result cache off. DEFAULT: 10000
+RESULT_CACHE_TTL is the number of seconds a cached result is used for. DEFAULT: 300
+"""
+POSTINGS_CACHE_BYTES = 256 * 1024 * 1024
+WARM_QUERY_LOG = None
+RESULT_CACHE_ENTRIES = 10000
+RESULT_CACHE_TTL = 300
+
+# decoded blocks keyed by ((IndexSegment.cache_key, term), block), shared by every query in the process
+postings_cache = PostingsCache(POSTINGS_CACHE_BYTES)
+# results keyed by normalized query (see normalize_query), tagged with the generation of index_state
+result_cache = ResultCache(RESULT_CACHE_ENTRIES, RESULT_CACHE_TTL)
+
+# (segments, tombstones, N, generation) of the loaded index, replaced in one step so a query sees the four of one load:
+#   segments     IndexSegment for the full build and every incremental segment (see segments.py)
+#   tombstones   ids of deleted or replaced documents
+#   N            number of live documents
+#   generation   (generation id written by merger.py, segments_version), results are cached under it
+index_state = ([], np.zeros(0, dtype=np.int64), 0, None)
+segments_version = None # modification times of the generation file, manifest and tombstones the loaded segments match
+refresh_lock = threading.Lock() # one thread reloads, the others keep querying the state they hold
+
+# (re)loads the live segments when the index was rebuilt or the manifest or tombstones changed since the last call
+# returns index_state, queries take everything they use from it so a reload in another thread cannot mix two indexes
+def refresh_segments():
+    global index_state, segments_version
+    version = tuple(os.path.getmtime(path) if os.path.exists(path) else None for path in (GENERATION_FILE, segments.MANIFEST, segments.TOMBSTONES))
+    if version == segments_version:
+        return index_state
+    with refresh_lock:
+        if version == segments_version:
+            return index_state
+        # Memory-map every segment's binary index once, postings are decoded straight from the mapped pages
+        loaded_segments = [segments.IndexSegment(folder) for folder in segments.live_segment_folders()]
+        loaded_tombstones = np.array(sorted(segments.load_tombstones()), dtype=np.int64)
+        loaded_total_docs = sum(segment.total_docs for segment in loaded_segments) - len(loaded_tombstones)
+        # cached blocks are keyed by segment load (IndexSegment.cache_key), so a query still running on the old
+        # segments cannot put blocks a query on the new ones would read, clearing only frees their memory
+        postings_cache.clear()
+        index_state = (loaded_segments, loaded_tombstones, loaded_total_docs, (read_generation(), version))
+        segments_version = version
+    return index_state
+
+# multiprocessing context for worker pools: fork where the platform has it, so workers inherit the index opened
+# on import, the default start method elsewhere (Windows), where each worker opens the index when it imports search
+def process_context():
+    return multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+
+# id of the full build, written by merger.py, None for an index built before generations were recorded
+def read_generation():
+    if not os.path.exists(GENERATION_FILE):
+        return None
+    with open(GENERATION_FILE, "r", encoding="utf-8") as file:
+        return json.load(file)["generation"]
+
+# returns (url, json file) of a document from the table of the segment that holds it,
+# from_segments defaults to the segments of the current index_state
+def get_document(document_id, from_segments=None):
+    for segment in index_state[0] if from_segments is None else from_segments:
+        document = segment.documents.get(document_id)
+        if document is not None:
+            return document
+    return None
+
+# returns {document_id: (title, text)} of the documents, reading each from the segment that holds it
+def get_texts(document_ids, from_segments=None):
+    texts = {}
+    for segment in index_state[0] if from_segments is None else from_segments:
+        if segment.texts is not None:
+            texts.update(segment.texts.get_many([document_id for document_id in document_ids
+                                                 if document_id not in texts and segment.documents.get(document_id) is not None]))
+    return texts
+
+refresh_segments()
 
 # search function
-# input is the query string
-def search(query):
-    def get_cached_postings(term):
-        if term not in postings_cache:
-            postings_cache[term] = get_postings(term)
-        return postings_cache[term]
-    postings_cache = {}
-    
-    # retrieve total number of documents (N) from bookkeeping file
-    total_docs = bookkeeping.get("total_docs", len(doc_id_map)) # resort to len(doc_id_map) if "total docs" not found in postings
-     
-    # tokenize the query string
-    # output is list of (stemmed token, weight)
-    query_tokens_weight = tokenize(query, weight=1)
-
-    # get only the stemmed tokens => token[0] (first value of token)
-    query_stemmed_tokens = [token[0] for token in query_tokens_weight]
-    query_freqs = computeWordFrequencies([(token, 1) for token in query_stemmed_tokens])
-
-    # query_tokens = query.lower().split()
-
-    # query_tokens.extend(query_stemmed_tokens)
-
-    # query_tokens = list(set(query_tokens))
-
-    # Initialize result as None, no documents
-    result = None
-
-    for token in query_stemmed_tokens:
-        if "_" in token:
-            continue
-        postings = get_cached_postings(token)  # Retrieve postings once per token
-
-        # Extract document IDs from postings
-        postings_ids = {doc["document_id"] for doc in postings}
-
-        # Perform set intersection
-        if result is None:
-            result = postings_ids  # First token sets the initial result
+# input is the query string, if stats is a dict it gets the scores and document ids of the results,
+# the postings bytes read and whether the results came from the result cache
+def search(query, stats=None):
+    # pick up a rebuild or pages added or deleted since the last query
+    results, _ = query_index(query, refresh_segments(), stats)
+    return results
+
+# returns (results, document ids) of a query on one index_state, see search
+def query_index(query, state, stats=None):
+    generation = state[3]
+    with metrics.timer("search.query"):
+        normalized_query = normalize_query(query)
+        cached = result_cache.get(normalized_query, generation)
+        if cached is None:
+            results, scores, document_ids, postings_bytes = run_search(normalized_query, state)
+            result_cache.put(normalized_query, generation, (results, scores, document_ids))
         else:
-            result &= postings_ids  # Keep only common document IDs
-
-    # create query vector, weighting with TF-IDF
-    query_vector = []
-
-    # compute cosine similarity for each document
-    # Precompute TF-IDF scores for all tokens in query
-    tf_idf_lookup = {}  # {document_id: np.array(tf-idf scores)}
-
-    for token in query_stemmed_tokens:
-        # print(token)
-        postings = get_cached_postings(token)  # Retrieve postings once per token
+            (results, scores, document_ids), postings_bytes = cached, 0
+            metrics.increment("search.result_cache_hits")
+    metrics.increment("search.queries")
+
+    if stats is not None:
+        stats["scores"] = list(scores)
+        stats["document_ids"] = list(document_ids)
+        stats["postings_bytes"] = postings_bytes
+        stats["cached"] = cached is not None
+    return list(results), list(document_ids)
+
+# search, returning (url, json file, title, snippet) per result, the snippet highlights the query words
+# (see snippets.py) in the page text kept by the indexer, results of an index without texts.bin get empty ones
+def search_with_snippets(query, stats=None):
+    state = refresh_segments()
+    results, document_ids = query_index(query, state, stats)
+    with metrics.timer("search.snippets"):
+        query_stemmed_tokens, _, patterns = normalize_query(query)
+        build_snippet = snippet_builder(tokenizer, query_stemmed_tokens, patterns)
+        texts = get_texts(document_ids, state[0])
+        snippets = [(title, build_snippet(text)) for title, text in (texts.get(document_id, ("", "")) for document_id in document_ids)]
+    return [(url, webpage, title, snippet) for (url, webpage), (title, snippet) in zip(results, snippets)]
+
+# the query as the stemmed words in order, the (stemmed words, slop) of its quoted phrases and its wildcard patterns
+# queries differing only in case, spacing, punctuation or word endings normalize to the same key
+# word order is kept, since adjacent query words raise the score of pages where they are adjacent too
+def normalize_query(query):
+    patterns, query = wildcard.split_wildcards(query)
+    query_stemmed_tokens = tuple(tokenizer.stems(query))
+    phrases = tuple((tuple(tokenizer.stems(match.group(1))), int(match.group(2) or 0)) for match in PHRASE_PATTERN.finditer(query))
+    return query_stemmed_tokens, phrases, tuple(patterns)
+
+# {token or wildcard pattern: 1} for every word of a normalized query
+def query_frequencies(normalized_query):
+    query_stemmed_tokens, _, patterns = normalized_query
+    return computeWordFrequencies([(token, 1) for token in query_stemmed_tokens + patterns])
+
+# returns (results, scores, document ids, postings bytes read) of a normalized query on one index_state
+def run_search(normalized_query, state):
+    live_segments, live_tombstones, live_total_docs, _ = state
+    query_freqs = query_frequencies(normalized_query)
+    query_postings = fetch_postings(live_segments, query_freqs)
+    # df_t can exceed N with tombstones
+    query_vector = query_weights(query_freqs, {token: sum(postings_list.df for postings_list in query_postings[token]) for token in query_freqs}, live_total_docs)
+
+    # exact top 10 by cosine similarity, skipping blocks that cannot reach the top 10
+    results = rank(normalized_query, query_postings, query_vector, live_tombstones, RESULT_COUNT)
+
+    postings_bytes = sum(postings_list.bytes_read for postings_lists in query_postings.values() for postings_list in postings_lists)
 
-        # Extract document IDs from postings
-        postings_ids = {doc["document_id"] for doc in postings}
+    # return list of docIDs sorted by cosine similarity
+    return [get_document(doc_id, live_segments) for doc_id, _ in results], [score for _, score in results], [doc_id for doc_id, _ in results], postings_bytes
+
+# Boolean AND: returns (url, json file) of every document with all words and quoted phrases of the query, by id
+# no scoring, the postings are intersected rarest term first (see top_k.intersect)
+def boolean_search(query):
+    live_segments, live_tombstones, _, _ = refresh_segments()
+    normalized_query = normalize_query(query)
+    _, phrases, _ = normalized_query
+    query_freqs = query_frequencies(normalized_query)
+    query_postings = fetch_postings(live_segments, query_freqs)
+    words = {token: QueryTerm(query_postings[token], 1.0, required=True) for token in query_freqs}
+    query_terms = list(words.values()) + [PhraseTerm([words[token] for token in phrase], 1.0, slop, required=True)
+                                          for phrase, slop in phrases if len(phrase) > 1 and all(token in words for token in phrase)]
+    with metrics.timer("search.boolean_query"):
+        document_ids = intersect(query_terms, live_tombstones)
+    return [get_document(document_id, live_segments) for document_id in document_ids.tolist()]
+
+# returns {token: [PostingsList of every segment holding the token]}
+# a wildcard pattern gets one UnionPostingsList of the terms it expands to, or none
+# expansions is {pattern: [terms]} for patterns already expanded by the caller (see shards.py)
+def fetch_postings(from_segments, tokens, expansions=None):
+    query_postings = {}
+    for token in tokens:
+        if wildcard.WILDCARD_CHARACTERS.search(token):
+            query_postings[token] = fetch_wildcard(from_segments, token, expansions.get(token) if expansions else None)
+            continue
+        with metrics.timer("search.postings_fetch"):
+            offsets = [(segment, segment.term_dictionary.get(token)) for segment in from_segments]
+            query_postings[token] = [PostingsList(segment.index_map, offset, segment.doc_norms, postings_cache, (segment.cache_key, token))
+                                     for segment, offset in offsets if offset is not None]
+    return query_postings
+
+def fetch_wildcard(from_segments, pattern, terms=None):
+    with metrics.timer("search.wildcard_expand"):
+        if terms is None:
+            expansions = wildcard.expand(from_segments, pattern, tokenizer.stem)
+        else:
+            offsets = {term: [(segment, segment.term_dictionary.get(term)) for segment in from_segments] for term in terms}
+            expansions = {term: [(segment, offset) for segment, offset in term_offsets if offset is not None] for term, term_offsets in offsets.items()}
+        postings_lists = [PostingsList(segment.index_map, offset, segment.doc_norms, postings_cache, (segment.cache_key, term))
+                          for term, offsets in expansions.items() for segment, offset in offsets]
+    if not postings_lists:
+        return []
+    with metrics.timer("search.postings_fetch"):
+        return [UnionPostingsList(postings_lists)]
 
-        # set TF as # of times it appears in query
-        tf = query_freqs[token]
-        df_t = len(postings)
+# returns the normalized query vector {token: weight}, weighting query_freqs with TF-IDF from dfs and N
+def query_weights(query_freqs, dfs, total_docs):
+    query_vector = {}
+    for token, tf in query_freqs.items():
         # to avoid ZeroDivisionError, handle casse where df_t is 0 (query terms don't exist in any of the indexed documents)
-        idf = math.log((total_docs + 1) / (df_t + 1))  # Smoothed IDF
-        tf_idf = (1 + math.log(tf)) * idf
-        query_vector.append(round(tf_idf, 3))
-
-        postings = postings[:1000]
-
-        for posting in postings:
-            doc_id = posting["document_id"]
-            if doc_id in result:  # Only consider intersected documents
-                if doc_id not in tf_idf_lookup:
-                    tf_idf_lookup[doc_id] = np.zeros(len(query_stemmed_tokens))
-                tf_idf_lookup[doc_id][query_stemmed_tokens.index(token)] = posting["tf-idf score"]
-
-    # Convert query vector to numpy array
-    query_vector = np.array(query_vector).reshape(1, -1)
-
-    # Compute cosine similarities efficiently
-    doc_similarities = [
-        (doc_id, cosine_similarity(query_vector, doc_vector.reshape(1, -1))[0][0])
-        for doc_id, doc_vector in tf_idf_lookup.items()
-    ]
-
-    # sort documents by cosine similarity
-    doc_similarities.sort(key=lambda x: x[1], reverse=True)
-
-    # return list of docIDs sorted by cosine similarity
-    return [doc_id_map[doc_id] for doc_id, _ in doc_similarities][:10]
+        idf = max(math.log((total_docs + 1) / (dfs[token] + 1)), 0)  # Smoothed IDF
+        query_vector[token] = max((1 + math.log(tf)) * idf, 0)
+
+    # normalize the query vector, documents are already normalized (see index_format.py) so scores are cosine similarities
+    query_norm = math.sqrt(sum(weight ** 2 for weight in query_vector.values())) or 1
+    return {token: weight / query_norm for token, weight in query_vector.items()}
+
+# returns the top k [(document_id, score)] of a normalized query over query_postings
+def rank(normalized_query, query_postings, query_vector, skipped, k):
+    query_stemmed_tokens, phrases, _ = normalized_query
+
+    # every word (and wildcard pattern) must be in a result document
+    words = {token: QueryTerm(query_postings[token], weight, required=True) for token, weight in query_vector.items()}
+    query_terms = list(words.values())
+    # quoted phrases must be in a result document
+    for phrase, slop in phrases:
+        if len(phrase) > 1 and all(token in words for token in phrase):
+            query_terms.append(PhraseTerm([words[token] for token in phrase], 1.0, slop, required=True))
+    # adjacent words of the query raise the score of documents where they are adjacent too, like the bigrams and
+    # trigrams the index used to store: their weight is the n-gram weight times their lowest word weight
+    for n, weight in ((2, BIGRAM_WEIGHT), (3, TRIGRAM_WEIGHT)):
+        for start in range(len(query_stemmed_tokens) - n + 1):
+            phrase = query_stemmed_tokens[start:start + n]
+            query_terms.append(PhraseTerm([words[token] for token in phrase], weight, 0, required=False))
+
+    return top_k(query_terms, k, skipped)
+
+# yields the queries of a query log: one query per line, text after # is a comment, blank lines are skipped
+# (see query_log.txt, TEST.txt is a report and not a query log)
+def read_query_log(path):
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            query = line.split("#")[0].strip()
+            if query:
+                yield query
+
+# runs every query of the log once so their postings blocks are cached before the first user query
+def warm_postings_cache(path):
+    for query in read_query_log(path):
+        search(query)
+    return postings_cache.stats()
 
 def get_query():
+    if WARM_QUERY_LOG and os.path.exists(WARM_QUERY_LOG):
+        print(f"Warmed postings cache: {warm_postings_cache(WARM_QUERY_LOG)}")
+
     while True:
         # Prompt user for query
         query = input("Enter search query (or type 'exit' to quit): ").strip()
         
         if query.lower() == "exit":
+            print(f"Postings cache: {postings_cache.stats()}")
+            print(f"Result cache: {result_cache.stats()}")
             print("Exiting search.")
             break
 
@@ -140,7 +285,7 @@ def get_query():
         # Start timer
         start_time = time.time()
 
-        search_result = search(query)
+        search_result = search_with_snippets(query)
         
         # End timer
         end_time = time.time()
@@ -149,8 +294,8 @@ def get_query():
 
         if search_result:
             print("Documents found from query:")
-            for document in search_result:
-                print(document)
+            for url, webpage, title, snippet in search_result:
+                print(f"{title or url}\n{url} ({webpage})\n{snippet}\n")
         else:
             print("No documents found.")
 
@@ -0,0 +1,268 @@
+import os
+import sys
+import json
+import math
+import mmap
+import shutil
+import threading
+import itertools
+from index_format import decode_postings, decode_positions, read_doc_norms, write_doc_norms
+from term_dictionary import TermDictionary, write_term_dictionary
+from document_store import DocumentStore, write_document_store
+from text_store import TextStore, TextStoreWriter
+from wildcard import KGramIndex
+import indexer
+import merger
+
+"""
+Incremental indexing
+
+A segment is a folder holding the same files the full build writes to src/:
+final_index.bin, term_dictionary.bin, documents.bin, doc_norms.bin and texts.bin. The full build is the base segment ("."),
+pages added afterwards go into small immutable segments under SEGMENTS_FOLDER, listed in MANIFEST.
+Deleted or replaced pages are recorded as tombstones (document ids) in TOMBSTONES, and search skips them.
+Search computes tf-idf from the stored tf at query time, so adding segments never rewrites old ones.
+"""
+SEGMENTS_FOLDER = "segments"
+MANIFEST = os.path.join(SEGMENTS_FOLDER, "manifest.json")
+TOMBSTONES = os.path.join(SEGMENTS_FOLDER, "tombstones.json")
+BASE_SEGMENT = "."
+
+"""
+MERGE_FACTOR is how many segments of the same size tier the compactor merges into one. DEFAULT: 4
+COMPACTION_INTERVAL is the number of seconds between two runs of the background compactor
+"""
+MERGE_FACTOR = 4
+COMPACTION_INTERVAL = 60
+
+segment_loads = itertools.count() # numbers every IndexSegment opened in the process, see IndexSegment.cache_key
+
+# one process adds, deletes and compacts at a time
+manifest_lock = threading.RLock()
+
+# read-only view of one segment, postings are decoded from the memory-mapped index
+class IndexSegment:
+    def __init__(self, folder):
+        self.folder = folder
+        # cached postings blocks are keyed by this load of the folder, a rebuilt or compacted segment can reuse its name
+        self.cache_key = (folder, next(segment_loads))
+        self.term_dictionary = TermDictionary(os.path.join(folder, "term_dictionary.bin"))
+        self.documents = DocumentStore(os.path.join(folder, "documents.bin"))
+        self.total_docs = self.term_dictionary.total_docs
+        self.doc_norms = read_doc_norms(os.path.join(folder, "doc_norms.bin"))
+        # page texts for snippets, see text_store.py (not in indexes built before it)
+        texts_path = os.path.join(folder, "texts.bin")
+        self.texts = TextStore(texts_path) if os.path.exists(texts_path) else None
+        # optional, see wildcard.py
+        self.kgram_index = KGramIndex(folder) if os.path.exists(os.path.join(folder, "kgram_dictionary.bin")) else None
+        with open(os.path.join(folder, "final_index.bin"), "rb") as file:
+            self.index_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(file.fileno()).st_size else b""
+
+    # returns (document_ids, tfs) for term, or None if the segment does not have it
+    def postings(self, term):
+        offset = self.term_dictionary.get(term)
+        if offset is None:
+            return None
+        return decode_postings(self.index_map, offset)
+
+    # yields (term, postings, positions) for every term of the segment in sorted order
+    def all_postings(self):
+        for term, offset in self.term_dictionary.items():
+            yield term, decode_postings(self.index_map, offset), decode_positions(self.index_map, offset)
+
+def load_manifest():
+    if not os.path.exists(MANIFEST):
+        return {"next_doc_id": None, "next_segment": 1, "segments": []}
+    with open(MANIFEST, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+def load_tombstones():
+    if not os.path.exists(TOMBSTONES):
+        return set()
+    with open(TOMBSTONES, "r", encoding="utf-8") as file:
+        return set(json.load(file))
+
+# writes to a temporary file first so readers never see half a manifest
+def save_json(path, data):
+    os.makedirs(SEGMENTS_FOLDER, exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(data, file)
+    os.replace(path + ".tmp", path)
+
+# the base segment first, then incremental segments oldest to newest
+def live_segment_folders(manifest=None):
+    manifest = manifest or load_manifest()
+    folders = [BASE_SEGMENT] if os.path.exists("final_index.bin") else []
+    return folders + [os.path.join(SEGMENTS_FOLDER, name) for name in manifest["segments"]]
+
+# documents is a list of (document_id, document_name, webpage, term_freq, term_positions, (title, text)) in id order
+# writes them as a new segment folder and returns its name
+def write_segment(manifest, documents):
+    name = f"segment_{manifest['next_segment']}"
+    manifest["next_segment"] += 1
+    folder = os.path.join(SEGMENTS_FOLDER, name)
+    os.makedirs(folder, exist_ok=True)
+
+    postings = {}
+    document_table = {}
+    doc_norms = {}
+    for document_id, document_name, webpage, term_freq, term_positions, _ in documents:
+        document_table[document_id] = (document_name, webpage)
+        doc_norms[document_id] = indexer.document_norm(term_freq)
+        for token, frequency in term_freq.items():
+            postings.setdefault(token, []).append([document_id, frequency, term_positions.get(token, [])])
+
+    # only tf is stored, search weights it with the counts of every live segment
+    term_offsets = {}
+    norms_path = os.path.join(folder, "doc_norms.bin")
+    write_doc_norms(norms_path, doc_norms)
+    norms = read_doc_norms(norms_path)
+    with open(os.path.join(folder, "final_index.bin"), "wb") as file:
+        for token in sorted(postings):
+            merger.write_term(file, token, postings[token], term_offsets, norms)
+    write_term_dictionary(os.path.join(folder, "term_dictionary.bin"), term_offsets.items(), len(documents))
+    write_document_store(os.path.join(folder, "documents.bin"), document_table)
+    with TextStoreWriter(os.path.join(folder, "texts.bin")) as texts:
+        for document_id, _, _, _, _, page_text in documents:
+            texts.add(document_id, *page_text)
+    return name
+
+# returns {document_name: document_id} of every live document
+def live_documents(manifest, tombstones):
+    documents = {}
+    for folder in live_segment_folders(manifest):
+        for document_id, document_name, _ in DocumentStore(os.path.join(folder, "documents.bin")).items():
+            if document_id not in tombstones:
+                documents[document_name] = document_id
+    return documents
+
+# indexes new or changed json files into one new segment
+# a page whose url is already indexed replaces the old document (the old id gets a tombstone)
+def add_webpages(webpage_paths):
+    with manifest_lock:
+        manifest = load_manifest()
+        tombstones = load_tombstones()
+        documents = live_documents(manifest, tombstones)
+
+        # new ids continue after the full build (ids 0 to total_docs - 1) and every earlier segment
+        next_doc_id = manifest["next_doc_id"]
+        if next_doc_id is None:
+            next_doc_id = IndexSegment(BASE_SEGMENT).total_docs if os.path.exists("final_index.bin") else 0
+
+        new_documents = []
+        for webpage_path in webpage_paths:
+            page = indexer.parse_webpage(webpage_path)
+            if page is None or not page[1]:
+                continue
+            document_name, word_weights, term_positions, _, page_text = page
+            if document_name in documents:
+                tombstones.add(documents[document_name])
+            documents[document_name] = next_doc_id
+            new_documents.append((next_doc_id, document_name, os.path.basename(webpage_path), indexer.normalize_frequencies(word_weights), term_positions, page_text))
+            next_doc_id += 1
+
+        if not new_documents:
+            return None
+        name = write_segment(manifest, new_documents)
+        manifest["segments"].append(name)
+        manifest["next_doc_id"] = next_doc_id
+        save_json(TOMBSTONES, sorted(tombstones))
+        save_json(MANIFEST, manifest)
+        return name
+
+# records tombstones for the documents with these urls
+def delete_documents(document_names):
+    with manifest_lock:
+        manifest = load_manifest()
+        tombstones = load_tombstones()
+        documents = live_documents(manifest, tombstones)
+        for document_name in document_names:
+            if document_name in documents:
+                tombstones.add(documents[document_name])
+        save_json(TOMBSTONES, sorted(tombstones))
+
+# size tier of a segment, segments within a factor of MERGE_FACTOR of each other share a tier
+def size_tier(total_docs):
+    return int(math.log(max(total_docs, 1), MERGE_FACTOR))
+
+# tiered compaction: merges MERGE_FACTOR incremental segments of the same tier into one, dropping tombstoned documents
+# repeats until no tier is full, returns the number of merges
+def compact():
+    merges = 0
+    with manifest_lock:
+        while True:
+            manifest = load_manifest()
+            tiers = {}
+            for name in manifest["segments"]:
+                segment = IndexSegment(os.path.join(SEGMENTS_FOLDER, name))
+                tiers.setdefault(size_tier(segment.total_docs), []).append(segment)
+            full_tiers = [segments for segments in tiers.values() if len(segments) >= MERGE_FACTOR]
+            if not full_tiers:
+                return merges
+            merge_segments(manifest, full_tiers[0][:MERGE_FACTOR])
+            merges += 1
+
+def merge_segments(manifest, segments):
+    tombstones = load_tombstones()
+    term_freqs = {}
+    term_positions = {}
+    documents = {}
+    page_texts = {}
+    for segment in segments:
+        for document_id, document_name, webpage in segment.documents.items():
+            if document_id not in tombstones:
+                documents[document_id] = (document_name, webpage)
+                term_freqs[document_id] = {}
+                term_positions[document_id] = {}
+        if segment.texts is not None:
+            page_texts.update(segment.texts.get_many([document_id for document_id in documents if document_id not in page_texts]))
+        for term, (document_ids, tfs), positions in segment.all_postings():
+            for document_id, tf, posting_positions in zip(document_ids.tolist(), tfs.tolist(), positions):
+                if document_id in term_freqs:
+                    term_freqs[document_id][term] = tf
+                    term_positions[document_id][term] = posting_positions.tolist()
+
+    merged = [(document_id, *documents[document_id], term_freqs[document_id], term_positions[document_id], page_texts.get(document_id, ("", "")))
+              for document_id in sorted(documents)]
+    name = write_segment(manifest, merged)
+
+    # the merged segment takes the place of the oldest segment it replaces, ids stay in order
+    merged_names = [os.path.basename(segment.folder) for segment in segments]
+    position = manifest["segments"].index(merged_names[0])
+    manifest["segments"] = [segment for segment in manifest["segments"] if segment not in merged_names]
+    manifest["segments"].insert(position, name)
+
+    # tombstones of purged documents are no longer needed
+    purged = {document_id for segment in segments for document_id, _, _ in segment.documents.items()}
+    save_json(TOMBSTONES, sorted(tombstones - purged))
+    save_json(MANIFEST, manifest)
+    for folder in merged_names:
+        shutil.rmtree(os.path.join(SEGMENTS_FOLDER, folder), ignore_errors=True)
+
+# runs compact every interval seconds on a daemon thread until the returned event is set
+def start_compactor(interval=COMPACTION_INTERVAL):
+    stop = threading.Event()
+    def run():
+        while not stop.wait(interval):
+            try:
+                compact()
+            except Exception as e:
+                print(f"Error compacting segments: {e}")
+    threading.Thread(target=run, daemon=True).start()
+    return stop
+
+# a full rebuild with indexer.py and merger.py already contains every page, so incremental state is dropped
+# called by merger.merge_partial_indexes, under manifest_lock so no add or compaction in the process writes meanwhile
+def reset():
+    with manifest_lock:
+        shutil.rmtree(SEGMENTS_FOLDER, ignore_errors=True)
+
+if __name__ == '__main__':
+    # python3 segments.py add DEV/<domain>/<page>.json ... | delete <url> ... | compact
+    command, arguments = sys.argv[1], sys.argv[2:]
+    if command == "add":
+        print(f"Added segment {add_webpages(arguments)}")
+    elif command == "delete":
+        delete_documents(arguments)
+    elif command == "compact":
+        print(f"Merged {compact()} times")
@@ -0,0 +1,171 @@
+import sys
+import json
+import time
+import signal
+import asyncio
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+import search
+import metrics
+
+"""
+HTTP/JSON query service
+    GET /search?q=<query>[&timeout=<seconds>]  ->  {"query", "results": [{"url", "file", "title", "snippet"}], "search_ms", "latency_ms"}
+    GET /stats                                 ->  {"postings_cache", "result_cache"} counters of the worker that answers
+    GET /metrics                               ->  stage timers and counters of the worker that answers, as Prometheus text
+
+An asyncio front end parses requests and hands each query to a pool of workers running search.search_with_snippets.
+The index is opened once, when search is imported, before the pool starts: worker threads share its
+memory maps and file handles, worker processes (forked where the platform can fork) inherit them, so the mapped pages are shared too.
+
+HOST and PORT are where the service listens
+WORKERS is the number of queries run at once. DEFAULT: number of cores
+USE_PROCESSES runs queries in worker processes instead of threads, so they are not limited by the GIL. DEFAULT: False
+REQUEST_TIMEOUT is the default number of seconds before a query answers 504
+LOG_REQUESTS prints one line per request with its latency
+"""
+HOST = "127.0.0.1"
+PORT = 8080
+WORKERS = multiprocessing.cpu_count()
+USE_PROCESSES = False
+REQUEST_TIMEOUT = 5.0
+LOG_REQUESTS = True
+
+executor = None
+
+# runs in a worker, returns the results and how long the search took
+def run_query(query):
+    start_time = time.perf_counter()
+    results = search.search_with_snippets(query)
+    return results, (time.perf_counter() - start_time) * 1000
+
+def cache_stats():
+    return {"postings_cache": search.postings_cache.stats(), "result_cache": search.result_cache.stats()}
+
+def metrics_text():
+    return metrics.prometheus_text()
+
+async def handle_search(parameters):
+    query = parameters.get("q", [""])[0].strip()
+    if not query:
+        return 400, {"error": "missing query parameter q"}
+    try:
+        timeout = float(parameters.get("timeout", [REQUEST_TIMEOUT])[0])
+    except ValueError:
+        return 400, {"error": "timeout must be a number of seconds"}
+
+    loop = asyncio.get_running_loop()
+    try:
+        # a query that times out still finishes in its worker, only the response is given up
+        results, search_ms = await asyncio.wait_for(loop.run_in_executor(executor, run_query, query), timeout)
+    except asyncio.TimeoutError:
+        return 504, {"error": f"query took longer than {timeout} seconds", "query": query}
+    return 200, {"query": query, "results": [{"url": url, "file": webpage, "title": title, "snippet": snippet} for url, webpage, title, snippet in results], "search_ms": search_ms}
+
+async def route(target):
+    parts = urlsplit(target)
+    if parts.path == "/search":
+        return await handle_search(parse_qs(parts.query))
+    if parts.path == "/stats":
+        return 200, await asyncio.get_running_loop().run_in_executor(executor, cache_stats)
+    if parts.path == "/metrics":
+        return 200, await asyncio.get_running_loop().run_in_executor(executor, metrics_text)
+    return 404, {"error": f"unknown path {parts.path}"}
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 504: "Gateway Timeout"}
+
+# serves HTTP/1.1 requests on one connection until the client closes it or asks to
+async def handle_connection(reader, writer):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            if "content-length" in headers:
+                await reader.readexactly(int(headers["content-length"]))
+
+            start_time = time.perf_counter()
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            if method == "GET":
+                status, body = await route(target)
+            else:
+                status, body = 405, {"error": "only GET is supported"}
+            latency_ms = (time.perf_counter() - start_time) * 1000
+            if isinstance(body, str):
+                payload = body.encode("utf-8")
+                content_type = "text/plain; version=0.0.4"
+            else:
+                body["latency_ms"] = latency_ms
+                payload = json.dumps(body).encode("utf-8")
+                content_type = "application/json"
+
+            keep_alive = headers.get("connection", "").lower() != "close"
+            writer.write((f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                          f"Content-Type: {content_type}\r\n"
+                          f"Content-Length: {len(payload)}\r\n"
+                          f"X-Latency-Ms: {latency_ms:.3f}\r\n"
+                          f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode("latin-1") + payload)
+            await writer.drain()
+            if LOG_REQUESTS:
+                print(f"{method} {target} {status} {latency_ms:.2f} ms")
+            if not keep_alive:
+                break
+    except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+# serves until the process gets SIGINT (Ctrl-C) or SIGTERM
+async def serve(host=HOST, port=PORT):
+    server = await asyncio.start_server(handle_connection, host, port)
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stopped.set)
+        except NotImplementedError:
+            # Windows event loops have no signal handlers, the plain handler hands the signal to the loop
+            signal.signal(signum, lambda *_: loop.call_soon_threadsafe(stopped.set))
+    async with server:
+        await stopped.wait()
+
+# runs in each worker process, a spawned worker imports search again and would start with the default cache size
+def set_result_cache_entries(max_entries):
+    search.result_cache.max_entries = max_entries
+
+def run(host=HOST, port=PORT, workers=WORKERS, use_processes=USE_PROCESSES):
+    global executor
+    if use_processes:
+        # forked workers inherit the index search opened on import (see search.process_context)
+        executor = ProcessPoolExecutor(workers, mp_context=search.process_context(),
+                                       initializer=set_result_cache_entries, initargs=(search.result_cache.max_entries,))
+        # start every worker now, before the socket is bound, so none of them inherits it
+        for future in [executor.submit(time.sleep, 0.1) for _ in range(workers)]:
+            future.result()
+    else:
+        executor = ThreadPoolExecutor(workers)
+    print(f"Serving search on http://{host}:{port}/search?q=... with {workers} {'processes' if use_processes else 'threads'}", flush=True)
+    try:
+        asyncio.run(serve(host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+if __name__ == '__main__':
+    # python3 server.py [port] [workers] [threads|processes] [quiet] [nocache]
+    # nocache turns the result cache off, so every request runs its query (bench_server.py measures with it)
+    LOG_REQUESTS = "quiet" not in sys.argv
+    if "nocache" in sys.argv:
+        search.result_cache.max_entries = 0
+    run(port=int(sys.argv[1]) if len(sys.argv) > 1 else PORT,
+        workers=int(sys.argv[2]) if len(sys.argv) > 2 else WORKERS,
+        use_processes=len(sys.argv) > 3 and sys.argv[3] == "processes")
@@ -0,0 +1,141 @@
+import os
+import sys
+import mmap
+import time
+import heapq
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from merger import SHARDS_FOLDER, TERM_STATS, shard_folder
+from term_dictionary import TermDictionary
+from segments import IndexSegment
+import search
+import wildcard
+import metrics
+
+"""
+Scatter-gather search over the shards written by merger.merge_shards (SHARD_COUNT > 1)
+
+The coordinator (the process calling search) normalizes the query and weights it with the global df and N
+from the term stats of SHARDS_FOLDER, so every shard scores documents exactly as the unsharded index would.
+Each shard is searched by its own worker process, a local stand-in for a node: it ranks its documents with
+search.rank and sends back its top k with their urls. The coordinator merges the lists of every shard with a heap.
+Shards hold the full build only, incremental segments (segments.py) are not sharded.
+Wildcard patterns (wildcard.py) are expanded by the coordinator against the global term stats, so every shard unions
+the postings of the same terms. The df of a pattern is the number of documents holding any of its terms: shards hold
+disjoint documents, so the coordinator sums the union counts of every shard before weighting the query.
+"""
+
+# coordinator state, set by open_shards
+shard_executors = [] # one single-process executor per shard
+term_stats_dictionary = None # term -> byte offset of its global df in term_stats
+term_stats = b""
+total_docs = 0 # global N
+
+# worker state, the shard this process searches
+shard = None
+
+# worker initializer
+def open_shard(folder):
+    global shard
+    shard = IndexSegment(folder)
+
+def shard_size():
+    return shard.total_docs
+
+# worker side: returns ([(document_id, score, (url, json file))] of the shard's top k, postings bytes read)
+# expansions is {wildcard pattern: [terms]}, expanded by the coordinator
+def search_shard(normalized_query, query_vector, expansions, k):
+    with metrics.timer("shards.search_shard"):
+        query_postings = search.fetch_postings([shard], query_vector, expansions)
+        results = search.rank(normalized_query, query_postings, query_vector, np.zeros(0, dtype=np.int64), k)
+    postings_bytes = sum(postings_list.bytes_read for postings_lists in query_postings.values() for postings_list in postings_lists)
+    return [(document_id, score, shard.documents.get(document_id)) for document_id, score in results], postings_bytes
+
+# worker side: {pattern: number of the shard's documents holding any of its terms} for {pattern: [terms]}
+def shard_pattern_dfs(expansions):
+    return {pattern: sum(postings_list.df for postings_list in search.fetch_wildcard([shard], pattern, terms))
+            for pattern, terms in expansions.items()}
+
+# loads the global term stats and starts a worker process per shard folder
+def open_shards(folder=SHARDS_FOLDER):
+    global shard_executors, term_stats_dictionary, term_stats, total_docs
+    close_shards()
+    term_stats_dictionary = TermDictionary(os.path.join(folder, "term_stats_dictionary.bin"))
+    total_docs = term_stats_dictionary.total_docs
+    with open(os.path.join(folder, "term_stats.bin"), "rb") as file:
+        term_stats = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(file.fileno()).st_size else b""
+
+    shard_count = len([name for name in os.listdir(folder) if name.startswith("shard_")])
+    context = search.process_context()
+    shard_executors = [ProcessPoolExecutor(1, mp_context=context, initializer=open_shard, initargs=(shard_folder(i),))
+                       for i in range(shard_count)]
+    # start every worker now, so the first query does not pay for opening the shards
+    return [executor.submit(shard_size).result() for executor in shard_executors]
+
+def close_shards():
+    for executor in shard_executors:
+        executor.shutdown()
+    shard_executors.clear()
+
+# global document frequency of a term, 0 if no shard has it
+def global_df(term):
+    offset = term_stats_dictionary.get(term)
+    if offset is None:
+        return 0
+    return TERM_STATS.unpack_from(term_stats, offset)[0]
+
+# the terms of every shard a wildcard pattern expands to, with the same caps as on one index (see wildcard.keep_terms)
+# the term stats have no k-gram index, patterns without a literal prefix scan the global vocabulary
+def expand_pattern(pattern):
+    offsets = wildcard.expand_dictionary(term_stats_dictionary, None, pattern, search.tokenizer.stem)
+    return wildcard.keep_terms({term: TERM_STATS.unpack_from(term_stats, offset)[0] for term, offset in offsets})
+
+# global df of every pattern of {pattern: [terms]}, the summed union counts of the shards
+def pattern_dfs(expansions):
+    dfs = dict.fromkeys(expansions, 0)
+    if expansions:
+        futures = [executor.submit(shard_pattern_dfs, expansions) for executor in shard_executors]
+        for future in futures:
+            for pattern, df in future.result().items():
+                dfs[pattern] += df
+    return dfs
+
+# same as search.search, over every shard
+# if stats is a dict it gets the scores of the results and the postings bytes read by all shards
+def search_shards(query, stats=None, k=search.RESULT_COUNT):
+    with metrics.timer("shards.query"):
+        normalized_query = search.normalize_query(query)
+        query_freqs = search.query_frequencies(normalized_query)
+        with metrics.timer("shards.wildcard_expand"):
+            expansions = {pattern: expand_pattern(pattern) for pattern in normalized_query[2]}
+            dfs = pattern_dfs(expansions)
+        dfs.update((token, global_df(token)) for token in query_freqs if token not in dfs)
+        query_vector = search.query_weights(query_freqs, dfs, total_docs)
+
+        # scatter, then gather the top k of every shard
+        futures = [executor.submit(search_shard, normalized_query, query_vector, expansions, k) for executor in shard_executors]
+        shard_results = [future.result() for future in futures]
+        with metrics.timer("shards.gather"):
+            results = heapq.nlargest(k, chain.from_iterable(results for results, _ in shard_results), key=lambda result: result[1])
+    metrics.increment("shards.queries")
+
+    if stats is not None:
+        stats["scores"] = [score for _, score, _ in results]
+        stats["postings_bytes"] = sum(postings_bytes for _, postings_bytes in shard_results)
+    return [document for _, _, document in results]
+
+if __name__ == '__main__':
+    # python3 shards.py [query log, DEFAULT: query_log.txt]
+    # runs every query of the log over the shards and prints the latency percentiles
+    print(f"Opened shards of {open_shards()} documents")
+    latencies = []
+    start_time = time.perf_counter()
+    for query in search.read_query_log(sys.argv[1] if len(sys.argv) > 1 else "query_log.txt"):
+        query_start = time.perf_counter()
+        search_shards(query)
+        latencies.append((time.perf_counter() - query_start) * 1000)
+    elapsed = time.perf_counter() - start_time
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (0.0, 0.0, 0.0)
+    print(f"{len(latencies)} queries: p50 {p50:.2f} ms, p95 {p95:.2f} ms, p99 {p99:.2f} ms, {len(latencies) / elapsed:.1f} queries/s")
+    close_shards()
@@ -0,0 +1,51 @@
+"""
+Banded index of 64-bit Simhashes for near-duplicate lookups
+
+The fingerprint is split into max_distance + 1 blocks. Two hashes that differ in at most
+max_distance bits cannot differ in every block, so they share at least one block exactly
+(pigeonhole). Each block has its own table of block value -> hashes, and a lookup only
+compares against the hashes that share a block instead of every hash seen so far.
+"""
+HASH_BITS = 64
+
+class SimhashIndex:
+    def __init__(self, max_distance, hash_bits=HASH_BITS):
+        self.max_distance = max_distance
+        self.hashes = set()
+
+        # (shift, mask) of each block, blocks cover all hash_bits
+        block_count = max_distance + 1
+        self.blocks = []
+        start = 0
+        for i in range(block_count):
+            width = hash_bits // block_count + (1 if i < hash_bits % block_count else 0)
+            self.blocks.append((start, (1 << width) - 1))
+            start += width
+        self.tables = [{} for _ in self.blocks]
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __contains__(self, current_hash):
+        return current_hash in self.hashes
+
+    # returns True if a hash within max_distance bits of current_hash was added
+    def has_near(self, current_hash):
+        if current_hash in self.hashes:
+            return True
+        checked = set()
+        for (shift, mask), table in zip(self.blocks, self.tables):
+            for old_hash in table.get((current_hash >> shift) & mask, ()):
+                if old_hash in checked:
+                    continue
+                checked.add(old_hash)
+                if bin(current_hash ^ old_hash).count('1') <= self.max_distance:
+                    return True
+        return False
+
+    def add(self, current_hash):
+        if current_hash in self.hashes:
+            return
+        self.hashes.add(current_hash)
+        for (shift, mask), table in zip(self.blocks, self.tables):
+            table.setdefault((current_hash >> shift) & mask, []).append(current_hash)
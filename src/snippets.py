@@ -0,0 +1,103 @@
+import re
+from html import escape
+from fnmatch import fnmatchcase
+from tokenizer import TOKEN_PATTERN, SYNONYM_MAP
+from wildcard import term_matcher
+
+"""
+Result snippets: the part of a page's text (see text_store.py) with the most query words, query words highlighted
+
+Only words that can stem to a query word are stemmed: a stem keeps the first letters of its word,
+so one regular expression finds the few words starting like a query word and the rest of the text is skipped.
+The snippet is the window of SNIPPET_CHARS characters with the most distinct query words, then the most matches.
+
+SNIPPET_CHARS is the length of a snippet before it is cut at word boundaries. DEFAULT: 200
+HIGHLIGHT is what a query word is wrapped in, the rest of the snippet is escaped as HTML. DEFAULT: <b></b>
+"""
+SNIPPET_CHARS = 200
+HIGHLIGHT = ("<b>", "</b>")
+
+PREFIX_CHARS = 2 # letters a word shares with its stem, the words of the tokenizer are 3 or more
+
+# returns a function mapping a page's text to its snippet for the stemmed query words and wildcard patterns
+def snippet_builder(tokenizer, stems, patterns=()):
+    stems = set(stems)
+    matchers = [(pattern, term_matcher(pattern, tokenizer.stem)) for pattern in patterns]
+    prefixes = {stem[:PREFIX_CHARS] for stem in stems} | {pattern[:PREFIX_CHARS] for pattern in patterns}
+    # synonyms are matched on the word itself, "cs" becomes "compsci" before stemming
+    synonyms = {word for word, synonym in SYNONYM_MAP.items() if tokenizer.stem(synonym) in stems}
+    if any(not pattern[:PREFIX_CHARS].isalnum() for pattern in patterns):
+        candidates = TOKEN_PATTERN # a pattern starting with a wildcard can match any word
+    elif prefixes or synonyms:
+        alternatives = sorted(map(re.escape, prefixes | synonyms))
+        candidates = re.compile(r'(?<![a-zA-Z0-9])(?:' + "|".join(alternatives) + r')[a-zA-Z0-9]*', re.IGNORECASE)
+    else:
+        candidates = None
+
+    # returns the query word a word of the page stands for, or None
+    def query_word(word):
+        token = word.lower()
+        token = SYNONYM_MAP.get(token, token)
+        if len(token) <= 2 or (token.isdigit() and len(token) > 5):
+            return None
+        stem = tokenizer.stem(token)
+        if stem in stems:
+            return stem
+        # the word itself matches a pattern, or its stem is a term the pattern expands to
+        return next((pattern for pattern, matches in matchers if fnmatchcase(token, pattern) or matches(stem)), None)
+
+    def build(text):
+        matches = [] # (start, end, query word) of every query word in text
+        if candidates is not None:
+            for match in candidates.finditer(text):
+                word = query_word(match.group())
+                if word is not None:
+                    matches.append((match.start(), match.end(), word))
+        start, end = best_window(text, matches)
+        return highlight(text, start, end, matches)
+
+    return build
+
+# (start, end) of the SNIPPET_CHARS long window of text with the most distinct query words, then the most matches
+def best_window(text, matches):
+    best = (0, 0, 0) # distinct words, matches, start
+    window_words = {}
+    first = 0
+    for last, (start, end, word) in enumerate(matches):
+        window_words[word] = window_words.get(word, 0) + 1
+        while matches[first][0] < end - SNIPPET_CHARS:
+            first_word = matches[first][2]
+            window_words[first_word] -= 1
+            if not window_words[first_word]:
+                del window_words[first_word]
+            first += 1
+        score = (len(window_words), last - first + 1)
+        if score > best[:2]:
+            best = (*score, matches[first][0])
+
+    start = best[2]
+    if start:
+        # center the matches in the window, then cut at word boundaries
+        covered = max(end for match_start, end, _ in matches if start <= match_start < start + SNIPPET_CHARS) - start
+        start = max(start - (SNIPPET_CHARS - covered) // 2, 0)
+        while 0 < start < len(text) and text[start - 1].isalnum() and text[start].isalnum():
+            start += 1
+    end = min(start + SNIPPET_CHARS, len(text))
+    while start < end < len(text) and text[end - 1].isalnum() and text[end].isalnum():
+        end -= 1
+    if end == start:
+        end = min(start + SNIPPET_CHARS, len(text))
+    return start, end
+
+# the text between start and end, escaped, with the query words in it highlighted and ... where text was cut
+def highlight(text, start, end, matches):
+    parts = []
+    position = start
+    for match_start, match_end, _ in matches:
+        if match_start < start or match_end > end:
+            continue
+        parts += (escape(text[position:match_start]), HIGHLIGHT[0], escape(text[match_start:match_end]), HIGHLIGHT[1])
+        position = match_end
+    parts.append(escape(text[position:end]))
+    # spaces at the cuts are dropped so "..." is always one space away from the text
+    return ("... " if start else "") + "".join(parts).strip() + (" ..." if end < len(text) else "")
@@ -0,0 +1,157 @@
+import mmap
+import struct
+import numpy as np
+from index_format import write_varint
+
+"""
+Sorted term dictionary (term_dictionary.bin), maps every term to the byte offset of its postings in final_index.bin
+
+    header      : number of terms, number of blocks, total documents, position of the block table   (DICT_HEADER)
+    blocks      : TERMS_PER_BLOCK terms each, front coded against the previous term of the block
+                  per term: varint shared prefix length, varint suffix length, suffix (utf-8),
+                  varint postings offset (the first term of a block stores it whole, the others as a delta)
+    block table : uint64 byte position of every block
+
+The first term of each block is stored whole, so a lookup binary searches the block table by reading
+those first terms straight from the memory map, then scans one block. Nothing is loaded at startup,
+so opening a dictionary is instant and memory does not grow with the vocabulary.
+Terms are compared as utf-8 bytes, which sort the same way as python strings.
+"""
+TERMS_PER_BLOCK = 16
+
+DICT_HEADER = struct.Struct("<IIIQ")
+
+# returns (value, position after the varint) of the varint at position in buf
+def read_varint(buf, position):
+    value = 0
+    shift = 0
+    while True:
+        byte = buf[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+# terms is an iterable of (term, postings offset) in sorted term order
+def write_term_dictionary(path, terms, total_docs):
+    with open(path, "wb") as file:
+        file.write(DICT_HEADER.pack(0, 0, 0, 0)) # rewritten once the counts are known
+        block_positions = []
+        block = bytearray()
+        term_count = 0
+        previous_term = b""
+        previous_offset = 0
+        for term, offset in terms:
+            term = term.encode("utf-8")
+            if term_count % TERMS_PER_BLOCK == 0:
+                file.write(block)
+                block = bytearray()
+                block_positions.append(file.tell())
+                previous_term = b""
+                previous_offset = 0
+            shared = 0
+            limit = min(len(term), len(previous_term))
+            while shared < limit and term[shared] == previous_term[shared]:
+                shared += 1
+            write_varint(block, shared)
+            write_varint(block, len(term) - shared)
+            block += term[shared:]
+            write_varint(block, offset - previous_offset)
+            previous_term = term
+            previous_offset = offset
+            term_count += 1
+        file.write(block)
+
+        table_position = file.tell()
+        file.write(np.array(block_positions, dtype="<u8").tobytes())
+        file.seek(0)
+        file.write(DICT_HEADER.pack(term_count, len(block_positions), total_docs, table_position))
+
+# read-only view of a term dictionary through mmap
+class TermDictionary:
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.term_count, self.block_count, self.total_docs, table_position = DICT_HEADER.unpack_from(self.map, 0)
+        self.block_positions = np.frombuffer(self.map, dtype="<u8", count=self.block_count, offset=table_position)
+
+    def __len__(self):
+        return self.term_count
+
+    def __contains__(self, term):
+        return self.get(term) is not None
+
+    # first term of a block, stored whole
+    def first_term(self, block):
+        position = int(self.block_positions[block])
+        _, position = read_varint(self.map, position)
+        length, position = read_varint(self.map, position)
+        return self.map[position:position + length]
+
+    # yields (term as utf-8 bytes, postings offset) of every term in a block
+    def read_block(self, block):
+        position = int(self.block_positions[block])
+        term = b""
+        offset = 0
+        for _ in range(min(TERMS_PER_BLOCK, self.term_count - block * TERMS_PER_BLOCK)):
+            shared, position = read_varint(self.map, position)
+            length, position = read_varint(self.map, position)
+            term = term[:shared] + self.map[position:position + length]
+            position += length
+            delta, position = read_varint(self.map, position)
+            offset += delta
+            yield term, offset
+
+    # index of the last block whose first term is <= term (utf-8 bytes), -1 if term sorts before every block
+    def find_block(self, term):
+        low, high = 0, self.block_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.first_term(middle) <= term:
+                low = middle + 1
+            else:
+                high = middle
+        return low - 1
+
+    # returns the postings offset of term, or None if the dictionary does not have it
+    def get(self, term):
+        term = term.encode("utf-8")
+        block = self.find_block(term)
+        if block < 0:
+            return None
+        for block_term, offset in self.read_block(block):
+            if block_term == term:
+                return offset
+            if block_term > term:
+                return None
+        return None
+
+    # yields (term, postings offset) of every term starting with prefix, in sorted order
+    # one binary search for the first block, then only the blocks holding matches: O(log V + matches)
+    def prefix_items(self, prefix):
+        prefix = prefix.encode("utf-8")
+        for block in range(max(self.find_block(prefix), 0), self.block_count):
+            for term, offset in self.read_block(block):
+                if term < prefix:
+                    continue
+                if not term.startswith(prefix):
+                    return
+                yield term.decode("utf-8"), offset
+
+    # yields (term, postings offset) of the terms at sorted ordinals (a term's ordinal is its rank in sorted order)
+    def terms_at(self, ordinals):
+        block = -1
+        terms = []
+        for ordinal in ordinals:
+            if ordinal // TERMS_PER_BLOCK != block:
+                block = ordinal // TERMS_PER_BLOCK
+                terms = list(self.read_block(block))
+            term, offset = terms[ordinal % TERMS_PER_BLOCK]
+            yield term.decode("utf-8"), offset
+
+    # yields (term, postings offset) of every term in sorted order
+    def items(self):
+        for block in range(self.block_count):
+            for term, offset in self.read_block(block):
+                yield term.decode("utf-8"), offset
@@ -0,0 +1,31 @@
+from document_store import DocumentStore, write_document_store, read_total_docs
+
+"""
+Round-trip tests of the document table, run with: python -m pytest
+"""
+
+DOCUMENTS = {3: ("https://www.ics.uci.edu/", "a.json"), 4: ("https://ics.uci.edu/é", "b.json"), 9: ("https://uci.edu/", "c.json")}
+
+def test_documents_round_trip(tmp_path):
+    path = tmp_path / "documents.bin"
+    write_document_store(path, DOCUMENTS)
+    store = DocumentStore(path)
+    assert len(store) == read_total_docs(path) == len(DOCUMENTS)
+    assert all(store.get(document_id) == document for document_id, document in DOCUMENTS.items())
+    assert list(store.items()) == [(document_id, *document) for document_id, document in sorted(DOCUMENTS.items())]
+
+# ids in the gaps and outside the table have no document
+def test_missing_documents(tmp_path):
+    path = tmp_path / "documents.bin"
+    write_document_store(path, DOCUMENTS)
+    store = DocumentStore(path)
+    for document_id in (0, 2, 5, 8, 10, 2 ** 31):
+        assert store.get(document_id) is None
+
+def test_empty_table(tmp_path):
+    path = tmp_path / "documents.bin"
+    write_document_store(path, {})
+    store = DocumentStore(path)
+    assert len(store) == 0
+    assert store.get(0) is None
+    assert list(store.items()) == []
@@ -0,0 +1,33 @@
+from extractor import extract_fields
+
+"""
+Tests of the single-pass field extraction, run with: python -m pytest
+"""
+
+def test_fields():
+    fields = extract_fields('<html><head><title>Main</title><title>Other</title></head><body>'
+                            '<h1>Head <b>bold</b></h1><a href="/x">link</a><a>no target</a><p>text</p></body></html>')
+    assert fields["title"] == ["Main"]
+    assert fields["heading"] == ["Head bold"]
+    assert fields["bold"] == ["bold"]
+    assert fields["anchor"] == ["link"]
+    assert fields["body"] == ["MainOtherHead boldlinkno targettext"]
+
+def test_scripts_and_styles_are_skipped():
+    fields = extract_fields("<html><body>before<script>var x;</script>after<style>p {}</style>end</body></html>")
+    assert fields["body"] == ["beforeafterend"]
+
+# the text after a comment is page text, inside an element and between elements
+def test_text_after_comments():
+    fields = extract_fields("<html><body><p>alpha<!-- c --> beta gamma</p><!-- between --><p>delta</p>"
+                            "<b>x<!-- y -->z</b><script>a<!-- q -->b</script>after</body></html>")
+    assert fields["body"] == ["alpha beta gammadeltaxzafter"]
+    assert fields["bold"] == ["xz"]
+
+def test_text_after_processing_instructions():
+    fields = extract_fields("<html><body><p>alpha<?php echo 1; ?> beta</p></body></html>")
+    assert fields["body"] == ["alpha beta"]
+
+def test_pages_without_text():
+    assert extract_fields("") is None
+    assert extract_fields("<html><body><script>x</script></body></html>") is None
@@ -0,0 +1,76 @@
+import numpy as np
+from index_format import (BLOCK_SIZE, TF_SCALE, write_varint, decode_varints, encode_postings, decode_postings,
+                          read_directory, decode_block, decode_positions, write_doc_norms, read_doc_norms)
+
+"""
+Round-trip tests of the postings format, run with: python -m pytest
+"""
+
+# values at the edges of the 7-bit groups, up to the largest document id
+def test_varints_round_trip():
+    values = [0, 1, 127, 128, 255, 16383, 16384, 2 ** 21 - 1, 2 ** 21, 2 ** 32 - 1]
+    buf = bytearray()
+    for value in values:
+        write_varint(buf, value)
+    assert decode_varints(bytes(buf)).tolist() == values
+    assert len(decode_varints(b"")) == 0
+
+def test_varint_lengths():
+    for value, length in ((0, 1), (127, 1), (128, 2), (16383, 2), (16384, 3), (2 ** 32 - 1, 5)):
+        buf = bytearray()
+        write_varint(buf, value)
+        assert len(buf) == length
+
+# a record with a partial last block, gaps past one varint byte and repeated positions
+def make_record(df=2 * BLOCK_SIZE + 5):
+    rng = np.random.default_rng(121)
+    document_ids = np.cumsum(rng.integers(1, 300, size=df)).tolist()
+    tfs = (rng.integers(1, 10000, size=df) / TF_SCALE).tolist()
+    postings = list(zip(document_ids, tfs))
+    weights = rng.random(df).astype(np.float32).tolist()
+    positions = [sorted(rng.choice(5000, size=int(rng.integers(1, 6)), replace=False).tolist()) for _ in range(df)]
+    return postings, weights, positions, encode_postings(postings, weights, positions)
+
+def test_postings_round_trip():
+    postings, _, _, record = make_record()
+    buf = b"padding" + record # records are read at an offset in final_index.bin
+    document_ids, tfs = decode_postings(buf, 7)
+    assert document_ids.tolist() == [document_id for document_id, _ in postings]
+    assert np.allclose(tfs, [tf for _, tf in postings], atol=0.5 / TF_SCALE)
+
+def test_positions_round_trip():
+    postings, _, positions, record = make_record()
+    decoded = decode_positions(record, 0)
+    assert len(decoded) == len(postings)
+    assert [posting_positions.tolist() for posting_positions in decoded] == positions
+
+# the directory bounds every block by its last document id and highest weight, and each block decodes on its own
+def test_block_max_directory():
+    postings, weights, _, record = make_record()
+    df, directory = read_directory(record, 0)
+    assert df == len(postings)
+    assert len(directory) == -(-df // BLOCK_SIZE)
+    document_ids, tfs = [], []
+    for block in range(len(directory)):
+        block_ids, block_tfs = decode_block(record, 0, df, directory, block)
+        block_postings = postings[block * BLOCK_SIZE:(block + 1) * BLOCK_SIZE]
+        assert int(directory["last_document_id"][block]) == block_postings[-1][0] == block_ids[-1]
+        assert directory["max_weight"][block] == np.float32(max(weights[block * BLOCK_SIZE:(block + 1) * BLOCK_SIZE]))
+        document_ids += block_ids.tolist()
+        tfs += block_tfs.tolist()
+    assert document_ids == [document_id for document_id, _ in postings]
+    assert np.allclose(tfs, [tf for _, tf in postings], atol=0.5 / TF_SCALE)
+
+def test_single_posting():
+    record = encode_postings([(2 ** 32 - 1, 100.0)], [1.0], [[0]])
+    document_ids, tfs = decode_postings(record, 0)
+    assert document_ids.tolist() == [2 ** 32 - 1]
+    assert tfs.tolist() == [100.0]
+    assert [positions.tolist() for positions in decode_positions(record, 0)] == [[0]]
+
+def test_doc_norms_round_trip(tmp_path):
+    path = tmp_path / "doc_norms.bin"
+    write_doc_norms(path, {5: 1.5, 7: 2.25})
+    first_document_id, norms = read_doc_norms(path)
+    assert first_document_id == 5
+    assert norms.tolist() == [1.5, 0.0, 2.25]
@@ -0,0 +1,25 @@
+import os
+from conftest import write_pages
+
+"""
+Tests of the indexer's document ids, run with: python -m pytest
+"""
+
+PAGES = [
+    ("https://www.ics.uci.edu/zoo#lions", "<html><title>Lions</title> <body><p>zebra lions savanna hunt pride</p></body></html>"),
+    ("https://www.ics.uci.edu/zoo#zebras", "<html><title>Zebras</title> <body><p>zebra stripes grass herd river crossing</p></body></html>"),
+    ("https://www.ics.uci.edu/farm", "<html><title>Farm</title> <body><p>zebra cows barn tractor field harvest</p></body></html>"),
+    ("https://www.ics.uci.edu/lake", "<html><title>Lake</title> <body><p>boats fishing docks swimming canoe trout</p></body></html>"),
+]
+
+# pages differing only by #fragment are one url: the first one is indexed, the others are skipped
+def test_repeated_url_gets_one_document(tmp_path, build_index, open_index):
+    for workers in (1, 2):
+        folder = os.path.join(tmp_path, f"workers_{workers}")
+        build_index(folder, write_pages(folder, PAGES), workers=workers)
+        search = open_index(folder)
+        results = search.search("zebra")
+        assert sorted(url for url, _ in results) == ["https://www.ics.uci.edu/farm", "https://www.ics.uci.edu/zoo"]
+        assert search.search("lions") and not search.search("stripes")
+        state = search.refresh_segments()
+        assert state[2] == 3
@@ -0,0 +1,22 @@
+import io
+import numpy as np
+import pytest
+from merger import encode_term
+
+"""
+Tests of the merger's term records, run with: python -m pytest
+"""
+
+NORMS = (0, np.ones(4, dtype=np.float32))
+
+def test_encode_term_offsets():
+    file = io.BytesIO()
+    file.write(b"header")
+    term_offsets = {}
+    encode_term(file, "zebra", [[2, 50.0, [1]], [0, 20.0, [3]]], term_offsets, NORMS)
+    assert term_offsets == {"zebra": 6}
+
+# a document id twice in a term's postings would count the document twice
+def test_encode_term_rejects_repeated_documents():
+    with pytest.raises(ValueError):
+        encode_term(io.BytesIO(), "zebra", [[1, 50.0, [1]], [1, 20.0, [3]]], {}, NORMS)
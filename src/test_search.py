@@ -0,0 +1,62 @@
+import os
+import pytest
+from conftest import write_pages
+from search import read_query_log
+
+"""
+Tests of search, run with: python -m pytest
+"""
+
+SRC_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+def test_read_query_log(tmp_path):
+    path = tmp_path / "queries.txt"
+    path.write_text("# a comment\n\nics honors program\n  machine learning  # a note\n#\nfall 2023\n", encoding="utf-8")
+    assert list(read_query_log(path)) == ["ics honors program", "machine learning", "fall 2023"]
+
+# query_log.txt holds the query lists of TEST.txt and none of its notes
+def test_query_log_matches_test_report():
+    with open(os.path.join(SRC_FOLDER, "..", "TEST.txt"), "r", encoding="utf-8") as file:
+        report = file.read().split("General query improvements:")[0]
+    listed = []
+    for line in report.splitlines():
+        # the lists hold queries, optionally followed by " - " and a note, prose lines are indented or sentences
+        if line.strip() and not line[0].isspace() and not line.rstrip().endswith((":", ".")):
+            listed.append(line.split(" - ")[0].strip())
+    queries = list(read_query_log(os.path.join(SRC_FOLDER, "query_log.txt")))
+    assert queries == list(dict.fromkeys(listed))
+    assert not any(query.endswith(".") or len(query.split()) > 5 for query in queries)
+
+PHRASE_PAGES = [
+    ("https://www.ics.uci.edu/exact", "<html><title>Exact</title> <body><p>machine learning models train on data</p></body></html>"),
+    ("https://www.ics.uci.edu/gap", "<html><title>Gap</title> <body><p>machine vision meets deep learning models</p></body></html>"),
+    ("https://www.ics.uci.edu/reversed", "<html><title>Reversed</title> <body><p>learning machine models train on data</p></body></html>"),
+    ("https://www.ics.uci.edu/lake", "<html><title>Lake</title> <body><p>boats fishing docks swimming canoe trout</p></body></html>"),
+    ("https://www.ics.uci.edu/farm", "<html><title>Farm</title> <body><p>cows barn tractor field harvest hay</p></body></html>"),
+]
+
+@pytest.fixture(scope="module")
+def phrase_folder(tmp_path_factory, build_index):
+    folder = str(tmp_path_factory.mktemp("phrases"))
+    return build_index(folder, write_pages(folder, PHRASE_PAGES))
+
+def urls(results):
+    return [url.rsplit("/", 1)[1] for url, _ in results]
+
+# a quoted phrase needs its words in order, ~N allows N other words between them
+def test_phrase_queries(phrase_folder, open_index):
+    search = open_index(phrase_folder)
+    assert urls(search.search('"machine learning"')) == ["exact"]
+    assert urls(search.search('"learning machine"')) == ["reversed"]
+    assert urls(search.search('"machine learning"~2')) == ["exact"]
+    assert sorted(urls(search.search('"machine learning"~3'))) == ["exact", "gap"]
+    assert urls(search.search('"machine learning models"')) == ["exact"]
+    assert urls(search.search('"models machine"')) == []
+    assert sorted(urls(search.search('"learning models"'))) == ["exact", "gap"]
+
+# without quotes every page with the words matches, the one with them next to each other ranks first
+def test_adjacent_words_rank_first(phrase_folder, open_index):
+    search = open_index(phrase_folder)
+    results = urls(search.search("machine learning"))
+    assert sorted(results) == ["exact", "gap", "reversed"]
+    assert results[0] == "exact"
@@ -0,0 +1,84 @@
+import os
+import json
+import pytest
+import segments
+from conftest import write_pages
+
+"""
+Tests of incremental segments, run with: python -m pytest
+"""
+
+PAGES = [
+    ("https://www.ics.uci.edu/zoo", "<html><title>Zoo</title> <body><p>zebra lions savanna hunt pride</p></body></html>"),
+    ("https://www.ics.uci.edu/farm", "<html><title>Farm</title> <body><p>cows barn tractor field harvest</p></body></html>"),
+    ("https://www.ics.uci.edu/lake", "<html><title>Lake</title> <body><p>boats fishing docks swimming canoe trout</p></body></html>"),
+    ("https://www.ics.uci.edu/city", "<html><title>City</title> <body><p>streets traffic buses towers parks</p></body></html>"),
+]
+
+@pytest.fixture
+def index_folder(tmp_path, build_index):
+    folder = str(tmp_path)
+    build_index(folder, write_pages(folder, PAGES))
+    return folder
+
+# writes a page as a json file of the DEV layout and returns its path
+def write_page(folder, name, url, text):
+    os.makedirs(os.path.join(folder, "new"), exist_ok=True)
+    path = os.path.join(folder, "new", name + ".json")
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({"url": url, "content": f"<html><title>{name}</title> <body><p>{text}</p></body></html>", "encoding": "utf-8"}, file)
+    return path
+
+def urls(results):
+    return sorted(url.rsplit("/", 1)[1] for url, _ in results)
+
+# added pages are found on the next query, a page with an indexed url replaces the old document
+def test_add_and_replace(index_folder, open_index):
+    search = open_index(index_folder)
+    segments.add_webpages([write_page(index_folder, "safari", "https://www.ics.uci.edu/safari", "zebra safari jeep dust")])
+    assert urls(search.search("safari")) == ["safari"]
+    assert urls(search.search("zebra")) == ["safari", "zoo"]
+
+    segments.add_webpages([write_page(index_folder, "farm", "https://www.ics.uci.edu/farm", "orchard apples tractor")])
+    assert urls(search.search("cows")) == []
+    assert urls(search.search("tractor orchard")) == ["farm"]
+    assert search.refresh_segments()[2] == 5
+
+def test_delete(index_folder, open_index):
+    search = open_index(index_folder)
+    segments.add_webpages([write_page(index_folder, "pier", "https://www.ics.uci.edu/pier", "boats pier gulls")])
+    segments.delete_documents(["https://www.ics.uci.edu/lake", "https://www.ics.uci.edu/missing"])
+    assert urls(search.search("boats")) == ["pier"]
+    assert urls(search.search("trout")) == []
+    segments.delete_documents(["https://www.ics.uci.edu/pier"])
+    assert urls(search.search("boats")) == []
+    assert search.refresh_segments()[2] == 3
+
+# compaction merges a full tier into one segment and purges tombstoned documents, results stay the same
+def test_compact(index_folder, open_index):
+    search = open_index(index_folder)
+    for i, text in enumerate(["zebra safari jeep", "volcano lava ash", "harbor boats ferry", "safari camp tents"]):
+        segments.add_webpages([write_page(index_folder, f"page_{i}", f"https://www.ics.uci.edu/page_{i}", text)])
+    segments.delete_documents(["https://www.ics.uci.edu/page_1"])
+    queries = ["zebra", "safari", "boats", "lava", "tractor"]
+    before = [(search.search(query, stats), stats["scores"]) for query, stats in ((query, {}) for query in queries)]
+
+    assert segments.compact() == 1
+    assert len(segments.load_manifest()["segments"]) == 1
+    assert segments.load_tombstones() == set()
+    after = [(search.search(query, stats), stats["scores"]) for query, stats in ((query, {}) for query in queries)]
+    for (results, scores), (compacted_results, compacted_scores) in zip(before, after):
+        assert compacted_results == results
+        # the merged segment's norms come from the tfs stored with 2 decimals, not the page's own
+        assert compacted_scores == pytest.approx(scores, rel=1e-3)
+    assert urls(search.search("lava")) == []
+
+# a full rebuild holds every page, the incremental segments and tombstones are dropped
+def test_rebuild_drops_segments(index_folder, build_index, open_index):
+    search = open_index(index_folder)
+    segments.add_webpages([write_page(index_folder, "safari", "https://www.ics.uci.edu/safari", "zebra safari jeep dust")])
+    segments.delete_documents(["https://www.ics.uci.edu/lake"])
+    build_index(index_folder, "pages.jsonl")
+    assert not os.path.exists(segments.SEGMENTS_FOLDER)
+    assert urls(search.search("safari")) == []
+    assert urls(search.search("trout")) == ["lake"]
@@ -0,0 +1,54 @@
+import os
+import pytest
+import shards
+from search import read_query_log
+from corpus_generator import generate_corpus
+
+"""
+Tests of sharded search against the unsharded index, run with: python -m pytest
+"""
+
+PAGE_COUNT = 300
+QUERY_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_log.txt")
+
+# one index built both ways: final_index.bin in the folder and 3 shards under shards/
+@pytest.fixture(scope="module")
+def sharded_folder(tmp_path_factory, build_index):
+    folder = tmp_path_factory.mktemp("sharded")
+    generate_corpus(folder, PAGE_COUNT)
+    return build_index(folder, "DEV", shards=3)
+
+# search on the unsharded index, with the shards open, from the folder (shard folders are relative paths)
+@pytest.fixture(scope="module")
+def sharded_search(sharded_folder):
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(sharded_folder)
+        import search
+        search.refresh_segments()
+        monkeypatch.setattr(search.result_cache, "max_entries", 0)
+        shards.open_shards()
+        yield search
+        shards.close_shards()
+
+# the same results in the same order, with the same scores
+def assert_same_ranking(search, query, allow_empty=False):
+    stats, sharded_stats = {}, {}
+    results = search.search(query, stats)
+    sharded_results = shards.search_shards(query, sharded_stats)
+    assert results or allow_empty
+    assert [tuple(result) for result in sharded_results] == [tuple(result) for result in results]
+    assert sharded_stats["scores"] == pytest.approx(stats["scores"])
+
+@pytest.mark.parametrize("query", ["comput* science", "scien?e", "*ing data", 'prog* "machine learning"'])
+def test_wildcard_queries_match_unsharded(sharded_search, query):
+    assert_same_ranking(sharded_search, query)
+
+@pytest.mark.parametrize("query", ["machine learning", "ics", "computer science research", "honors program student",
+                                   '"artificial intelligence"', '"data science"~2'])
+def test_queries_match_unsharded(sharded_search, query):
+    assert_same_ranking(sharded_search, query)
+
+# every query of the query log, some of which find nothing in the synthetic corpus
+def test_query_log_matches_unsharded(sharded_search):
+    for query in read_query_log(QUERY_LOG):
+        assert_same_ranking(sharded_search, query, allow_empty=True)
@@ -0,0 +1,58 @@
+import re
+import pytest
+import snippets
+from snippets import snippet_builder
+from tokenizer import Tokenizer
+
+"""
+Tests of result snippets, run with: python -m pytest
+"""
+
+tokenizer = Tokenizer()
+
+def build_snippet(query, text, patterns=()):
+    return snippet_builder(tokenizer, tokenizer.stems(query), patterns)(text)
+
+# the words of a snippet without its highlighting and ellipses
+def snippet_words(snippet):
+    return re.sub(r'</?b>|\.\.\.', " ", snippet).split()
+
+def test_highlights_words_stemming_to_query_words():
+    assert build_snippet("machine learning", "Machines and learning are fun.") == "<b>Machines</b> and <b>learning</b> are fun."
+    # a word only starting like a query word is not one
+    assert build_snippet("learning", "Learners learn.") == "Learners <b>learn</b>."
+
+def test_highlights_synonyms_and_patterns():
+    assert build_snippet("cs", "CS and computer science") == "<b>CS</b> and computer science"
+    assert build_snippet("", "Computing and computers, not compost", ["comput*"]) == "<b>Computing</b> and <b>computers</b>, not compost"
+    assert build_snippet("", "Some computer parts", ["*uter"]) == "Some <b>computer</b> parts"
+
+# the page text is escaped as HTML, only the highlighting is markup
+def test_escapes_text():
+    snippet = build_snippet("data", "<script>alert('data')</script> & data")
+    assert snippet == "&lt;script&gt;alert(&#x27;<b>data</b>&#x27;)&lt;/script&gt; &amp; <b>data</b>"
+
+FILLER = " ".join(f"filler{i}" for i in range(60))
+
+# the window with the most distinct query words wins over one with more matches of a single word
+def test_window_with_most_query_words():
+    text = "machine " * 5 + FILLER + " machine learning at the end. " + FILLER
+    snippet = build_snippet("machine learning", text)
+    assert snippet.startswith("... ") and snippet.endswith(" ...")
+    assert "<b>machine</b> <b>learning</b>" in snippet
+    assert len(snippet) <= snippets.SNIPPET_CHARS + len("... <b></b><b></b> ...")
+
+# a window is cut at word boundaries, no word of the snippet is cut off
+def test_window_cut_at_words():
+    text = FILLER + " learning " + FILLER
+    snippet = build_snippet("learning", text)
+    words = set(text.split())
+    assert all(word in words for word in snippet_words(snippet))
+    assert "<b>learning</b>" in snippet
+
+@pytest.mark.parametrize("text", ["", "short text", FILLER])
+def test_without_matches_starts_at_the_beginning(text):
+    snippet = build_snippet("zebra", text)
+    assert "<b>" not in snippet and not snippet.startswith("...")
+    assert snippet.rstrip(" .") == text[:len(snippet.rstrip(" ."))]
+    assert snippet.endswith(" ...") == (len(text) > snippets.SNIPPET_CHARS)
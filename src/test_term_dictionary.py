@@ -0,0 +1,50 @@
+from term_dictionary import TERMS_PER_BLOCK, TermDictionary, write_term_dictionary
+
+"""
+Round-trip tests of the front-coded term dictionary, run with: python -m pytest
+"""
+
+# three and a half blocks of terms sharing long prefixes, offsets growing by more than one varint byte
+TERMS = sorted({f"term{i:03d}" for i in range(3 * TERMS_PER_BLOCK + 8)} | {"zebra", "zébra"})
+OFFSETS = {term: i * 1000 for i, term in enumerate(TERMS)}
+
+def open_dictionary(tmp_path):
+    path = tmp_path / "term_dictionary.bin"
+    write_term_dictionary(path, ((term, OFFSETS[term]) for term in TERMS), 42)
+    return TermDictionary(path)
+
+def test_lookup(tmp_path):
+    dictionary = open_dictionary(tmp_path)
+    assert len(dictionary) == len(TERMS)
+    assert dictionary.total_docs == 42
+    assert all(dictionary.get(term) == OFFSETS[term] for term in TERMS)
+    assert list(dictionary.items()) == [(term, OFFSETS[term]) for term in TERMS]
+
+# the last term of a block and the first term of the next one are found from the block table
+def test_lookup_across_block_boundary(tmp_path):
+    dictionary = open_dictionary(tmp_path)
+    for block in range(1, 4):
+        for term in TERMS[block * TERMS_PER_BLOCK - 1:block * TERMS_PER_BLOCK + 1]:
+            assert dictionary.get(term) == OFFSETS[term]
+            assert term in dictionary
+
+def test_missing_terms(tmp_path):
+    dictionary = open_dictionary(tmp_path)
+    for term in ("", "a", "term", "term0155", "term9", "zz", TERMS[TERMS_PER_BLOCK] + "a"):
+        assert dictionary.get(term) is None
+        assert term not in dictionary
+
+def test_prefix_items_and_terms_at(tmp_path):
+    dictionary = open_dictionary(tmp_path)
+    assert [term for term, _ in dictionary.prefix_items("term01")] == [term for term in TERMS if term.startswith("term01")]
+    assert list(dictionary.prefix_items("nothing")) == []
+    ordinals = [0, TERMS_PER_BLOCK - 1, TERMS_PER_BLOCK, len(TERMS) - 1]
+    assert list(dictionary.terms_at(ordinals)) == [(TERMS[i], OFFSETS[TERMS[i]]) for i in ordinals]
+
+def test_empty_dictionary(tmp_path):
+    path = tmp_path / "term_dictionary.bin"
+    write_term_dictionary(path, [], 0)
+    dictionary = TermDictionary(path)
+    assert len(dictionary) == 0
+    assert dictionary.get("term") is None
+    assert list(dictionary.items()) == []
@@ -0,0 +1,46 @@
+import pytest
+import text_store
+from text_store import TextStore, TextStoreWriter
+
+"""
+Round-trip tests of the document text store, run with: python -m pytest
+"""
+
+# titles and texts of ids 10 to 59 with gaps, long enough to fill several small blocks
+TEXTS = {document_id: (f"Page {document_id} é", "machine learning " * (document_id % 7) + str(document_id))
+         for document_id in range(10, 60) if document_id % 5}
+
+def write_store(path):
+    with TextStoreWriter(path) as writer:
+        for document_id, (title, text) in TEXTS.items():
+            writer.add(document_id, title, text)
+        writer.add(12, "replaced", "ignored") # ids at or below the last one are ignored
+
+@pytest.mark.parametrize("codec", sorted(text_store.CODECS))
+def test_texts_round_trip(tmp_path, monkeypatch, codec):
+    monkeypatch.setattr(text_store, "TEXT_BLOCK_BYTES", 256)
+    path = tmp_path / "texts.bin"
+    with TextStoreWriter(path, codec) as writer:
+        for document_id, (title, text) in TEXTS.items():
+            writer.add(document_id, title, text)
+    store = TextStore(path)
+    assert len(store.block_first_slots) > 1
+    assert store.get_many(TEXTS) == TEXTS
+    assert [(document_id, title, text) for document_id, title, text in store.items()] == [(document_id, *TEXTS[document_id]) for document_id in TEXTS]
+
+# ids in the gaps, before the first one and past the last one have no text
+def test_missing_texts(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_store, "TEXT_BLOCK_BYTES", 256)
+    path = tmp_path / "texts.bin"
+    write_store(path)
+    store = TextStore(path)
+    assert store.get(12) == TEXTS[12]
+    for document_id in (0, 9, 15, 20, 60, 1000):
+        assert store.get(document_id) is None
+
+def test_empty_store(tmp_path):
+    path = tmp_path / "texts.bin"
+    TextStoreWriter(path).close()
+    store = TextStore(path)
+    assert store.get(0) is None
+    assert list(store.items()) == []
@@ -0,0 +1,95 @@
+import warnings
+import numpy as np
+import pytest
+import top_k as top_k_module
+from index_format import TF_SCALE, encode_postings, log_tf_weights
+from top_k import PostingsList, QueryTerm, PhraseTerm, phrase_match, top_k
+
+"""
+Tests of the top-k scorer, run with: python -m pytest
+"""
+
+def positions(*values):
+    return np.array(values, dtype=np.int64)
+
+def test_exact_phrase():
+    assert phrase_match([positions(3, 10), positions(4, 20), positions(5)], 0)
+    assert not phrase_match([positions(3, 10), positions(5, 20), positions(6)], 0)
+    # word order matters
+    assert not phrase_match([positions(4), positions(3)], 0)
+
+def test_slop_phrase():
+    assert phrase_match([positions(3), positions(6)], 2)
+    assert not phrase_match([positions(3), positions(7)], 2)
+    assert not phrase_match([positions(3), positions(3)], 5)
+
+# a chain may have to go through a later position of a word than the first one in reach
+def test_slop_phrase_is_not_greedy():
+    assert phrase_match([positions(0), positions(1, 2), positions(4)], 1)
+    assert phrase_match([positions(0, 5), positions(1, 7), positions(9)], 1)
+    assert not phrase_match([positions(0), positions(1, 2), positions(5)], 1)
+
+def test_repeated_word():
+    # "new new york": the same positions for both "new"
+    assert phrase_match([positions(1, 2), positions(1, 2), positions(3)], 0)
+    assert not phrase_match([positions(1), positions(1), positions(2)], 0)
+
+# a PostingsList of {document_id: (tf, positions)}, every document has a norm of 1
+def make_postings_list(postings, document_count=1000):
+    document_ids = sorted(postings)
+    tfs = np.array([round(postings[document_id][0] * TF_SCALE) for document_id in document_ids]) / TF_SCALE
+    record = encode_postings([(document_id, postings[document_id][0]) for document_id in document_ids],
+                             log_tf_weights(tfs), [postings[document_id][1] for document_id in document_ids])
+    return PostingsList(record, 0, (0, np.ones(document_count)))
+
+# a term in every document has a query weight of 0, documents outside its blocks still bound to -inf, not nan
+def test_zero_weight_bounds():
+    term = QueryTerm([make_postings_list({5: (2.0, [0]), 6: (1.0, [1])})], 0.0, required=True)
+    phrase = PhraseTerm([term, term], 1.0, 0, required=False)
+    document_ids = np.array([1, 5, 6, 500])
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        bounds = term.block_bounds(document_ids)
+        assert bounds.tolist() == [0.0, 0.0, 0.0, -np.inf]
+        assert phrase.block_bounds(document_ids).tolist() == [0.0, 0.0, 0.0, 0.0]
+        assert term.max_bound() == 0.0
+        assert QueryTerm([], 0.0, required=True).max_bound() == -np.inf
+
+# every document with all required words, scored without pruning, best first (ties go to the lower id)
+def exhaustive_top_k(term_postings, query_terms, k, tombstones):
+    scores = {}
+    candidates = set.intersection(*(set(postings) for postings, term in zip(term_postings, query_terms) if term.required))
+    for document_id in candidates - set(tombstones.tolist()):
+        scores[document_id] = sum(term.query_weight * log_tf_weights(postings[document_id][0])
+                                  for postings, term in zip(term_postings, query_terms) if document_id in postings)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+# a term's postings split over two segments, the second one holding the higher ids
+def make_term(postings, query_weight, required):
+    segments = [{document_id: posting for document_id, posting in postings.items() if (document_id < 1500) == first}
+                for first in (True, False)]
+    return QueryTerm([make_postings_list(segment, 3000) for segment in segments if segment], query_weight, required)
+
+# block-max pruning skips blocks and documents, but must return the same top k as scoring every candidate
+@pytest.mark.parametrize("score_batch", [128, 1024])
+@pytest.mark.parametrize("seed", range(5))
+def test_top_k_matches_exhaustive_ranking(monkeypatch, score_batch, seed):
+    monkeypatch.setattr(top_k_module, "SCORE_BATCH", score_batch)
+    random = np.random.default_rng(seed)
+    term_postings = []
+    for density in (0.3, 0.5, 0.9, 0.4):
+        document_ids = np.flatnonzero(random.random(3000) < density)
+        # mostly low tfs with a few high ones, so blocks have different maximum weights
+        tfs = np.minimum(random.pareto(1.0, len(document_ids)) * TF_SCALE + 1, 100 * TF_SCALE).astype(int) / TF_SCALE
+        term_postings.append({document_id: (tf, [0]) for document_id, tf in zip(document_ids.tolist(), tfs.tolist())})
+    query_weights = random.random(4) * 3 + 0.1
+    required = [True, True, True, False]
+    tombstones = np.sort(random.choice(3000, 200, replace=False))
+
+    for k in (1, 10, 100):
+        query_terms = [make_term(postings, weight, is_required)
+                       for postings, weight, is_required in zip(term_postings, query_weights, required)]
+        results = top_k(query_terms, k, tombstones)
+        expected = exhaustive_top_k(term_postings, query_terms, k, tombstones)
+        assert [document_id for document_id, _ in results] == [document_id for document_id, _ in expected]
+        assert np.allclose([score for _, score in results], [score for _, score in expected])
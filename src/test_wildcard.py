@@ -0,0 +1,61 @@
+import pytest
+import wildcard
+from term_dictionary import TermDictionary, write_term_dictionary
+from tokenizer import Tokenizer
+
+"""
+Tests of wildcard expansion, run with: python -m pytest
+"""
+
+stem = Tokenizer().stem
+WORDS = ["university", "universities", "universal", "computer", "computing", "compatible", "comp", "science", "scientist",
+         "program", "programming", "biology", "ecology", "theology", "hackathon", "happy", "studies", "information", "com"]
+TERMS = sorted({stem(word) for word in WORDS})
+
+# the term dictionary of TERMS, and its k-gram index or None
+@pytest.fixture(params=[False, True], ids=["prefix scan", "k-gram index"])
+def dictionary(request, tmp_path):
+    write_term_dictionary(tmp_path / "term_dictionary.bin", [(term, i) for i, term in enumerate(TERMS)], len(WORDS))
+    if request.param:
+        wildcard.build_kgram_index(tmp_path)
+    return TermDictionary(tmp_path / "term_dictionary.bin"), wildcard.KGramIndex(tmp_path) if request.param else None
+
+def expand(dictionary, pattern):
+    return sorted(term for term, _ in wildcard.expand_dictionary(*dictionary, pattern, stem))
+
+def test_split_wildcards():
+    assert wildcard.split_wildcards("Comp?ter hackath* science") == (["comp?ter", "hackath*"], "    science")
+    # a ? ending a word is a question mark, a pattern needs WILDCARD_MIN_CHARS letters
+    assert wildcard.split_wildcards("what is the ics program?") == ([], "what is the ics program?")
+    assert wildcard.split_wildcards("progr?m? a* *") == (["progr?m"], " ?    ")
+
+@pytest.mark.parametrize("pattern, terms", [
+    ("*ology", ["biolog", "ecolog", "theolog"]),
+    ("?omputer", ["comput"]),
+    ("comp?ter", ["compat", "comput"]), # "compater" would stem to "compat" too
+    ("sci?nce", ["scienc"]),
+    ("univ*ity", ["univers"]),
+    ("progra?", ["program"]),
+])
+def test_first_middle_and_last_wildcards(dictionary, pattern, terms):
+    assert expand(dictionary, pattern) == terms
+
+# terms are stems, a pattern also matches the stems of the words it matches
+@pytest.mark.parametrize("pattern, terms", [
+    ("universit*", ["univers"]), # university
+    ("hackath*", ["hackathon"]),
+    ("happy*", ["happi"]),
+    ("informat*", ["inform"]), # information
+    ("scien?e", ["scienc"]), # science, one letter after the last wildcard
+    ("scien*", ["scienc", "scientist"]),
+])
+def test_stems_of_matching_words(dictionary, pattern, terms):
+    assert expand(dictionary, pattern) == terms
+
+def test_keep_terms(monkeypatch):
+    monkeypatch.setattr(wildcard, "WILDCARD_MAX_TERMS", 2)
+    assert wildcard.keep_terms({"a": 1, "b": 5, "c": 3}) == ["b", "c"]
+    monkeypatch.setattr(wildcard, "WILDCARD_MAX_POSTINGS", 6)
+    # the first term is always kept, the others while the postings fit
+    assert wildcard.keep_terms({"a": 1, "b": 5, "c": 3}) == ["b", "a"]
+    assert wildcard.keep_terms({"a": 10}) == ["a"]
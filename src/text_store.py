@@ -0,0 +1,145 @@
+import lzma
+import mmap
+import zlib
+import struct
+import numpy as np
+
+"""
+Document text store (texts.bin), maps a document id to the title and plain text extracted from its page,
+so search can show snippets without reopening and reparsing the json files
+
+    header      : first document id, number of id slots, number of blocks, codec, byte offset of the block table (TEXT_HEADER)
+    blocks      : compressed blocks of consecutive slots, one after another
+    block table : uint64 byte offset per block boundary (block count + 1), then uint32 first slot of each block
+
+A decompressed block holds uint32 (title length, text length) per slot, then every title and text (utf-8).
+Slots run from the first document id to the last one, ids that are not in the store have an empty title and text.
+A lookup decompresses only the blocks holding the requested documents.
+
+TEXT_COMPRESSION is "zlib" or "lzma" (smaller, slower to decompress). DEFAULT: "zlib"
+TEXT_COMPRESSION_LEVEL is the zlib level or lzma preset. DEFAULT: 6
+TEXT_BLOCK_BYTES is the uncompressed size a block is closed at, bigger blocks compress better
+but every lookup decompresses a whole block. DEFAULT: 64 KB
+"""
+TEXT_COMPRESSION = "zlib"
+TEXT_COMPRESSION_LEVEL = 6
+TEXT_BLOCK_BYTES = 64 * 1024
+
+TEXT_HEADER = struct.Struct("<IIIIQ")
+CODECS = {"zlib": 0, "lzma": 1}
+
+def compress(codec, data):
+    if codec == CODECS["lzma"]:
+        return lzma.compress(data, preset=TEXT_COMPRESSION_LEVEL)
+    return zlib.compress(data, TEXT_COMPRESSION_LEVEL)
+
+def decompress(codec, data):
+    if codec == CODECS["lzma"]:
+        return lzma.decompress(data)
+    return zlib.decompress(data)
+
+# writes a text store one document at a time, in increasing document id order, holding one block in memory
+class TextStoreWriter:
+    def __init__(self, path, codec=TEXT_COMPRESSION):
+        self.file = open(path, "wb")
+        self.file.write(bytes(TEXT_HEADER.size)) # written on close, once the counts are known
+        self.codec = CODECS[codec]
+        self.first_document_id = None
+        self.slot_count = 0
+        self.block_offsets = [TEXT_HEADER.size]
+        self.block_first_slots = []
+        self.lengths = []
+        self.blob = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    # a document id at or below the last one added is ignored (a page replacing an already indexed url keeps its id)
+    def add(self, document_id, title, text):
+        if self.first_document_id is None:
+            self.first_document_id = document_id
+        slot = document_id - self.first_document_id
+        if slot < self.slot_count:
+            return
+        # ids missing in between get empty slots
+        while self.slot_count < slot:
+            self.add_slot(b"", b"")
+        self.add_slot(title.encode("utf-8"), text.encode("utf-8"))
+
+    def add_slot(self, title, text):
+        if not self.lengths:
+            self.block_first_slots.append(self.slot_count)
+        self.lengths += (len(title), len(text))
+        self.blob += title
+        self.blob += text
+        self.slot_count += 1
+        if len(self.blob) >= TEXT_BLOCK_BYTES:
+            self.write_block()
+
+    def write_block(self):
+        data = np.array(self.lengths, dtype="<u4").tobytes() + bytes(self.blob)
+        self.file.write(compress(self.codec, data))
+        self.block_offsets.append(self.file.tell())
+        self.lengths = []
+        self.blob = bytearray()
+
+    def close(self):
+        if self.lengths:
+            self.write_block()
+        table_offset = self.file.tell()
+        self.file.write(np.array(self.block_offsets, dtype="<u8").tobytes())
+        self.file.write(np.array(self.block_first_slots, dtype="<u4").tobytes())
+        self.file.seek(0)
+        self.file.write(TEXT_HEADER.pack(self.first_document_id or 0, self.slot_count, len(self.block_first_slots), self.codec, table_offset))
+        self.file.close()
+
+# read-only view of a text store through mmap
+class TextStore:
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.first_document_id, self.slot_count, block_count, self.codec, table_offset = TEXT_HEADER.unpack_from(self.map, 0)
+        self.block_offsets = np.frombuffer(self.map, dtype="<u8", count=block_count + 1, offset=table_offset)
+        self.block_first_slots = np.frombuffer(self.map, dtype="<u4", count=block_count, offset=table_offset + self.block_offsets.nbytes)
+
+    # returns (title, text) of a document, or None if the store does not have it
+    def get(self, document_id):
+        return self.get_many([document_id]).get(document_id)
+
+    # returns {document_id: (title, text)} for the document ids the store has, decompressing each block once
+    def get_many(self, document_ids):
+        blocks = {}
+        for document_id in document_ids:
+            slot = document_id - self.first_document_id
+            if 0 <= slot < self.slot_count:
+                block = int(np.searchsorted(self.block_first_slots, slot, side="right")) - 1
+                blocks.setdefault(block, []).append((document_id, slot))
+
+        texts = {}
+        for block, slots in blocks.items():
+            data = decompress(self.codec, self.map[int(self.block_offsets[block]):int(self.block_offsets[block + 1])])
+            first_slot = int(self.block_first_slots[block])
+            last_slot = int(self.block_first_slots[block + 1]) if block + 1 < len(self.block_first_slots) else self.slot_count
+            lengths = np.frombuffer(data, dtype="<u4", count=2 * (last_slot - first_slot))
+            ends = np.cumsum(lengths) + lengths.nbytes
+            for document_id, slot in slots:
+                index = 2 * (slot - first_slot)
+                start = int(ends[index - 1]) if index else lengths.nbytes
+                title_end, text_end = int(ends[index]), int(ends[index + 1])
+                if start == text_end:
+                    continue
+                texts[document_id] = data[start:title_end].decode("utf-8"), data[title_end:text_end].decode("utf-8")
+        return texts
+
+    # yields (document_id, title, text) of every document in id order
+    def items(self):
+        for block, first_slot in enumerate(self.block_first_slots.tolist()):
+            last_slot = int(self.block_first_slots[block + 1]) if block + 1 < len(self.block_first_slots) else self.slot_count
+            document_ids = range(self.first_document_id + first_slot, self.first_document_id + last_slot)
+            texts = self.get_many(document_ids)
+            for document_id in document_ids:
+                if document_id in texts:
+                    yield document_id, *texts[document_id]
@@ -0,0 +1,78 @@
+import re
+from functools import lru_cache
+from nltk.stem import PorterStemmer
+
+"""
+STEM_CACHE_SIZE is the number of distinct words whose stems are remembered. DEFAULT: 2**18
+Words follow a Zipfian distribution, so a few hundred thousand entries cover nearly every occurrence.
+"""
+STEM_CACHE_SIZE = 2 ** 18
+
+TOKEN_PATTERN = re.compile(r'[a-zA-Z0-9]+')
+
+SYNONYM_MAP = {
+    "crista": "cristina",
+    "cs": "compsci"
+}
+
+# weigh trigram matches higher than bigrams, bigrams than unigrams (search uses them for phrase matches)
+BIGRAM_WEIGHT = 1.25
+TRIGRAM_WEIGHT = 1.5
+
+# modified tokenize from Part A, kept as one object so the stemmer and its cache are reused across calls
+class Tokenizer:
+    def __init__(self, stem_cache_size=STEM_CACHE_SIZE):
+        self.stemmer = PorterStemmer()
+        self.stem = lru_cache(maxsize=stem_cache_size)(self.stemmer.stem)
+
+    # returns the stemmed words of text in order, or [] if text repeats too few distinct words
+    def stems(self, text):
+        # use regular expression to tokenize alphanumeric words in text
+        tokens = TOKEN_PATTERN.findall(text.lower())
+
+        # use Porter stemming for better textual matches
+        stem = self.stem
+        stems = []     # unigrams
+        unique_tokens = set()
+        for token in tokens:
+            # Normalize using synonym map
+            token = SYNONYM_MAP.get(token, token)
+            # only add tokens that are more than 2 characters
+            # do not include numbers > 5 digits
+            if len(token) > 2 and not (token.isdigit() and len(token) > 5):
+                stems.append(stem(token))
+                unique_tokens.add(token)
+        # if there is too much replication, ignore
+        if len(tokens) == 0 or len(unique_tokens)/len(tokens) < 0.05:
+            return []
+        return stems
+
+    # yields (stemmed token, weight) for the unigrams, then bigrams, then trigrams of text
+    # the index stores word positions instead of n-grams (see stems), this is kept for comparing tokenizers
+    def iter_tokens(self, text, weight=1):
+        stems = self.stems(text)
+        if not stems:
+            return
+
+        for token in stems:
+            yield token, weight
+        yield from self.ngrams(stems, weight)
+
+    # yields (n-gram, weight) for the bigrams, then trigrams of a list of stems
+    # the indexer still hashes them into a page's Simhash, since word order tells near-duplicates apart
+    def ngrams(self, stems, weight=1):
+        # average individual words' weights for an n-gram's weight (every word in text has the same weight)
+        bigram_weight = ((weight + weight) / 2) * BIGRAM_WEIGHT
+        trigram_weight = ((weight + weight + weight) / 2) * TRIGRAM_WEIGHT
+
+        # add 2-grams
+        for first, second in zip(stems, stems[1:]):
+            yield first + "_" + second, bigram_weight
+
+        # add 3-grams
+        for first, second, third in zip(stems, stems[1:], stems[2:]):
+            yield first + "_" + second + "_" + third, trigram_weight
+
+    # returns the list of (stemmed token, weight) for text
+    def tokenize(self, text, weight=1):
+        return list(self.iter_tokens(text, weight))
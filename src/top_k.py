@@ -0,0 +1,379 @@
+import heapq
+import numpy as np
+import metrics
+from index_format import read_directory, decode_block, decode_block_positions, posting_positions, log_tf_weights, TERM_HEADER, BLOCK_ENTRY, BLOCK_SIZE
+
+"""
+Exact top-k cosine retrieval with block-max pruning (MaxScore)
+
+Documents are cosine normalized log tf vectors and queries are log tf * idf vectors (lnc.ltc),
+so a document's score is the sum over query terms of query weight * document weight.
+Every word of the query must be in a result. Phrases (PhraseTerm) are matched on word positions:
+quoted phrases must be in a result, adjacent query words only add to its score when they are adjacent in the page.
+Blocks of the rarest unigram are visited from the highest possible score down, and every block
+and document is bounded by the highest document weight of the blocks it falls in (stored in the block directory).
+Search stops once no remaining block can beat the current k-th best score, so common terms
+are only decoded in the few blocks that hold candidates. Candidates are scored in batches of
+about SCORE_BATCH postings with one matrix product.
+"""
+SCORE_BATCH = 1024
+
+# one term's postings in one segment, blocks are decoded on first use
+# decoded blocks are shared through cache (a PostingsCache) under (key, block) when one is given
+class PostingsList:
+    def __init__(self, buf, offset, doc_norms, cache=None, key=None):
+        self.buf = buf
+        self.offset = offset
+        self.cache = cache
+        self.key = key
+        self.first_document_id, self.norms = doc_norms
+        self.df, self.directory = read_directory(buf, offset)
+        self.last_document_ids = self.directory["last_document_id"].astype(np.int64)
+        self.max_weights = self.directory["max_weight"].astype(np.float64)
+        self.decoded = {}
+        self.decoded_positions = {}
+        self.cursor = 0 # first block the last find_blocks could return, lookups moving forward gallop from it
+        self.bytes_read = TERM_HEADER.size + len(self.directory) * BLOCK_ENTRY.size # bytes of the index read, cached blocks read none
+
+    # returns (document_ids, normalized document weights) of a block
+    def block(self, block):
+        if block not in self.decoded:
+            if self.cache is None:
+                self.decoded[block] = self.decode(block)
+            else:
+                self.decoded[block] = self.cache.get_or_load((self.key, block), lambda: self.decode(block))
+        return self.decoded[block]
+
+    def decode(self, block):
+        with metrics.timer("search.postings_decode"):
+            document_ids, tfs = decode_block(self.buf, self.offset, self.df, self.directory, block)
+        first_byte = int(self.directory["doc_bytes_end"][block - 1]) if block else 0
+        self.bytes_read += int(self.directory["doc_bytes_end"][block]) - first_byte + 2 * len(tfs) # doc id bytes and uint16 tfs
+        return document_ids, log_tf_weights(tfs) / self.norms[document_ids - self.first_document_id]
+
+    # returns (starts, positions) of a block, see index_format.decode_block_positions
+    def block_positions(self, block):
+        if block not in self.decoded_positions:
+            if self.cache is None:
+                self.decoded_positions[block] = self.decode_positions(block)
+            else:
+                self.decoded_positions[block] = self.cache.get_or_load((self.key, block, "positions"), lambda: self.decode_positions(block))
+        return self.decoded_positions[block]
+
+    def decode_positions(self, block):
+        with metrics.timer("search.positions_decode"):
+            starts, positions = decode_block_positions(self.buf, self.offset, self.df, self.directory, block)
+        self.bytes_read += 2 * len(starts) + 2 * len(positions) # about 2 bytes per varint
+        return starts, positions
+
+    # returns {document_id: word positions} for the document ids that are in the list
+    def positions(self, document_ids):
+        document_positions = {}
+        for block, in_block in group_by_block(self.find_blocks(document_ids), len(self.directory)):
+            in_block = document_ids[in_block]
+            block_ids, _ = self.block(block)
+            starts, positions = self.block_positions(block)
+            indexes = np.minimum(np.searchsorted(block_ids, in_block), len(block_ids) - 1)
+            for document_id, index in zip(in_block.tolist(), indexes.tolist()):
+                if block_ids[index] == document_id:
+                    document_positions[document_id] = posting_positions(starts, positions, index)
+        return document_positions
+
+    # index of the block whose id range holds each document id, len(directory) past the last block
+    # the last document ids of the blocks are skip pointers: when the ids are past the previous call's blocks
+    # (a scan in document order, see intersect) the search gallops forward from there, doubling its step
+    # until it passes the highest id, and only binary searches the blocks in between
+    def find_blocks(self, document_ids):
+        last_document_ids = self.last_document_ids
+        if not len(document_ids):
+            return np.zeros(0, dtype=np.int64)
+        start = self.cursor
+        if start and document_ids.min() <= last_document_ids[start - 1]:
+            start = 0
+        highest = document_ids.max()
+        end = start
+        step = 1
+        while end < len(last_document_ids) and last_document_ids[end] < highest:
+            end = start + step
+            step *= 2
+        end = min(end + 1, len(last_document_ids))
+        blocks = start + np.searchsorted(last_document_ids[start:end], document_ids)
+        self.cursor = int(blocks.min())
+        return blocks
+
+    # returns (found, weights) for each document id
+    def lookup(self, document_ids):
+        found = np.zeros(len(document_ids), dtype=bool)
+        weights = np.zeros(len(document_ids))
+        for block, in_block in group_by_block(self.find_blocks(document_ids), len(self.directory)):
+            block_ids, block_weights = self.block(block)
+            positions = np.minimum(np.searchsorted(block_ids, document_ids[in_block]), len(block_ids) - 1)
+            matches = block_ids[positions] == document_ids[in_block]
+            found[in_block[matches]] = True
+            weights[in_block[matches]] = block_weights[positions[matches]]
+        return found, weights
+
+# the union of several postings lists (the terms a wildcard expands to, see wildcard.py) as one list
+# every block of every list is decoded up front, a document's weight is the highest weight of its terms,
+# and the merged postings are cut into blocks of BLOCK_SIZE so top_k can bound and skip them like a stored list
+class UnionPostingsList(PostingsList):
+    def __init__(self, postings_lists):
+        self.postings_lists = postings_lists
+        blocks = [postings_list.block(block) for postings_list in postings_lists for block in range(len(postings_list.directory))]
+        document_ids = np.concatenate([document_ids for document_ids, _ in blocks]) if blocks else np.zeros(0, dtype=np.int64)
+        weights = np.concatenate([weights for _, weights in blocks]) if blocks else np.zeros(0)
+        order = np.argsort(document_ids, kind="stable")
+        document_ids, weights = document_ids[order], weights[order]
+        starts = np.flatnonzero(np.diff(document_ids, prepend=-1)) if len(document_ids) else np.zeros(0, dtype=np.int64)
+        self.document_ids = document_ids[starts]
+        self.weights = np.maximum.reduceat(weights, starts) if len(starts) else weights
+
+        self.df = len(self.document_ids)
+        block_starts = np.arange(0, self.df, BLOCK_SIZE)
+        self.directory = range(len(block_starts))
+        self.last_document_ids = self.document_ids[np.minimum(block_starts + BLOCK_SIZE, self.df) - 1].astype(np.int64)
+        self.max_weights = np.maximum.reduceat(self.weights, block_starts) if self.df else np.zeros(0)
+        self.cursor = 0
+        self.bytes_read = sum(postings_list.bytes_read for postings_list in postings_lists)
+
+    def block(self, block):
+        return self.document_ids[block * BLOCK_SIZE:(block + 1) * BLOCK_SIZE], self.weights[block * BLOCK_SIZE:(block + 1) * BLOCK_SIZE]
+
+    # positions of any of the terms, merged
+    def positions(self, document_ids):
+        document_positions = {}
+        for postings_list in self.postings_lists:
+            for document_id, positions in postings_list.positions(document_ids).items():
+                previous = document_positions.get(document_id)
+                document_positions[document_id] = positions if previous is None else np.union1d(previous, positions)
+        return document_positions
+
+# yields (block, indexes of the ids in it) for every block in blocks except block_count (past the last block)
+# one sort instead of a scan of blocks per block, so a lookup costs about the number of ids
+def group_by_block(blocks, block_count):
+    order = np.argsort(blocks, kind="stable")
+    sorted_blocks = blocks[order]
+    starts = np.flatnonzero(np.diff(sorted_blocks, prepend=-1))
+    ends = np.append(starts[1:], len(order))
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        block = int(sorted_blocks[start])
+        if block != block_count:
+            yield block, order[start:end]
+
+# query_weight times document weights, where a weight of -inf (no block can hold the term) stays -inf
+# instead of becoming nan for a query weight of 0 (a term in every document has an idf of 0)
+def weighted_bounds(query_weight, weights):
+    if np.isscalar(weights):
+        return query_weight * weights if weights > -np.inf else -np.inf
+    bounds = np.full(len(weights), -np.inf)
+    np.multiply(query_weight, weights, out=bounds, where=weights > -np.inf)
+    return bounds
+
+# a query term with its postings lists in every segment that has it
+# query_weight is the term's entry in the normalized query vector (>= 0)
+class QueryTerm:
+    def __init__(self, postings_lists, query_weight, required):
+        self.postings_lists = postings_lists
+        self.query_weight = query_weight
+        self.required = required
+        self.df = sum(postings_list.df for postings_list in postings_lists)
+
+    # highest document weight of the term in any document
+    def max_weight(self):
+        return max((postings_list.max_weights.max() for postings_list in self.postings_lists if len(postings_list.max_weights)), default=-np.inf)
+
+    # highest score the term can add to any document
+    def max_bound(self):
+        best = weighted_bounds(self.query_weight, self.max_weight())
+        return best if self.required else max(best, 0.0)
+
+    # highest document weight the term can have in each document, -inf where no block can hold it
+    def block_max_weights(self, document_ids):
+        weights = np.full(len(document_ids), -np.inf)
+        for postings_list in self.postings_lists:
+            blocks = postings_list.find_blocks(document_ids)
+            inside = blocks < len(postings_list.directory)
+            weights[inside] = np.maximum(weights[inside], postings_list.max_weights[blocks[inside]])
+        return weights
+
+    # highest score the term can add to each document, -inf if a required term cannot hold it
+    def block_bounds(self, document_ids):
+        bounds = weighted_bounds(self.query_weight, self.block_max_weights(document_ids))
+        return bounds if self.required else np.maximum(bounds, 0.0)
+
+    # returns (found, weights) for each document id, weights are 0 where the term is missing
+    def lookup(self, document_ids):
+        found = np.zeros(len(document_ids), dtype=bool)
+        weights = np.zeros(len(document_ids))
+        for postings_list in self.postings_lists:
+            list_found, list_weights = postings_list.lookup(document_ids)
+            found |= list_found
+            weights[list_found] = list_weights[list_found]
+        return found, weights
+
+    # returns {document_id: word positions} for the document ids that have the term
+    def positions(self, document_ids):
+        document_positions = {}
+        for postings_list in self.postings_lists:
+            document_positions.update(postings_list.positions(document_ids))
+        return document_positions
+
+# a phrase of query terms, found in a document when its words appear in order with at most slop other words
+# between each pair (slop 0 is an exact phrase). A match scores weight * the lowest query weight of its words
+# times the lowest document weight of its words, so its bounds come from the blocks of its words.
+class PhraseTerm:
+    def __init__(self, terms, weight, slop, required):
+        self.terms = terms
+        self.slop = slop
+        self.required = required
+        self.query_weight = weight * min(term.query_weight for term in terms)
+        self.postings_lists = [] # never the source of candidates, see top_k
+        self.df = min(term.df for term in terms)
+
+    def max_bound(self):
+        best = weighted_bounds(self.query_weight, min(term.max_weight() for term in self.terms))
+        return best if self.required else max(best, 0.0)
+
+    def block_bounds(self, document_ids):
+        weights = np.min([term.block_max_weights(document_ids) for term in self.terms], axis=0)
+        bounds = weighted_bounds(self.query_weight, weights)
+        return bounds if self.required else np.maximum(bounds, 0.0)
+
+    def lookup(self, document_ids):
+        found = np.ones(len(document_ids), dtype=bool)
+        weights = np.full(len(document_ids), np.inf)
+        for term in self.terms:
+            term_found, term_weights = term.lookup(document_ids)
+            found &= term_found
+            weights = np.minimum(weights, term_weights)
+
+        # only documents with every word are checked against positions
+        candidates = np.flatnonzero(found)
+        term_positions = [term.positions(document_ids[candidates]) for term in self.terms]
+        for candidate, document_id in zip(candidates.tolist(), document_ids[candidates].tolist()):
+            found[candidate] = phrase_match([positions[document_id] for positions in term_positions], self.slop)
+        return found, np.where(found, weights, 0.0)
+
+# True if some position of each word follows a position of the word before it with at most slop words between
+def phrase_match(word_positions, slop):
+    current = word_positions[0]
+    for positions in word_positions[1:]:
+        if not len(current):
+            return False
+        # every position of the next word reachable from a current one: the closest current position before it
+        # is at most slop words away (current stays sorted, so chains through any reachable position are kept)
+        previous = np.searchsorted(current, positions, side="left") - 1
+        valid = previous >= 0
+        next_positions = positions[valid]
+        current = next_positions[next_positions - current[previous[valid]] - 1 <= slop]
+    return len(current) > 0
+
+# returns up to k (document_id, score) with the highest scores, best first (ties go to the lower id)
+# tombstones is a sorted numpy array of document ids to leave out
+def top_k(query_terms, k, tombstones):
+    required = [term for term in query_terms if term.required]
+    if not required or any(term.df == 0 for term in required):
+        return []
+
+    # candidates come from the rarest required word, the others are checked in increasing df
+    words = [term for term in required if term.postings_lists]
+    if not words:
+        return []
+    rarest = min(words, key=lambda term: term.df)
+    others = sorted((term for term in query_terms if term is not rarest), key=lambda term: (not term.required, term.df))
+    others_bound = sum(term.max_bound() for term in others)
+
+    blocks = []
+    for postings_list in rarest.postings_lists:
+        for block, max_weight in enumerate(postings_list.max_weights):
+            blocks.append((rarest.query_weight * max_weight, postings_list, block))
+    blocks.sort(key=lambda x: -x[0])
+
+    heap = [] # k best as (score, -document_id), lowest first
+    batch = []
+    batch_size = 0
+    for bound, postings_list, block in blocks:
+        if len(heap) == k and bound + others_bound < heap[0][0]:
+            break # no remaining block can reach the top k, a block that can only tie may still hold a lower id
+        batch.append(postings_list.block(block))
+        batch_size += len(batch[-1][0])
+        if batch_size >= SCORE_BATCH:
+            score_batch(batch, rarest, others, k, tombstones, heap)
+            batch = []
+            batch_size = 0
+    if batch:
+        score_batch(batch, rarest, others, k, tombstones, heap)
+
+    return [(-negative_id, score) for score, negative_id in sorted(heap, reverse=True)]
+
+# returns the sorted ids of every document that has all required terms (words and phrases), without scoring
+# the rarest word's blocks are read in document order and every other term, rarest first, only decodes the blocks
+# its skip pointers send the remaining candidates to, so an AND costs about the length of the rarest list
+def intersect(query_terms, tombstones):
+    required = [term for term in query_terms if term.required]
+    words = [term for term in required if term.postings_lists]
+    if not words or any(term.df == 0 for term in required):
+        return np.zeros(0, dtype=np.int64)
+    rarest = min(words, key=lambda term: term.df)
+    others = sorted((term for term in required if term is not rarest), key=lambda term: term.df)
+
+    matches = []
+    for postings_list in rarest.postings_lists:
+        # about SCORE_BATCH candidates per round, a run of consecutive blocks
+        blocks_per_batch = max(SCORE_BATCH // BLOCK_SIZE, 1)
+        for first_block in range(0, len(postings_list.directory), blocks_per_batch):
+            document_ids = np.concatenate([postings_list.block(block)[0]
+                                           for block in range(first_block, min(first_block + blocks_per_batch, len(postings_list.directory)))])
+            if len(tombstones):
+                document_ids = document_ids[~np.isin(document_ids, tombstones)]
+            with metrics.timer("search.intersection"):
+                for term in others:
+                    if not len(document_ids):
+                        break
+                    found, _ = term.lookup(document_ids)
+                    document_ids = document_ids[found]
+            matches.append(document_ids)
+    # segments hold increasing id ranges, but compacted segments may interleave with newer ones
+    return np.unique(np.concatenate(matches)) if matches else np.zeros(0, dtype=np.int64)
+
+# scores the documents of a batch of the rarest term's blocks and keeps the k best in heap
+def score_batch(batch, rarest, others, k, tombstones, heap):
+    document_ids = np.concatenate([document_ids for document_ids, _ in batch])
+    rarest_weights = np.concatenate([weights for _, weights in batch])
+    if len(tombstones):
+        live = ~np.isin(document_ids, tombstones)
+        document_ids, rarest_weights = document_ids[live], rarest_weights[live]
+
+    # drop documents whose best possible score cannot reach the top k
+    if len(heap) == k:
+        bounds = rarest.query_weight * rarest_weights
+        for term in others:
+            bounds = bounds + term.block_bounds(document_ids)
+        # a document that can only tie the k-th score makes it with a lower id, as in the heap's (score, -document_id) order
+        keep = (bounds > heap[0][0]) | ((bounds == heap[0][0]) & (-document_ids > heap[0][1]))
+        document_ids, rarest_weights = document_ids[keep], rarest_weights[keep]
+
+    # document weights of every query term, one column per term, 0 where a document lacks the term
+    document_vectors = np.zeros((len(document_ids), len(others) + 1))
+    document_vectors[:, 0] = rarest_weights
+    with metrics.timer("search.intersection"):
+        for column, term in enumerate(others, start=1):
+            if not len(document_ids):
+                return
+            found, weights = term.lookup(document_ids)
+            document_vectors[:, column] = weights
+            if term.required:
+                document_ids, document_vectors = document_ids[found], document_vectors[found]
+    metrics.increment("search.candidates_scored", len(document_ids))
+
+    with metrics.timer("search.scoring"):
+        # cosine similarity of every candidate in one product
+        query_vector = np.array([rarest.query_weight] + [term.query_weight for term in others])
+        scores = document_vectors @ query_vector
+
+        for document_id, score in zip(document_ids.tolist(), scores.tolist()):
+            entry = (score, -document_id)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
@@ -0,0 +1,165 @@
+import os
+import re
+import mmap
+import struct
+from fnmatch import fnmatchcase
+import numpy as np
+from term_dictionary import TermDictionary, write_term_dictionary
+from index_format import TERM_HEADER
+
+"""
+Prefix and wildcard query terms: "hackath*" or "comp?ter" (* is any run of characters, ? one character)
+
+A pattern is expanded to the terms of a segment's term dictionary that are stems of words matching it (see term_matcher).
+Terms are sorted, so every term starting with the pattern's literal prefix is one range scan: O(log V + matches).
+Patterns without a literal prefix ("*ology") use the segment's k-gram index when it has one, otherwise they scan
+the whole vocabulary.
+
+K-gram index (kgram_dictionary.bin and kgram_postings.bin next to term_dictionary.bin, optional):
+every KGRAM_SIZE characters of "$term$" map to the sorted ordinals of the terms holding them
+    kgram_dictionary.bin   a term dictionary (see term_dictionary.py) from k-gram to its byte offset in kgram_postings.bin
+    kgram_postings.bin     per k-gram: uint32 count, then that many uint32 term ordinals
+A pattern's candidates are the terms holding all k-grams of its literal parts, checked against the pattern.
+
+WILDCARD_MAX_TERMS is the most terms a pattern expands to, the ones with the highest df are kept. DEFAULT: 64
+WILDCARD_MAX_POSTINGS caps the summed df of the kept terms, past the first one. DEFAULT: 200000
+WILDCARD_MIN_CHARS is the fewest literal characters a pattern needs, so "*" cannot expand to everything. DEFAULT: 2
+"""
+WILDCARD_MAX_TERMS = 64
+WILDCARD_MAX_POSTINGS = 200000
+WILDCARD_MIN_CHARS = 2
+KGRAM_SIZE = 3
+
+# endings tried after a pattern ending in * to find the stems of the words it starts, and the most letters
+# a stem is shorter than the pattern's end
+STEM_ENDINGS = ("", "e", "s", "y", "ed", "er", "es", "ies", "ing", "ion", "ity", "ation")
+STEM_CUT_CHARS = 3
+
+# a ? is a wildcard only inside a pattern, a trailing one ("program?") is the punctuation of a question
+WILDCARD = r'(?:\*|\?+(?=[a-zA-Z0-9*]))'
+WILDCARD_PATTERN = re.compile(r'[a-zA-Z0-9]*' + WILDCARD + r'(?:[a-zA-Z0-9]|' + WILDCARD + r')*')
+WILDCARD_CHARACTERS = re.compile(r'[*?]')
+KGRAM_ENTRY = struct.Struct("<I")
+
+# returns the wildcard patterns of a query (lowercased, sorted) and the query without them
+def split_wildcards(query):
+    patterns = sorted({pattern.lower() for pattern in WILDCARD_PATTERN.findall(query)
+                       if len(WILDCARD_CHARACTERS.sub("", pattern)) >= WILDCARD_MIN_CHARS})
+    return patterns, WILDCARD_PATTERN.sub(" ", query)
+
+def kgrams(term):
+    padded = "$" + term + "$"
+    return {padded[i:i + KGRAM_SIZE] for i in range(len(padded) - KGRAM_SIZE + 1)}
+
+# k-grams every term matching pattern must have, from its literal parts ($ marks the start and end of a term)
+def pattern_kgrams(pattern):
+    parts = WILDCARD_CHARACTERS.split("$" + pattern + "$")
+    return {part[i:i + KGRAM_SIZE] for part in parts for i in range(len(part) - KGRAM_SIZE + 1)}
+
+# writes the k-gram index of the term dictionary in folder
+def build_kgram_index(folder):
+    dictionary = TermDictionary(os.path.join(folder, "term_dictionary.bin"))
+    kgram_ordinals = {}
+    for ordinal, (term, _) in enumerate(dictionary.items()):
+        for kgram in kgrams(term):
+            kgram_ordinals.setdefault(kgram, []).append(ordinal)
+
+    kgram_offsets = {}
+    with open(os.path.join(folder, "kgram_postings.bin"), "wb") as file:
+        for kgram in sorted(kgram_ordinals):
+            kgram_offsets[kgram] = file.tell()
+            ordinals = kgram_ordinals[kgram]
+            file.write(np.array([len(ordinals)] + ordinals, dtype="<u4").tobytes())
+    write_term_dictionary(os.path.join(folder, "kgram_dictionary.bin"), kgram_offsets.items(), len(dictionary))
+
+# read-only view of a k-gram index through mmap
+class KGramIndex:
+    def __init__(self, folder):
+        self.dictionary = TermDictionary(os.path.join(folder, "kgram_dictionary.bin"))
+        with open(os.path.join(folder, "kgram_postings.bin"), "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # sorted ordinals of the terms holding kgram
+    def ordinals(self, kgram):
+        offset = self.dictionary.get(kgram)
+        if offset is None:
+            return np.zeros(0, dtype="<u4")
+        count, = KGRAM_ENTRY.unpack_from(self.map, offset)
+        return np.frombuffer(self.map, dtype="<u4", count=count, offset=offset + KGRAM_ENTRY.size)
+
+    # sorted ordinals of the terms that may match pattern, None if the pattern has no k-gram to narrow them
+    def candidates(self, pattern):
+        lists = sorted((self.ordinals(kgram) for kgram in pattern_kgrams(pattern)), key=len)
+        if not lists:
+            return None
+        ordinals = lists[0]
+        for other in lists[1:]:
+            ordinals = np.intersect1d(ordinals, other, assume_unique=True)
+        return ordinals
+
+# returns a function telling whether a term of the index (a stem) is the stem of a word matching pattern:
+# the term matches the pattern itself, or the term followed by the last letters of the pattern (and, for a pattern
+# ending in *, one of STEM_ENDINGS) is a word stemming to the term ("comp?ter" matches "comput" from "computer")
+def term_matcher(pattern, stem):
+    head = pattern.rstrip("*")
+    tail = WILDCARD_CHARACTERS.split(head)[-1]
+    endings = STEM_ENDINGS if head != pattern else ("",)
+
+    def matches(term):
+        if fnmatchcase(term, pattern):
+            return True
+        return any(fnmatchcase(term, head[:-cut]) and any(stem(term + head[-cut:] + ending) == term for ending in endings)
+                   for cut in range(1, min(len(tail), STEM_CUT_CHARS) + 1))
+    return matches
+
+# yields (term, postings offset) of the terms of a term dictionary matching pattern (see term_matcher),
+# kgram_index is the dictionary's KGramIndex or None
+def expand_dictionary(term_dictionary, kgram_index, pattern, stem):
+    prefix = WILDCARD_CHARACTERS.split(pattern)[0]
+    if pattern == prefix + "*":
+        yield from term_dictionary.prefix_items(prefix)
+        # stems shorter than the prefix or not starting with it ("universit*" matches "univers" from "university")
+        for term in sorted({stem(prefix + ending) for ending in STEM_ENDINGS}):
+            offset = term_dictionary.get(term)
+            if offset is not None and not term.startswith(prefix):
+                yield term, offset
+        return
+
+    matches = term_matcher(pattern, stem)
+    head = pattern.rstrip("*")
+    tail = WILDCARD_CHARACTERS.split(head)[-1]
+    candidates = None
+    if kgram_index is not None and len(prefix) < KGRAM_SIZE:
+        # terms holding the k-grams of the pattern, or of the pattern cut before one of its last letters
+        cut_patterns = [head[:-cut] for cut in range(1, min(len(tail), STEM_CUT_CHARS) + 1)]
+        lists = [kgram_index.candidates(cut_pattern) for cut_pattern in [pattern] + cut_patterns]
+        if all(ordinals is not None for ordinals in lists):
+            candidates = lists[0] if len(lists) == 1 else np.unique(np.concatenate(lists))
+    terms = term_dictionary.prefix_items(prefix) if candidates is None else term_dictionary.terms_at(candidates.tolist())
+    for term, offset in terms:
+        if matches(term):
+            yield term, offset
+
+# the terms of {term: df} a pattern expands to: at most WILDCARD_MAX_TERMS terms with the highest df,
+# and past the first one, no more than WILDCARD_MAX_POSTINGS postings in total
+def keep_terms(dfs):
+    kept = []
+    total_df = 0
+    for term in sorted(dfs, key=lambda term: (-dfs[term], term)):
+        if len(kept) == WILDCARD_MAX_TERMS:
+            break
+        if kept and total_df + dfs[term] > WILDCARD_MAX_POSTINGS:
+            continue
+        kept.append(term)
+        total_df += dfs[term]
+    return kept
+
+# returns {term: [(segment, postings offset)]} for the terms of every segment pattern expands to (see keep_terms)
+def expand(segments, pattern, stem):
+    matches = {}
+    dfs = {}
+    for segment in segments:
+        for term, offset in expand_dictionary(segment.term_dictionary, segment.kgram_index, pattern, stem):
+            matches.setdefault(term, []).append((segment, offset))
+            dfs[term] = dfs.get(term, 0) + TERM_HEADER.unpack_from(segment.index_map, offset)[0]
+    return {term: matches[term] for term in keep_terms(dfs)}